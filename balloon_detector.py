@@ -0,0 +1,181 @@
+import re
+import math
+import statistics
+from pypdf import PdfReader
+
+# Fallback raster con trasformata di Hough (opzionale: richiede opencv-python e numpy)
+try:
+    import cv2
+    import numpy as np
+    HOUGH_AVAILABLE = True
+except ImportError:
+    HOUGH_AVAILABLE = False
+
+# Lettura del numero dentro i cerchi trovati sul raster
+try:
+    import pytesseract
+    OCR_AVAILABLE = True
+except ImportError:
+    OCR_AVAILABLE = False
+
+# Numero di posizione dentro il palloncino: "7", "12", "105", "12A"
+BALLOON_LABEL = re.compile(r'^\d{1,3}[A-Z]?$')
+MIN_RADIUS_PT = 3   # ~1 mm
+MAX_RADIUS_PT = 30  # ~10 mm
+MIN_CONFIDENCE = 0.5
+PAINT_OPS = {b'S', b's', b'f', b'F', b'f*', b'B', b'B*', b'b', b'b*', b'n'}
+
+
+class Balloon:
+    """ Palloncino di posizione in punti PDF (origine in basso a sinistra) """
+    __slots__ = ('x', 'y', 'radius', 'number', 'confidence')
+
+    def __init__(self, x, y, radius, number, confidence):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.number = number
+        self.confidence = confidence
+
+    def __repr__(self):
+        return f"Balloon({self.number!r}, x={self.x:.1f}, y={self.y:.1f}, r={self.radius:.1f}, conf={self.confidence})"
+
+
+class BalloonDetector:
+    """ Trova i palloncini di posizione (cerchio con un numero dentro) invece di prendere per
+        componente ogni testo breve del disegno: quote, filettature e cartiglio restano fuori.
+        Percorso vettoriale: cerchi dai path del content stream + testi dentro il cerchio.
+        Percorso raster (disegni scansionati): cerchi di Hough + numero letto con Tesseract.
+    """
+
+    def detect_vector(self, pdf_path, page_index=0):
+        circles, texts = self._vector_shapes(PdfReader(pdf_path).pages[page_index])
+        return self._associate(circles, texts)
+
+    def detect_raster(self, image, px_per_pt, page_height):
+        """ image: QImage Grayscale8 della pagina renderizzata a px_per_pt pixel per punto """
+        if not HOUGH_AVAILABLE or not OCR_AVAILABLE:
+            return []
+        rows = np.frombuffer(bytes(image.constBits()), np.uint8).reshape(image.height(), image.bytesPerLine())
+        gray = np.ascontiguousarray(rows[:, :image.width()])
+        blurred = cv2.medianBlur(gray, 3)
+        found = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1.2,
+                                 minDist=2 * MIN_RADIUS_PT * px_per_pt, param1=120, param2=32,
+                                 minRadius=int(MIN_RADIUS_PT * px_per_pt), maxRadius=int(MAX_RADIUS_PT * px_per_pt))
+        if found is None:
+            return []
+
+        circles, texts = [], []
+        for cx, cy, r in found[0]:
+            # Quadrato inscritto: il numero senza il bordo del cerchio
+            half = int(r * 0.7)
+            crop = gray[max(0, int(cy) - half):int(cy) + half, max(0, int(cx) - half):int(cx) + half]
+            if crop.size == 0:
+                continue
+            data = pytesseract.image_to_data(crop, config="--psm 7 -c tessedit_char_whitelist=0123456789ABCDEFGH",
+                                             output_type=pytesseract.Output.DICT)
+            words = [(t.strip(), float(c)) for t, c in zip(data['text'], data['conf']) if t.strip()]
+            x_pt, y_pt, r_pt = cx / px_per_pt, page_height - cy / px_per_pt, r / px_per_pt
+            circles.append((x_pt, y_pt, r_pt))
+            if words:
+                text, conf = max(words, key=lambda w: w[1])
+                texts.append((text, x_pt, y_pt, conf / 100))
+        return self._associate(circles, texts)
+
+    def _vector_shapes(self, page):
+        circles, texts = [], []
+        subpaths, current = [], []
+
+        def transform(cm, x, y):
+            return (cm[0] * x + cm[2] * y + cm[4], cm[1] * x + cm[3] * y + cm[5])
+
+        def before(op, args, cm, tm):
+            nonlocal current
+            if op == b'm':
+                if current:
+                    subpaths.append(current)
+                current = [('m', transform(cm, args[0], args[1]))]
+            elif op == b'l' and current:
+                current.append(('l', transform(cm, args[0], args[1])))
+            elif op in (b'c', b'v', b'y') and current:
+                current.append(('c', transform(cm, args[-2], args[-1])))
+            elif op in PAINT_OPS:
+                if current:
+                    subpaths.append(current)
+                current = []
+                for subpath in subpaths:
+                    circle = self._fit_circle(subpath)
+                    if circle:
+                        circles.append(circle)
+                subpaths.clear()
+
+        def on_text(text, cm, tm, font_dict, font_size):
+            text = text.strip()
+            if not text:
+                return
+            x, y = transform(cm, tm[4], tm[5])
+            # Altezza effettiva del carattere: corpo del font scalato da Tm e CTM
+            size = font_size * math.hypot(tm[2], tm[3]) * math.hypot(cm[2], cm[3])
+            # Centro stimato della scritta: larghezza media ~0.6 em, altezza maiuscole ~0.7 em
+            texts.append((text, x + 0.3 * size * len(text), y + 0.35 * size, 1.0))
+
+        page.extract_text(visitor_operand_before=before, visitor_text=on_text)
+        return circles, texts
+
+    @staticmethod
+    def _fit_circle(subpath):
+        """ (cx, cy, r) se il sottopercorso chiuso approssima un cerchio, altrimenti None """
+        curves = sum(1 for kind, _ in subpath if kind == 'c')
+        lines = sum(1 for kind, _ in subpath if kind == 'l')
+        # Bezier (4 o 8 archi) o poligonale fitta, come esportano i CAD
+        if curves < 4 and lines < 12:
+            return None
+        points = [p for _, p in subpath]
+        xs, ys = [p[0] for p in points], [p[1] for p in points]
+        width, height = max(xs) - min(xs), max(ys) - min(ys)
+        if not width or abs(width - height) > 0.1 * max(width, height):
+            return None
+
+        cx, cy = (max(xs) + min(xs)) / 2, (max(ys) + min(ys)) / 2
+        distances = [math.hypot(x - cx, y - cy) for x, y in points]
+        r = sum(distances) / len(distances)
+        if not (MIN_RADIUS_PT <= r <= MAX_RADIUS_PT):
+            return None
+        if statistics.pstdev(distances) > 0.08 * r or math.dist(points[0], points[-1]) > 0.1 * r:
+            return None
+        return cx, cy, r
+
+    @staticmethod
+    def _associate(circles, texts):
+        """ Un numero per cerchio (il più vicino al centro), ogni testo usato una volta sola.
+            Confidenza: centratura del testo, forma dell'etichetta e raggio coerente con gli
+            altri palloncini del foglio (un disegno usa una sola misura di palloncino).
+        """
+        if not circles:
+            return []
+        median_r = statistics.median(r for _, _, r in circles)
+
+        candidates = []
+        for ci, (cx, cy, r) in enumerate(circles):
+            for ti, (text, tx, ty, read_conf) in enumerate(texts):
+                label = text.replace(' ', '').upper()
+                dist = math.hypot(tx - cx, ty - cy)
+                if dist <= r and BALLOON_LABEL.match(label):
+                    candidates.append((dist / r, ci, ti, label, read_conf))
+
+        balloons, used_circles, used_texts = [], set(), set()
+        for rel_dist, ci, ti, label, read_conf in sorted(candidates):
+            if ci in used_circles or ti in used_texts:
+                continue
+            used_circles.add(ci)
+            used_texts.add(ti)
+            cx, cy, r = circles[ci]
+            centering = 1 - rel_dist
+            shape = 1.0 if label.isdigit() else 0.8
+            consistency = 1 - min(1.0, abs(r - median_r) / median_r)
+            confidence = round((0.5 * centering + 0.2 * shape + 0.3 * consistency) * read_conf, 2)
+            if confidence >= MIN_CONFIDENCE:
+                balloons.append(Balloon(cx, cy, r, label, confidence))
+
+        balloons.sort(key=lambda b: (len(b.number), b.number))
+        return balloons
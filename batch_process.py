@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from render_cache import RenderCache, CACHE_DIRNAME
+
+# Elaborazione dei disegni senza interfaccia: cerca i PDF in un albero di cartelle e li passa
+# a OcrEngine.process_drawing in parallelo, un processo per worker (come il watcher della GUI).
+# Su stdout una riga JSON per evento (start, skip, done, summary), pensata per log e script;
+# i messaggi dell'elaborazione ([OCR] ...) vanno su stderr.
+# Uso: python batch_process.py CARTELLA [--output DIR] [--jobs N] [--force] [--png]
+
+RETRIES = 1 # nuovi tentativi per i disegni il cui processo è terminato in modo anomalo
+
+_engine = None
+
+
+def _process_one(pdf_path, output_dir, keep_png):
+    """ Eseguito nel worker: un OcrEngine (e una QApplication offscreen) per processo, riusato """
+    global _engine
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        if _engine is None:
+            from ocr_engine import OcrEngine
+            _engine = OcrEngine(keep_png=keep_png)
+        success = _engine.process_drawing(pdf_path, output_dir)
+    return {'success': success, 'elapsed': time.perf_counter() - start, 'stages': dict(_engine.timings)}
+
+
+def find_pdfs(root):
+    """ PDF dell'albero in ordine stabile, saltando le cartelle cache """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != CACHE_DIRNAME)
+        found.extend(os.path.join(dirpath, name) for name in sorted(filenames) if name.lower().endswith('.pdf'))
+    return found
+
+
+def emit(event, **fields):
+    print(json.dumps(dict(event=event, **fields), ensure_ascii=False), flush=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Elabora in batch i disegni PDF (render, tasselli, coordinate, distinta).")
+    parser.add_argument('source', help="cartella (anche con sottocartelle) dei PDF")
+    parser.add_argument('--output', help="cartella di output unica; di default ogni PDF usa la propria cartella")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="processi in parallelo (default: numero di CPU)")
+    parser.add_argument('--force', action='store_true', help="rielabora anche i PDF invariati dall'ultima elaborazione")
+    parser.add_argument('--png', action='store_true', help="salva anche il PNG a piena pagina (di default la mappa usa il render vettoriale)")
+    return parser.parse_args(argv)
+
+
+def plan(pdfs, output, force):
+    """ (da elaborare [(pdf, output_dir, hash, cache)], saltati [(pdf, motivo)]) """
+    caches, todo, skipped, seen = {}, [], [], {}
+    for pdf_path in pdfs:
+        output_dir = output or os.path.dirname(pdf_path)
+        product_id = os.path.splitext(os.path.basename(pdf_path))[0]
+        # Nella stessa cartella di output il nome del PDF è l'id del prodotto: deve essere unico
+        key = (os.path.normcase(os.path.abspath(output_dir)), product_id)
+        if key in seen:
+            skipped.append((pdf_path, f"stesso nome di {seen[key]}"))
+            continue
+        seen[key] = pdf_path
+        cache = caches.get(key[0])
+        if cache is None:
+            cache = caches[key[0]] = RenderCache(output_dir)
+        try:
+            pdf_hash = cache.content_hash(pdf_path)
+        except OSError as e:
+            skipped.append((pdf_path, f"non leggibile: {e}"))
+            continue
+        if not force and cache.is_processed(pdf_path, pdf_hash):
+            skipped.append((pdf_path, "invariato"))
+            continue
+        todo.append((pdf_path, output_dir, pdf_hash, cache))
+    # Hash in cache su disco: i worker non rileggono i PDF per ricalcolarli
+    for cache in caches.values():
+        cache.save()
+    return todo, skipped
+
+
+def run(todo, jobs, keep_png):
+    """ Elabora i PDF e ritorna (riusciti, falliti, secondi per fase sommati) """
+    totals, ok, failed = {}, 0, 0
+    attempts = {}
+    pending = list(todo)
+    done = 0
+    # spawn come nel watcher: ogni worker inizializza Qt da zero
+    context = multiprocessing.get_context('spawn')
+    try:
+        while pending:
+            with ProcessPoolExecutor(max_workers=max(1, jobs), mp_context=context) as pool:
+                futures = {pool.submit(_process_one, pdf_path, output_dir, keep_png): (pdf_path, output_dir, pdf_hash, cache)
+                           for pdf_path, output_dir, pdf_hash, cache in pending}
+                pending = []
+                for future in as_completed(futures):
+                    pdf_path, output_dir, pdf_hash, cache = futures[future]
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        # Un worker è morto (crash nativo, memoria): il pool va ricreato
+                        attempts[pdf_path] = attempts.get(pdf_path, 0) + 1
+                        if attempts[pdf_path] <= RETRIES:
+                            pending.append((pdf_path, output_dir, pdf_hash, cache))
+                            continue
+                        result = {'success': False, 'elapsed': None, 'stages': {}, 'error': "processo terminato"}
+                    except Exception as e:
+                        result = {'success': False, 'elapsed': None, 'stages': {}, 'error': str(e)}
+
+                    done += 1
+                    if result['success']:
+                        ok += 1
+                        cache.mark_processed(pdf_path, pdf_hash)
+                    else:
+                        failed += 1
+                    for stage, seconds in result['stages'].items():
+                        totals[stage] = totals.get(stage, 0.0) + seconds
+                    emit('done', file=pdf_path, status='ok' if result['success'] else 'error',
+                         error=result.get('error'), done=done, total=len(todo),
+                         elapsed=None if result['elapsed'] is None else round(result['elapsed'], 3),
+                         stages={stage: round(seconds, 3) for stage, seconds in result['stages'].items()})
+    finally:
+        # Un solo salvataggio per manifest, anche se il batch viene interrotto
+        for cache in {id(entry[3]): entry[3] for entry in todo}.values():
+            cache.save()
+    return ok, failed, totals
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    if not os.path.isdir(args.source):
+        emit('error', message=f"cartella non trovata: {args.source}")
+        return 2
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    todo, skipped = plan(find_pdfs(args.source), args.output, args.force)
+    emit('start', total=len(todo), skipped=len(skipped), jobs=args.jobs)
+    for pdf_path, reason in skipped:
+        emit('skip', file=pdf_path, reason=reason)
+
+    ok, failed, totals = run(todo, args.jobs, args.png)
+    emit('summary', ok=ok, failed=failed, skipped=len(skipped), elapsed=round(time.perf_counter() - start, 3),
+         stages={stage: round(seconds, 3) for stage, seconds in sorted(totals.items(), key=lambda e: -e[1])})
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import glob
+import time
+import tempfile
+from PySide6.QtCore import QMarginsF, QPointF, QRectF
+from PySide6.QtGui import QPdfWriter, QPageSize, QPageLayout, QPainter, QFont, QPen
+from ocr_engine import OcrEngine
+
+# Accuratezza della lettura della distinta base rispetto ai data.json fatti a mano.
+# I disegni di esempio sono scansioni senza testo vettoriale: oltre a quelli (percorso OCR,
+# se Tesseract è installato) si genera un foglio vettoriale con la distinta del riferimento
+# stampata come tabella, in mezzo a quote e cartiglio, e si confronta quanto viene riletto.
+# Uso: python bench_bom.py [cartella_disegni]
+
+REFERENCE = "Valvola VA50"
+
+
+def normalize(text):
+    return ' '.join(text.upper().split())
+
+
+def score(rows, reference):
+    """ (posizioni trovate, codici esatti, descrizioni esatte) sulle righe con un codice vero """
+    coded = {pos: entry for pos, entry in reference.items() if entry[0] not in ('', '-')}
+    found = sum(1 for pos in coded if pos in rows)
+    codes = sum(1 for pos, entry in coded.items() if pos in rows and normalize(rows[pos][0]) == normalize(entry[0]))
+    descs = sum(1 for pos, entry in coded.items() if pos in rows and normalize(rows[pos][1]) == normalize(entry[1]))
+    return found, codes, descs, len(coded)
+
+
+def write_sheet(pdf_path, reference):
+    """ A3 orizzontale: qualche quota sparsa, la distinta sopra il cartiglio (intestazione in
+        basso, posizioni crescenti verso l'alto come da UNI/ISO), righe di descrizione lunghe a capo.
+    """
+    writer = QPdfWriter(pdf_path)
+    writer.setPageLayout(QPageLayout(QPageSize(QPageSize.A3), QPageLayout.Landscape, QMarginsF(0, 0, 0, 0)))
+    writer.setResolution(72)
+    painter = QPainter(writer)
+    painter.setPen(QPen())
+    painter.setFont(QFont("Helvetica", 7))
+
+    for i, label in enumerate(("Ø 50", "M5x10", "120", "3.2", "R 5", "45°")):
+        painter.drawText(QPointF(80 + 60 * i, 120 + 35 * (i % 3)), label)
+    painter.drawRect(QRectF(60, 60, 600, 500))
+
+    col_pos, col_code, col_desc, col_qty, right = 860, 890, 950, 1100, 1130
+    pitch = 10
+    y = 760 # intestazione appena sopra il cartiglio
+    painter.drawText(QPointF(col_pos + 2, y), "POS.")
+    painter.drawText(QPointF(col_code + 2, y), "CODICE")
+    painter.drawText(QPointF(col_desc + 2, y), "DESCRIZIONE")
+    painter.drawText(QPointF(col_qty + 2, y), "Q.TA")
+    for pos, (code, desc) in sorted(reference.items(), key=lambda e: int(e[0])):
+        words, lines = desc.split(), [""]
+        for word in words:
+            # Colonna stretta: le descrizioni lunghe vanno su più righe
+            if len(lines[-1]) + len(word) > 14 and lines[-1]:
+                lines.append(word)
+            else:
+                lines[-1] = f"{lines[-1]} {word}".strip()
+        y -= pitch * len(lines)
+        painter.drawLine(QPointF(col_pos, y + 2 + pitch * len(lines)), QPointF(right, y + 2 + pitch * len(lines)))
+        painter.drawText(QPointF(col_pos + 2, y), pos)
+        painter.drawText(QPointF(col_code + 2, y), code)
+        for i, line in enumerate(lines):
+            painter.drawText(QPointF(col_desc + 2, y + pitch * i), line)
+        painter.drawText(QPointF(col_qty + 2, y), "1")
+
+    painter.drawText(QPointF(870, 790), "DISEGNATO")
+    painter.drawText(QPointF(950, 790), "VALVOLA VA50")
+    painter.drawText(QPointF(870, 810), "SCALA 1:1")
+    painter.end()
+
+
+def run(engine, pdf_path, label, reference):
+    start = time.perf_counter()
+    rows, areas = engine.extract_bom(pdf_path, 0, engine.page_height(pdf_path))
+    elapsed = time.perf_counter() - start
+    if reference:
+        found, codes, descs, total = score(rows, reference)
+        accuracy = f"posizioni {found}/{total}, codici {codes}/{total}, descrizioni {descs}/{total}"
+    else:
+        accuracy = "nessun riferimento"
+    print(f"{label[:30]:<32}{elapsed:>8.2f}s{len(rows):>7}   {accuracy}")
+    return rows
+
+
+if __name__ == "__main__":
+    drawings_dir = sys.argv[1] if len(sys.argv) > 1 else "Disegni"
+    engine = OcrEngine()
+    engine._ensure_app()
+    with open(os.path.join(drawings_dir, f"{REFERENCE}.data.json"), 'r', encoding='utf-8') as f:
+        reference = json.load(f)
+
+    print(f"{'disegno':<32}{'tempo':>9}{'righe':>7}   accuratezza")
+    for pdf_path in sorted(glob.glob(os.path.join(drawings_dir, "*.pdf"))):
+        product_id = os.path.splitext(os.path.basename(pdf_path))[0]
+        data_path = os.path.join(drawings_dir, f"{product_id}.data.json")
+        own = None
+        if os.path.exists(data_path):
+            with open(data_path, 'r', encoding='utf-8') as f:
+                own = json.load(f)
+        run(engine, pdf_path, product_id, own)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sheet = os.path.join(tmp, f"{REFERENCE} (distinta vettoriale).pdf")
+        write_sheet(sheet, reference)
+        rows = run(engine, sheet, f"{REFERENCE} (foglio sintetico)", reference)
+        for pos, (code, desc) in sorted(reference.items(), key=lambda e: int(e[0])):
+            if rows.get(pos) != [code, desc]:
+                print(f"   pos {pos}: atteso {[code, desc]}, letto {rows.get(pos)}")
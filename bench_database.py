@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import random
+import tempfile
+from sqlalchemy import text
+from database import DatabaseManager
+
+# Confronto latenze lista/inserimento: SQLite di default senza indici contro SQLITE_PROFILE.
+# Uso: python bench_database.py [numero_interventi]
+
+PRODUCTS = ["Valvola VA50", "VA30_116A_AGO", "VA50_500"]
+
+
+def populate(db, n):
+    """ Riempie il database con n interventi (circa 3 componenti ciascuno) in un'unica transazione """
+    base = time.time() - 5 * 365 * 86400
+    with db.engine.begin() as conn:
+        for i in range(n):
+            ts = time.strftime('%Y-%m-%d %H:%M:%S.000000', time.localtime(base + random.randint(0, 5 * 365 * 86400)))
+            result = conn.execute(
+                text("INSERT INTO interventi (prodotto, data, ore_lavoro, note_tecniche, descrizione) VALUES (:p, :d, :o, '', :desc)"),
+                {'p': random.choice(PRODUCTS), 'd': ts, 'o': 1.5, 'desc': f"Intervento di prova {i}"}
+            )
+            inv_id = result.lastrowid
+            conn.execute(
+                text("INSERT INTO componenti_intervento (intervento_id, numero_componente, codice_componente, quantita, sostituito) VALUES (:i, :n, '', 1.0, 1)"),
+                [{'i': inv_id, 'n': random.randint(1, 40)} for _ in range(3)]
+            )
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def run(label, profile, indexes, n):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    db = DatabaseManager(path, profile=profile)
+    if not indexes:
+        with db.engine.begin() as conn:
+            conn.execute(text("DROP INDEX ix_interventi_prodotto_data"))
+            conn.execute(text("DROP INDEX ix_componenti_intervento_intervento_id"))
+    populate(db, n)
+    deep_cursor = cursor_at(db, 50)
+
+    results = {
+        'prima pagina': timed(lambda: db.get_interventi_page(PRODUCTS[0]), 20),
+        'pagina 50': timed(lambda: db.get_interventi_page(PRODUCTS[0], cursor=deep_cursor), 20),
+        'conteggio': timed(lambda: db.count_interventi(PRODUCTS[0]), 20),
+        'dettaglio': timed(lambda: db.get_intervento(n // 2), 20),
+        'inserimento': timed(lambda: db.add_intervento(PRODUCTS[0], 1.0, "", "bench", [{'numero': 1}, {'numero': 2}]), 50),
+    }
+    print(f"{label:<28}" + "".join(f"{v:>14.2f}" for v in results.values()))
+    return results
+
+
+def cursor_at(db, pages):
+    cursor = None
+    for _ in range(pages):
+        _, cursor = db.get_interventi_page(PRODUCTS[0], cursor)
+    return cursor
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    print(f"Benchmark DatabaseManager su {n} interventi (mediana in ms)")
+    print(f"{'':<28}" + "".join(f"{h:>14}" for h in ('prima pagina', 'pagina 50', 'conteggio', 'dettaglio', 'inserimento')))
+    run("default SQLite, no indici", {}, False, n)
+    run("SQLITE_PROFILE + indici", None, True, n)
@@ -0,0 +1,75 @@
+import os
+import sys
+import time
+import random
+import tempfile
+from PySide6.QtWidgets import QApplication
+from PySide6.QtGui import QImage, QColor
+
+# Fotogrammi al secondo della mappa durante il pan con molti palloncini, a vari livelli di
+# zoom (sotto la soglia delle etichette e sopra). Ogni fotogramma sposta le barre di
+# scorrimento e ridisegna il viewport in modo sincrono, come durante un trascinamento.
+# Uso: QT_QPA_PLATFORM=offscreen python bench_map_viewer.py [punti] [fotogrammi]
+
+PAGE_SIZE = (3564, 2520) # A3 orizzontale a RENDER_SCALE
+VIEW_SIZE = (1280, 800)
+ZOOMS = ('adatta', 0.25, 0.5, 1.0, 2.0)
+
+
+def build_view(count):
+    from gui.map_viewer import ProductMapView
+    view = ProductMapView()
+    view.resize(*VIEW_SIZE)
+    view.show()
+
+    image = QImage(*PAGE_SIZE, QImage.Format_RGB32)
+    image.fill(QColor(250, 250, 250))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench_map.png")
+        image.save(path)
+        view.load_image(path)
+
+    random.seed(7)
+    for n in range(1, count + 1):
+        view.add_point(random.uniform(40, PAGE_SIZE[0] - 40), random.uniform(40, PAGE_SIZE[1] - 40),
+                       str(n), f"[{100000 + n}] Componente {n}")
+    return view
+
+
+def measure(app, view, zoom, frames):
+    # Lascia scattare il reset_view ritardato del primo resize prima di impostare lo zoom
+    for _ in range(8):
+        time.sleep(0.05)
+        app.processEvents()
+    view.reset_view()
+    if zoom != 'adatta':
+        view.resetTransform()
+        view.scale(zoom, zoom)
+
+    h_bar, v_bar = view.horizontalScrollBar(), view.verticalScrollBar()
+    step = 24
+    start = time.perf_counter()
+    for i in range(frames):
+        # Avanti e indietro lungo la diagonale, per restare dentro la scena
+        direction = 1 if (i // 40) % 2 == 0 else -1
+        h_bar.setValue(h_bar.value() + direction * step)
+        v_bar.setValue(v_bar.value() + direction * step // 2)
+        view.viewport().repaint()
+    elapsed = time.perf_counter() - start
+    return frames / elapsed, view.transform().m11()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    app = QApplication.instance() or QApplication(sys.argv)
+    view = build_view(count)
+
+    print(f"{count} punti, viewport {VIEW_SIZE[0]}x{VIEW_SIZE[1]}, {frames} fotogrammi per zoom")
+    print(f"{'zoom':<10}{'scala':>8}{'fps':>10}")
+    for calibration in (False, True):
+        view.set_calibration_mode(calibration)
+        print("calibrazione" if calibration else "operazione")
+        for zoom in ZOOMS:
+            fps, scale = measure(app, view, zoom, frames)
+            print(f"{str(zoom):<10}{scale:>8.2f}{fps:>10.1f}")
@@ -0,0 +1,70 @@
+import os
+import sys
+import json
+import glob
+import time
+from ocr_engine import OcrEngine, OCR_AVAILABLE, RENDER_SCALE
+
+# Tempi e accuratezza dell'estrazione posizioni sui disegni di esempio: percorso vettoriale
+# contro fallback OCR raster. Dove esistono coords/data fatti a mano (es. "Valvola VA50")
+# si misura quanti codici vengono ritrovati e quanti cadono vicino al punto calibrato.
+# Uso: python bench_ocr.py [cartella_disegni] [dpi ...]
+
+MATCH_RADIUS = 60 # pixel nello spazio RENDER_SCALE (~7 mm sul foglio)
+
+
+def load_reference(drawings_dir, product_id):
+    coords_path = os.path.join(drawings_dir, f"{product_id}.coords.json")
+    data_path = os.path.join(drawings_dir, f"{product_id}.data.json")
+    if not (os.path.exists(coords_path) and os.path.exists(data_path)):
+        return None
+    with open(coords_path, 'r', encoding='utf-8') as f:
+        coords = {str(c[2]): (c[0], c[1]) for c in json.load(f)}
+    with open(data_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # Solo le posizioni con un codice vero (non i segnaposto "-")
+    return {pos: (coords[pos], entry[0].replace(' ', '').upper()) for pos, entry in data.items()
+            if pos in coords and entry[0] not in ('', '-')}
+
+
+def score(points, data_map, reference):
+    found = [(x, y, data_map[str(num)][0].replace(' ', '').upper()) for x, y, num in points]
+    codes = {code for _, _, code in found}
+    code_hits = sum(1 for _, code in reference.values() if code in codes)
+    near_hits = sum(1 for (rx, ry), code in reference.values()
+                    if any(c == code and abs(x - rx) <= MATCH_RADIUS and abs(y - ry) <= MATCH_RADIUS for x, y, c in found))
+    return code_hits, near_hits
+
+
+def run(engine, pdf_path, label, extract):
+    start = time.perf_counter()
+    points, data_map = extract()
+    elapsed = time.perf_counter() - start
+
+    product_id = os.path.splitext(os.path.basename(pdf_path))[0]
+    reference = load_reference(os.path.dirname(pdf_path), product_id)
+    if reference:
+        code_hits, near_hits = score(points, data_map, reference)
+        accuracy = f"codici {code_hits}/{len(reference)}, vicini al punto {near_hits}/{len(reference)}"
+    else:
+        accuracy = "nessun riferimento"
+    print(f"{product_id[:24]:<26}{label:<16}{elapsed:>9.2f}s{len(points):>8}   {accuracy}")
+
+
+if __name__ == "__main__":
+    drawings_dir = sys.argv[1] if len(sys.argv) > 1 else "Disegni"
+    dpis = [int(d) for d in sys.argv[2:]] or [200, 300]
+    engine = OcrEngine()
+
+    print(f"{'disegno':<26}{'metodo':<16}{'tempo':>10}{'punti':>8}   accuratezza")
+    for pdf_path in sorted(glob.glob(os.path.join(drawings_dir, "*.pdf"))):
+        height = engine.page_height(pdf_path)
+        if height is None:
+            continue
+        run(engine, pdf_path, "vettoriale", lambda: engine.extract_vector_coords(pdf_path, height, RENDER_SCALE))
+        if not OCR_AVAILABLE:
+            continue
+        for dpi in dpis:
+            run(engine, pdf_path, f"OCR {dpi} dpi", lambda: engine.extract_ocr_image(pdf_path, dpi=dpi, scale_factor=RENDER_SCALE))
+    if not OCR_AVAILABLE:
+        print("pytesseract/Pillow non installati: misurato solo il percorso vettoriale")
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import statistics
+import subprocess
+
+# Tempi di avvio dell'applicazione, fase per fase, ciascuno in un processo nuovo (import a
+# freddo come all'avvio vero). Segue la sequenza di main.py senza il watcher, che potrebbe
+# accodare l'OCR dei disegni non ancora elaborati. Database e disegni sono copie in una
+# cartella temporanea: i percorsi di default dell'applicazione puntano lì, non al repository.
+# Uso: QT_QPA_PLATFORM=offscreen python bench_startup.py [ripetizioni]
+
+STAGES = (
+    ('qt', "QApplication"),
+    ('import', "import gui"),
+    ('finestra', "finestra disegnata"),
+    ('cronologia', "cronologia caricata"),
+    ('archivio', "anteprime archivio"),
+)
+# Moduli che non devono servire per mostrare la finestra
+HEAVY_MODULES = ('pypdf', 'PySide6.QtPdf', 'pytesseract', 'cv2', 'sqlalchemy', 'ocr_engine')
+TIMEOUT = 30
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_until(app, condition):
+    deadline = time.perf_counter() + TIMEOUT
+    while not condition() and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def child():
+    start = time.perf_counter()
+    stamps = {}
+
+    from PySide6.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+    stamps['qt'] = time.perf_counter() - start
+
+    from gui import MainWindow
+    stamps['import'] = time.perf_counter() - start
+
+    window = MainWindow()
+    window.show()
+    app.processEvents()
+    stamps['finestra'] = time.perf_counter() - start
+    shown_at = time.time()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    window.start_background_loading()
+    wait_until(app, lambda: window.db is not None)
+    app.processEvents()
+    stamps['cronologia'] = time.perf_counter() - start
+
+    window.tabs.setCurrentIndex(1)
+    app.processEvents()
+    wait_until(app, lambda: not window.archive_model._loading)
+    app.processEvents()
+    stamps['archivio'] = time.perf_counter() - start
+
+    print(json.dumps({'stamps': stamps, 'shown_at': shown_at, 'heavy': loaded}), flush=True)
+    # Niente chiusura ordinata: non fa parte dell'avvio
+    os._exit(0)
+
+
+def prepare_workdir(work_dir):
+    """ Copia database e disegni nei percorsi relativi che usano DatabaseManager e get_registry """
+    db_path = os.path.join(REPO_DIR, "gestione_assistenze.db")
+    if os.path.exists(db_path):
+        shutil.copy(db_path, work_dir)
+    drawings = os.path.join(REPO_DIR, "Disegni")
+    if os.path.isdir(drawings):
+        shutil.copytree(drawings, os.path.join(work_dir, "disegni"))
+
+
+def run_once(work_dir):
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    spawned_at = time.time()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=work_dir,
+                            capture_output=True, text=True, env=env, timeout=TIMEOUT * 3)
+    lines = [line for line in result.stdout.splitlines() if line.startswith('{')]
+    if not lines:
+        raise RuntimeError(f"avvio fallito (codice {result.returncode}):\n{result.stdout}\n{result.stderr}")
+    report = json.loads(lines[-1])
+    report['stamps']['processo'] = report['shown_at'] - spawned_at
+    return report
+
+
+if __name__ == "__main__":
+    if '--child' in sys.argv:
+        child()
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_workdir(work_dir)
+        reports = [run_once(work_dir) for _ in range(runs)]
+
+    print(f"{runs} avvii, mediana in ms dall'inizio del processo Python")
+    for key, label in STAGES:
+        values = [r['stamps'][key] * 1000 for r in reports]
+        print(f"  {label:<24}{statistics.median(values):>8.0f}   (min {min(values):.0f}, max {max(values):.0f})")
+    spawn = [r['stamps']['processo'] * 1000 for r in reports]
+    print(f"  {'finestra dal lancio':<24}{statistics.median(spawn):>8.0f}   (interprete compreso)")
+    print(f"Moduli pesanti già caricati alla comparsa della finestra: {', '.join(reports[0]['heavy']) or 'nessuno'}")
@@ -0,0 +1,152 @@
+import re
+import math
+import statistics
+from pypdf import PdfReader
+
+# Intestazioni riconosciute (maiuscole, senza ":" finale) per ruolo di colonna
+HEADER_KEYWORDS = {
+    'pos': {'POS', 'POS.', 'POSIZIONE', 'ITEM', 'RIF', 'RIF.', 'N.', 'N°', 'NR', 'NR.'},
+    'code': {'CODICE', 'COD.', 'CODE', 'PART', 'PART NO', 'PART NO.', 'P/N', 'ARTICOLO', 'ART.'},
+    'desc': {'DESCRIZIONE', 'DESCR.', 'DESCRIPTION', 'DENOMINAZIONE', 'NAME', 'NOME'},
+    'qty': {'Q.TA', "Q.TA'", 'QTA', 'QTY', 'QUANTITA', 'QUANTITÀ', 'PZ', 'N.PZ'},
+}
+POS_CELL = re.compile(r'^\d{1,3}[A-Z]?$')
+MAX_EMPTY_LINES = 2 # righe non valide consecutive prima di considerare finita la tabella
+
+
+class BomExtractor:
+    """ Ricostruisce la distinta base (pos / codice / descrizione) stampata sul foglio a partire
+        dalle posizioni dei testi: trova la riga di intestazione dalle parole chiave, ne ricava
+        le colonne e legge le righe sotto (o sopra, per le distinte numerate dal basso sopra il
+        cartiglio). Le descrizioni su più righe vengono unite.
+    """
+
+    def extract(self, pdf_path, page_index=0):
+        """ Ritorna ({pos: [codice, descrizione]}, [aree delle tabelle in punti PDF (x0, y0, x1, y1)]) """
+        return self.parse(self.text_runs(pdf_path, page_index))
+
+    def parse(self, runs):
+        """ runs: [(testo, x, y, altezza, larghezza)] in punti PDF, dal PDF o da OCR (vedi ocr_runs) """
+        if not runs:
+            return {}, []
+        lines = self._group_lines(runs)
+
+        rows, areas = {}, []
+        for index, line in enumerate(lines):
+            columns = self._header_columns(line)
+            if not columns:
+                continue
+            # Prima sotto l'intestazione (caso comune), poi sopra
+            for candidates, upward in ((lines[index + 1:], False), (lines[:index][::-1], True)):
+                table, used = self._read_rows(candidates, columns, upward)
+                if len(table) >= 2:
+                    rows.update(table)
+                    cells = line + [run for l in used for run in l]
+                    areas.append((min(r[1] for r in cells), min(r[2] for r in cells),
+                                  max(r[1] + r[4] for r in cells), max(r[2] + r[3] for r in cells)))
+                    break
+        return rows, areas
+
+    @staticmethod
+    def text_runs(pdf_path, page_index=0):
+        """ [(testo, x, y, altezza, larghezza stimata)] con x, y sulla linea di base, in punti PDF """
+        page = PdfReader(pdf_path).pages[page_index]
+        runs = []
+
+        def on_text(text, cm, tm, font_dict, font_size):
+            text = ' '.join(text.split())
+            if not text:
+                return
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            size = font_size * math.hypot(tm[2], tm[3]) * math.hypot(cm[2], cm[3])
+            runs.append((text, x, y, size, 0.6 * size * len(text)))
+
+        page.extract_text(visitor_text=on_text)
+        return runs
+
+    @staticmethod
+    def ocr_runs(data, px_per_pt, page_height, min_conf=0):
+        """ Parole di pytesseract.image_to_data (Output.DICT) come testi in punti PDF """
+        runs = []
+        for text, conf, x, y, w, h in zip(data['text'], data['conf'], data['left'], data['top'],
+                                          data['width'], data['height']):
+            text = ' '.join(text.split())
+            if text and float(conf) >= min_conf:
+                runs.append((text, x / px_per_pt, page_height - (y + h) / px_per_pt, h / px_per_pt, w / px_per_pt))
+        return runs
+
+    @staticmethod
+    def _group_lines(runs):
+        """ Raggruppa i testi per linea di base, dall'alto in basso, ciascuna ordinata per x """
+        tolerance = 0.4 * statistics.median(r[3] for r in runs)
+        lines = []
+        for run in sorted(runs, key=lambda r: -r[2]):
+            if lines and abs(lines[-1][0][2] - run[2]) <= tolerance:
+                lines[-1].append(run)
+            else:
+                lines.append([run])
+        return [sorted(line, key=lambda r: r[1]) for line in lines]
+
+    @staticmethod
+    def _header_columns(line):
+        """ [(x sinistra, ruolo)] se la linea è l'intestazione di una distinta, altrimenti None """
+        columns = []
+        for text, x, _, _, _ in line:
+            label = text.upper().rstrip(':').strip()
+            for role, keywords in HEADER_KEYWORDS.items():
+                if label in keywords and role not in (r for _, r in columns):
+                    columns.append((x, role))
+        roles = {role for _, role in columns}
+        if 'pos' not in roles or not roles & {'code', 'desc'}:
+            return None
+        return sorted(columns)
+
+    @staticmethod
+    def _cells(line, columns):
+        """ Assegna ogni testo alla colonna più a destra che inizia prima di lui """
+        cells = {}
+        first_x = columns[0][0]
+        for text, x, _, size, _ in line:
+            if x < first_x - size:
+                continue
+            role = columns[0][1]
+            for col_x, col_role in columns:
+                if x >= col_x - size:
+                    role = col_role
+            cells[role] = f"{cells[role]} {text}" if role in cells else text
+        return cells
+
+    def _read_rows(self, lines, columns, upward=False):
+        """ Legge le righe allontanandosi dall'intestazione. Le descrizioni a capo stanno sempre
+            sotto la riga con la posizione: risalendo (upward) si incontrano prima di essa.
+        """
+        table, used, pending = {}, [], []
+        last_pos, last_y, pitch, misses = None, None, None, 0
+        for line in lines:
+            y = line[0][2]
+            # Una distanza molto maggiore del passo delle righe segna la fine della tabella
+            if last_y is not None and pitch and abs(y - last_y) > 2.5 * pitch:
+                break
+            cells = self._cells(line, columns)
+            pos = cells.get('pos', '').replace(' ', '').upper()
+            if POS_CELL.match(pos):
+                desc = ' '.join([cells.get('desc', '')] + [text for text, _ in pending[::-1]]).strip()
+                table[pos] = [cells.get('code', '-') or '-', desc]
+                if last_y is not None and not pending:
+                    pitch = min(pitch or abs(y - last_y), abs(y - last_y))
+                used.extend([l for _, l in pending] + [line])
+                last_pos, last_y, misses, pending = pos, y, 0, []
+            elif (last_pos or upward) and set(cells) == {'desc'}:
+                # Descrizione che prosegue sulla riga successiva
+                if upward:
+                    pending.append((cells['desc'], line))
+                else:
+                    table[last_pos][1] = f"{table[last_pos][1]} {cells['desc']}".strip()
+                    used.append(line)
+                last_y = y
+            else:
+                misses += 1
+                if misses > MAX_EMPTY_LINES or last_pos is None and misses > 1:
+                    break
+        return table, used
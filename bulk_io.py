@@ -0,0 +1,163 @@
+""" Import/export massivo degli interventi (migrazione archivio storico).
+
+    python bulk_io.py import archivio.jsonl [--db gestione_assistenze.db] [--batch-size 5000]
+    python bulk_io.py export storico.csv [--prodotto "Valvola VA50"]
+
+    Formati (scelti dall'estensione del file):
+    - .jsonl: un intervento per riga, stesse chiavi di DatabaseManager.add_intervento
+      ({"prodotto", "data", "ore", "note", "descrizione", "componenti": [...]})
+    - .csv: colonne prodotto;data;ore;descrizione;note;componenti, con "componenti"
+      come lista JSON nella cella. Accetta anche la virgola come separatore e le
+      ore con virgola decimale (export da Excel).
+"""
+import argparse
+import csv
+import datetime
+import json
+import sys
+import time
+from database import DatabaseManager
+
+CSV_FIELDS = ['prodotto', 'data', 'ore', 'descrizione', 'note', 'componenti']
+DATE_FORMATS = ('%d/%m/%Y %H:%M', '%d/%m/%Y')
+
+
+def parse_date(value):
+    if not value:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Data non riconosciuta: {value!r}")
+
+
+def parse_hours(value):
+    if value in (None, ''):
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).replace(',', '.'))
+
+
+def read_records(path):
+    """ Generatore di record normalizzati: il file non viene mai caricato per intero """
+    if path.lower().endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield normalize(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    print(f"[IMPORT] Riga {line_no} scartata: {e}", file=sys.stderr)
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            # Il separatore si deduce dall'intestazione: le celle JSON contengono virgole
+            header = f.readline()
+            f.seek(0)
+            delimiter = ';' if header.count(';') >= header.count(',') else ','
+            for line_no, row in enumerate(csv.DictReader(f, delimiter=delimiter), 2):
+                try:
+                    row['componenti'] = json.loads(row.get('componenti') or '[]')
+                    yield normalize(row)
+                except (ValueError, KeyError) as e:
+                    print(f"[IMPORT] Riga {line_no} scartata: {e}", file=sys.stderr)
+
+
+def normalize(rec):
+    if not rec.get('prodotto'):
+        raise KeyError('prodotto')
+    return {
+        'prodotto': rec['prodotto'],
+        'data': parse_date(rec.get('data')),
+        'ore': parse_hours(rec.get('ore')),
+        'note': rec.get('note') or '',
+        'descrizione': rec.get('descrizione') or '',
+        'componenti': [normalize_component(comp) for comp in rec.get('componenti') or []]
+    }
+
+
+def normalize_component(comp):
+    """ Un componente come lo salva add_intervento: 'numero' intero obbligatorio, il resto con i default """
+    if not isinstance(comp, dict):
+        raise ValueError(f"Componente non valido: {comp!r}")
+    if comp.get('numero') in (None, ''):
+        raise KeyError('numero')
+    try:
+        numero = int(str(comp['numero']).strip())
+    except ValueError:
+        raise ValueError(f"Numero componente non intero: {comp['numero']!r}") from None
+    return {
+        'numero': numero,
+        'codice': comp.get('codice') or '',
+        'descrizione': comp.get('descrizione') or '',
+        'quantita': parse_hours(comp.get('quantita', 1.0)),
+        'sostituito': bool(comp.get('sostituito', True)),
+        'note': comp.get('note') or ''
+    }
+
+
+def write_records(path, records, progress=None):
+    """ Scrive i record in streaming nel formato scelto dall'estensione; ritorna il conteggio """
+    count = 0
+    start = time.perf_counter()
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if path.lower().endswith('.jsonl'):
+            writer = None
+        else:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, delimiter=';', extrasaction='ignore')
+            writer.writeheader()
+        for rec in records:
+            data = rec['data'].isoformat(sep=' ') if rec['data'] else ''
+            if writer is None:
+                f.write(json.dumps(dict(rec, data=data), ensure_ascii=False) + '\n')
+            else:
+                writer.writerow(dict(rec, data=data, componenti=json.dumps(rec['componenti'], ensure_ascii=False)))
+            count += 1
+            if progress and count % 5000 == 0:
+                progress(count, time.perf_counter() - start)
+    if progress:
+        progress(count, time.perf_counter() - start)
+    return count
+
+
+def make_progress(label):
+    def report(count, elapsed):
+        rate = count / elapsed if elapsed > 0 else 0
+        print(f"[{label}] {count} interventi - {elapsed:.1f}s - {rate:,.0f} righe/s", flush=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import/export massivo degli interventi")
+    parser.add_argument('azione', choices=['import', 'export'])
+    parser.add_argument('file', help="File .jsonl o .csv")
+    parser.add_argument('--db', default='gestione_assistenze.db')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--prodotto', help="Solo export: limita a un prodotto")
+    args = parser.parse_args(argv)
+
+    db = DatabaseManager(args.db)
+    start = time.perf_counter()
+    if args.azione == 'import':
+        total = db.bulk_add_interventi(read_records(args.file), args.batch_size, make_progress("IMPORT"))
+    else:
+        records = db.iter_interventi_export(args.prodotto, args.batch_size)
+        total = write_records(args.file, records, make_progress("EXPORT"))
+
+    elapsed = time.perf_counter() - start
+    print(f"[{args.azione.upper()}] Completato: {total} interventi in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed > 0 else 0:,.0f} righe/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+import tempfile
+import threading
+
+# Catalogo posizioni di tutti i prodotti in un unico file SQLite accanto ai disegni. I JSON
+# restano il formato di scambio: importati quando cambiano, riesportati a ogni flush del registro.
+CATALOG_NAME = 'catalogo.db'
+
+CATALOG_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 67108864, # 64 MB letti via memory-mapping
+    'temp_store': 'MEMORY',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posizioni (
+    prodotto    TEXT NOT NULL,
+    pagina      INTEGER NOT NULL,
+    posizione   TEXT NOT NULL,
+    x           INTEGER,  -- NULL: posizione senza punto sulla mappa
+    y           INTEGER,
+    codice      TEXT,     -- NULL: posizione senza riga nei dati
+    descrizione TEXT,
+    PRIMARY KEY (prodotto, pagina, posizione)
+) WITHOUT ROWID;
+-- Quali mappe esistono per pagina (anche vuote): distingue "nessun dato" da "mai salvato".
+-- coords / data: 0 assenti, 1 importati da JSON, 2 modificati nell'applicazione
+CREATE TABLE IF NOT EXISTS pagine (
+    prodotto TEXT NOT NULL,
+    pagina   INTEGER NOT NULL,
+    coords   INTEGER NOT NULL DEFAULT 0,
+    data     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (prodotto, pagina)
+) WITHOUT ROWID;
+-- Firma dei JSON già importati (nome file -> dimensione, mtime)
+CREATE TABLE IF NOT EXISTS sorgenti_json (
+    file     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Provenienza delle mappe di una pagina (colonne coords / data di "pagine"): quelle modificate
+# nel calibratore prevalgono sui JSON, che l'OCR può riscrivere rielaborando il PDF
+FROM_JSON = 1
+EDITED = 2
+
+# Ordine naturale delle posizioni: "2" prima di "10", "12A" dopo "12"
+_ORDER = "ORDER BY length(posizione), posizione"
+
+
+def position_id(posizione):
+    return int(posizione) if posizione.isdigit() else posizione
+
+
+class CatalogStore:
+    """ Coordinate e dati di tutte le posizioni, indicizzati per (prodotto, pagina, posizione) """
+
+    def __init__(self, drawings_dir, profile=None):
+        self.drawings_dir = drawings_dir
+        self.path = os.path.join(drawings_dir, CATALOG_NAME)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        for name, value in (CATALOG_PROFILE if profile is None else profile).items():
+            self._conn.execute(f"PRAGMA {name}={value}")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Letture ---
+
+    def get_coords(self, product_id, page=0):
+        """ [[x, y, posizione]] come in .coords.json, o None se la pagina non ha mappa """
+        with self._lock:
+            if not self._has(product_id, page, 'coords'):
+                return None
+            rows = self._conn.execute(
+                f"SELECT x, y, posizione FROM posizioni WHERE prodotto=? AND pagina=? AND x IS NOT NULL {_ORDER}",
+                (product_id, page)).fetchall()
+        return [[x, y, position_id(pos)] for x, y, pos in rows]
+
+    def get_data(self, product_id, page=0):
+        """ {posizione: [codice, descrizione]} come in .data.json, o None se mai salvati """
+        with self._lock:
+            if not self._has(product_id, page, 'data'):
+                return None
+            rows = self._conn.execute(
+                f"SELECT posizione, codice, descrizione FROM posizioni "
+                f"WHERE prodotto=? AND pagina=? AND codice IS NOT NULL {_ORDER}",
+                (product_id, page)).fetchall()
+        return {pos: [code, desc] for pos, code, desc in rows}
+
+    def count_points(self, product_id):
+        """ Punti calibrati del prodotto su tutte le pagine """
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM posizioni WHERE prodotto=? AND x IS NOT NULL",
+                                      (product_id,)).fetchone()[0]
+
+    def _has(self, product_id, page, kind):
+        return self._state(product_id, page, kind) != 0
+
+    def _state(self, product_id, page, kind):
+        row = self._conn.execute(f"SELECT {kind} FROM pagine WHERE prodotto=? AND pagina=?",
+                                 (product_id, page)).fetchone()
+        return row[0] if row else 0
+
+    # --- Scritture (ognuna è una transazione: o tutta la pagina o niente) ---
+
+    def save_coords(self, product_id, coords, page=0):
+        with self._lock, self._conn:
+            self._replace_coords(product_id, page, coords)
+
+    def save_data(self, product_id, data_dict, page=0):
+        with self._lock, self._conn:
+            self._replace_data(product_id, page, data_dict)
+
+    def save_batch(self, changes):
+        """ changes: [(prodotto, pagina, 'coords' | 'data', valore)], tutte in un'unica transazione """
+        with self._lock, self._conn:
+            for product_id, page, kind, value in changes:
+                if kind == 'coords':
+                    self._replace_coords(product_id, page, value)
+                else:
+                    self._replace_data(product_id, page, value)
+
+    def _replace_coords(self, product_id, page, coords, state=EDITED):
+        self._conn.execute("UPDATE posizioni SET x=NULL, y=NULL WHERE prodotto=? AND pagina=?", (product_id, page))
+        self._conn.executemany(
+            "INSERT INTO posizioni (prodotto, pagina, posizione, x, y) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (prodotto, pagina, posizione) DO UPDATE SET x=excluded.x, y=excluded.y",
+            [(product_id, page, str(num), round(x), round(y)) for x, y, num in coords])
+        self._mark(product_id, page, 'coords', state)
+
+    def _replace_data(self, product_id, page, data_dict, state=EDITED):
+        self._conn.execute("UPDATE posizioni SET codice=NULL, descrizione=NULL WHERE prodotto=? AND pagina=?",
+                           (product_id, page))
+        self._conn.executemany(
+            "INSERT INTO posizioni (prodotto, pagina, posizione, codice, descrizione) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (prodotto, pagina, posizione) DO UPDATE SET codice=excluded.codice, descrizione=excluded.descrizione",
+            [(product_id, page, str(pos), entry[0], entry[1]) for pos, entry in data_dict.items()])
+        self._mark(product_id, page, 'data', state)
+
+    def _mark(self, product_id, page, kind, state):
+        self._conn.execute(f"INSERT INTO pagine (prodotto, pagina, {kind}) VALUES (?, ?, ?) "
+                           f"ON CONFLICT (prodotto, pagina) DO UPDATE SET {kind}=excluded.{kind}",
+                           (product_id, page, state))
+        self._conn.execute("DELETE FROM posizioni WHERE prodotto=? AND pagina=? AND x IS NULL AND codice IS NULL",
+                           (product_id, page))
+
+    def rename_product(self, old_id, new_id):
+        """ Segue la rinomina del PDF (vedi registry.rename_product_files) """
+        pattern = re.compile(rf'^{re.escape(old_id)}((?:\.p\d+)?\.(?:coords|data)\.json)$')
+        with self._lock, self._conn:
+            if self._conn.execute("SELECT 1 FROM pagine WHERE prodotto=? LIMIT 1", (new_id,)).fetchone():
+                return False
+            self._conn.execute("UPDATE posizioni SET prodotto=? WHERE prodotto=?", (new_id, old_id))
+            self._conn.execute("UPDATE pagine SET prodotto=? WHERE prodotto=?", (new_id, old_id))
+            for (name,) in self._conn.execute("SELECT file FROM sorgenti_json").fetchall():
+                match = pattern.match(name)
+                if match:
+                    self._conn.execute("UPDATE OR REPLACE sorgenti_json SET file=? WHERE file=?",
+                                       (new_id + match.group(1), name))
+        return True
+
+    # --- Compatibilità JSON ---
+
+    def sync_json(self, product_id, page, coords_path, data_path):
+        """ Importa .coords.json / .data.json della pagina se sono cambiati dall'ultimo import
+            (un stat per file; il contenuto si legge solo quando la firma è diversa).
+            Le mappe modificate nell'applicazione non vengono mai sovrascritte da un JSON.
+        """
+        for kind, path in (('coords', coords_path), ('data', data_path)):
+            name = os.path.basename(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            with self._lock:
+                known = self._conn.execute("SELECT size, mtime_ns FROM sorgenti_json WHERE file=?", (name,)).fetchone()
+                if known == (st.st_size, st.st_mtime_ns):
+                    continue
+                if self._state(product_id, page, kind) == EDITED:
+                    # Es. PDF rielaborato dall'OCR: vale la calibrazione nel catalogo
+                    with self._conn:
+                        self._conn.execute("INSERT OR REPLACE INTO sorgenti_json VALUES (?, ?, ?)",
+                                           (name, st.st_size, st.st_mtime_ns))
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        content = json.load(f)
+                except (OSError, ValueError):
+                    # Riprovato al prossimo controllo (la firma non viene registrata)
+                    continue
+                with self._conn:
+                    if kind == 'coords':
+                        self._replace_coords(product_id, page, content, FROM_JSON)
+                    else:
+                        self._replace_data(product_id, page, content, FROM_JSON)
+                    self._conn.execute("INSERT OR REPLACE INTO sorgenti_json VALUES (?, ?, ?)",
+                                       (name, st.st_size, st.st_mtime_ns))
+
+    def export_json(self, product_id, page, coords_path, data_path):
+        """ Riscrive i JSON della pagina dal catalogo (scrittura atomica), senza reimportarli poi """
+        for path, content in ((coords_path, self.get_coords(product_id, page)), (data_path, self.get_data(product_id, page))):
+            if content is None:
+                continue
+            name = os.path.basename(path)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(content, f, indent=4)
+                os.replace(tmp_path, path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            st = os.stat(path)
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO sorgenti_json VALUES (?, ?, ?)",
+                                   (name, st.st_size, st.st_mtime_ns))
+
+    def pages(self, product_id):
+        with self._lock:
+            return [page for (page,) in self._conn.execute(
+                "SELECT pagina FROM pagine WHERE prodotto=? ORDER BY pagina", (product_id,))]
+
+
+if __name__ == '__main__':
+    # python catalog_store.py import|export [cartella_disegni]
+    from registry import ProductRegistry
+    command = sys.argv[1] if len(sys.argv) > 1 else 'import'
+    registry = ProductRegistry(sys.argv[2] if len(sys.argv) > 2 else 'Disegni')
+    for product_id in registry.get_available_products():
+        for page in range(registry.get_page_count(product_id)):
+            paths = (registry.get_page_path(product_id, 'coords.json', page),
+                     registry.get_page_path(product_id, 'data.json', page))
+            if command == 'export':
+                registry.catalog.export_json(product_id, page, *paths)
+            else:
+                registry.catalog.sync_json(product_id, page, *paths)
+    print(f"[CATALOGO] {command} completato: {len(registry.get_available_products())} prodotti")
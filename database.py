@@ -1,12 +1,30 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Index, func, or_, and_, text, insert, select, delete
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, joinedload
+from sqlalchemy.orm import sessionmaker, relationship, joinedload, selectinload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import datetime
+import itertools
 import os
+import re
+import time
 
 # Component data is now loaded dynamically from the ProductRegistry via JSON files.
 Base = declarative_base()
 
+# Profilo di storage SQLite: ogni voce diventa un PRAGMA eseguito su ogni nuova connessione.
+# Passare profile={} a DatabaseManager per tornare ai default di SQLite.
+SQLITE_PROFILE = {
+    'journal_mode': 'WAL',        # letture concorrenti alle scritture, commit senza fsync del db
+    'synchronous': 'NORMAL',      # sicuro con WAL, evita un fsync per ogni commit
+    'cache_size': -64000,         # valore negativo = KiB, circa 64 MB di page cache
+    'mmap_size': 268435456,       # 256 MB letti via memory-mapping invece di read()
+    'temp_store': 'MEMORY',
+}
+
+# Engine condivisi per percorso: MainWindow e i dialoghi creano ciascuno un DatabaseManager,
+# ma il pool di connessioni e le migrazioni devono esistere una volta sola per file.
+_ENGINES = {}
+
 class Intervento(Base):
     __tablename__ = 'interventi'
     
@@ -16,14 +34,21 @@ class Intervento(Base):
     ore_lavoro = Column(Float, default=0.0)
     note_tecniche = Column(Text)
     descrizione = Column(Text)
+    # Incrementata a ogni salvataggio: controllo di concorrenza ottimistico in update_intervento
+    versione = Column(Integer, nullable=False, default=1, server_default='1')
     
     componenti = relationship("ComponenteIntervento", back_populates="intervento", cascade="all, delete-orphan")
+    
+    # Copre filtro per prodotto e ordinamento (data, id) della cronologia paginata
+    __table_args__ = (
+        Index('ix_interventi_prodotto_data', prodotto, data.desc(), id.desc()),
+    )
 
 class ComponenteIntervento(Base):
     __tablename__ = 'componenti_intervento'
     
     id = Column(Integer, primary_key=True)
-    intervento_id = Column(Integer, ForeignKey('interventi.id'))
+    intervento_id = Column(Integer, ForeignKey('interventi.id'), index=True)
     numero_componente = Column(Integer, nullable=False)
     codice_componente = Column(String(50))
     descrizione_componente = Column(String(255))
@@ -33,12 +58,141 @@ class ComponenteIntervento(Base):
     
     intervento = relationship("Intervento", back_populates="componenti")
 
+class StatisticaComponente(Base):
+    """ Consumo ricambi aggregato per prodotto, componente e mese ('YYYY-MM').
+        Mantenuta in modo incrementale da DatabaseManager a ogni inserimento,
+        modifica ed eliminazione di un intervento. ore_totali somma le ore dei
+        rapporti in cui compare il componente, sostituito o meno (media = ore_totali / conteggio).
+    """
+    __tablename__ = 'statistiche_componenti'
+    
+    prodotto = Column(String(50), primary_key=True)
+    codice_componente = Column(String(50), primary_key=True)
+    mese = Column(String(7), primary_key=True)
+    descrizione_componente = Column(String(255))
+    conteggio = Column(Integer, nullable=False, default=0)
+    quantita_totale = Column(Float, nullable=False, default=0.0)
+    ore_totali = Column(Float, nullable=False, default=0.0)
+
+def chiave_statistica(codice, numero):
+    """ Chiave componente per le statistiche: il codice se valorizzato, altrimenti la posizione.
+        Deve restare allineata a _STATISTICHE_REBUILD_SQL.
+    """
+    if codice and codice != '-':
+        return codice
+    return f"POS {numero}"
+
+# Indice full-text esterno (contenuto letto da interventi) tenuto allineato dai trigger,
+# così anche gli INSERT Core di bulk_add_interventi e le modifiche fuori dall'ORM lo aggiornano.
+_FTS_SCHEMA_SQL = [
+    """CREATE VIRTUAL TABLE interventi_fts USING fts5(
+        descrizione, note_tecniche,
+        content='interventi', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER interventi_fts_ai AFTER INSERT ON interventi BEGIN
+        INSERT INTO interventi_fts(rowid, descrizione, note_tecniche)
+        VALUES (new.id, new.descrizione, new.note_tecniche);
+    END""",
+    """CREATE TRIGGER interventi_fts_ad AFTER DELETE ON interventi BEGIN
+        INSERT INTO interventi_fts(interventi_fts, rowid, descrizione, note_tecniche)
+        VALUES ('delete', old.id, old.descrizione, old.note_tecniche);
+    END""",
+    """CREATE TRIGGER interventi_fts_au AFTER UPDATE OF descrizione, note_tecniche ON interventi
+    WHEN old.descrizione IS NOT new.descrizione OR old.note_tecniche IS NOT new.note_tecniche BEGIN
+        INSERT INTO interventi_fts(interventi_fts, rowid, descrizione, note_tecniche)
+        VALUES ('delete', old.id, old.descrizione, old.note_tecniche);
+        INSERT INTO interventi_fts(rowid, descrizione, note_tecniche)
+        VALUES (new.id, new.descrizione, new.note_tecniche);
+    END""",
+    "INSERT INTO interventi_fts(interventi_fts) VALUES ('rebuild')",
+]
+
+_STATISTICHE_REBUILD_SQL = """
+    INSERT INTO statistiche_componenti
+        (prodotto, codice_componente, mese, descrizione_componente, conteggio, quantita_totale, ore_totali)
+    SELECT i.prodotto,
+           CASE WHEN c.codice_componente IS NULL OR c.codice_componente IN ('', '-')
+                THEN 'POS ' || c.numero_componente ELSE c.codice_componente END AS chiave,
+           COALESCE(strftime('%Y-%m', i.data), '') AS mese,
+           COALESCE(MAX(c.descrizione_componente), ''),
+           COUNT(*),
+           SUM(COALESCE(c.quantita, 0)),
+           SUM(COALESCE(i.ore_lavoro, 0))
+    FROM componenti_intervento c JOIN interventi i ON i.id = c.intervento_id
+    GROUP BY i.prodotto, chiave, mese
+"""
+
+class ConflittoModificaError(Exception):
+    """ Il rapporto è stato salvato da qualcun altro dopo che è stato aperto """
+
+class InterventoRow:
+    """ Istantanea compatta di un intervento per la cronologia: solo i campi mostrati
+        in tabella, con il riepilogo componenti già composto. Niente oggetti ORM né
+        sessione agganciata, così una pagina costa poche centinaia di byte per riga.
+    """
+    __slots__ = ('id', 'data', 'ore_lavoro', 'descrizione', 'componenti')
+
+    def __init__(self, id, data, ore_lavoro, descrizione, componenti):
+        self.id = id
+        self.data = data
+        self.ore_lavoro = ore_lavoro
+        self.descrizione = descrizione
+        self.componenti = componenti
+
 class DatabaseManager:
-    def __init__(self, db_path='gestione_assistenze.db'):
-        self.engine = create_engine(f'sqlite:///{db_path}')
-        Base.metadata.create_all(self.engine)
+    def __init__(self, db_path='gestione_assistenze.db', profile=None):
+        self.profile = SQLITE_PROFILE if profile is None else profile
+        key = (os.path.abspath(db_path), tuple(sorted(self.profile.items())))
+        
+        self.engine = _ENGINES.get(key)
+        if self.engine is None:
+            self.engine = self._create_engine(db_path)
+            Base.metadata.create_all(self.engine)
+            self._migrate()
+            _ENGINES[key] = self.engine
         self.Session = sessionmaker(bind=self.engine)
     
+    def _create_engine(self, db_path):
+        engine = create_engine(f'sqlite:///{db_path}')
+        pragmas = list(self.profile.items())
+        
+        @event.listens_for(engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+        
+        return engine
+    
+    def _migrate(self):
+        """ Porta i database esistenti allo schema corrente. create_all crea solo le
+            tabelle mancanti, quindi gli indici aggiunti in seguito vanno creati qui.
+        """
+        with self.engine.begin() as conn:
+            columns = {row[1] for row in conn.execute(text("PRAGMA table_info(interventi)"))}
+            if 'versione' not in columns:
+                conn.execute(text("ALTER TABLE interventi ADD COLUMN versione INTEGER NOT NULL DEFAULT 1"))
+            
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+            
+            has_fts = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'interventi_fts'")).first()
+            if not has_fts:
+                for statement in _FTS_SCHEMA_SQL:
+                    conn.execute(text(statement))
+            
+            # Tabella statistiche appena creata su un database con storico: la popoliamo una volta
+            has_stats = conn.execute(text("SELECT 1 FROM statistiche_componenti LIMIT 1")).first()
+            has_components = conn.execute(text("SELECT 1 FROM componenti_intervento LIMIT 1")).first()
+            if has_components and not has_stats:
+                conn.execute(text(_STATISTICHE_REBUILD_SQL))
+            # Aggiorna le statistiche del query planner solo se servono
+            conn.execute(text("PRAGMA optimize"))
+    
     def get_session(self):
         return self.Session()
 
@@ -63,6 +217,12 @@ class DatabaseManager:
                     )
                     nuovo.componenti.append(c)
             session.add(nuovo)
+            session.flush()
+            
+            delta = {}
+            self._accumula_statistiche(delta, prodotto, nuovo.data, ore,
+                                       [self._componente_values(nuovo.id, comp) for comp in componenti_data or ()])
+            self._applica_statistiche(session, delta)
             session.commit()
             return nuovo.id
         except Exception as e:
@@ -71,32 +231,64 @@ class DatabaseManager:
         finally:
             session.close()
 
-    def update_intervento(self, id_intervento, ore, note, descrizione, componenti_data=None):
+    def update_intervento(self, id_intervento, ore, note, descrizione, componenti_data=None, versione=None):
+        """ Aggiorna un intervento scrivendo solo le differenze sui componenti (chiave:
+            numero_componente). Se `versione` è indicata l'aggiornamento riesce solo se il
+            rapporto è ancora a quella versione, altrimenti solleva ConflittoModificaError.
+        """
         session = self.get_session()
         try:
-            inv = session.query(Intervento).filter(Intervento.id == id_intervento).first()
-            if not inv: return False
+            old = session.query(Intervento.prodotto, Intervento.data, Intervento.ore_lavoro).filter(
+                Intervento.id == id_intervento).first()
+            if old is None:
+                return False
             
-            inv.ore_lavoro = ore
-            inv.note_tecniche = note
-            inv.descrizione = descrizione
+            query = session.query(Intervento).filter(Intervento.id == id_intervento)
+            if versione is not None:
+                query = query.filter(Intervento.versione == versione)
+            updated = query.update({
+                Intervento.ore_lavoro: ore,
+                Intervento.note_tecniche: note,
+                Intervento.descrizione: descrizione,
+                Intervento.versione: Intervento.versione + 1
+            }, synchronize_session=False)
+            if not updated:
+                if versione is not None and session.get(Intervento, id_intervento) is not None:
+                    raise ConflittoModificaError(id_intervento)
+                return False
             
-            # Clear old components
-            session.query(ComponenteIntervento).filter(ComponenteIntervento.intervento_id == id_intervento).delete()
+            existing = {}
+            old_components = []
+            for c in session.query(ComponenteIntervento).filter(ComponenteIntervento.intervento_id == id_intervento):
+                existing.setdefault(str(c.numero_componente), []).append(c)
+                old_components.append({
+                    'numero_componente': c.numero_componente,
+                    'codice_componente': c.codice_componente,
+                    'descrizione_componente': c.descrizione_componente,
+                    'quantita': c.quantita
+                })
+            new_components = [self._componente_values(id_intervento, comp) for comp in componenti_data or ()]
             
-            # Add new components
-            if componenti_data:
-                for comp in componenti_data:
-                    c = ComponenteIntervento(
-                        intervento_id=id_intervento,
-                        numero_componente=comp['numero'],
-                        codice_componente=comp.get('codice', ''),
-                        descrizione_componente=comp.get('descrizione', ''),
-                        quantita=comp.get('quantita', 1.0),
-                        sostituito=comp.get('sostituito', True),
-                        note=comp.get('note', '')
-                    )
-                    session.add(c)
+            delta = {}
+            self._accumula_statistiche(delta, old.prodotto, old.data, old.ore_lavoro, old_components, -1)
+            self._accumula_statistiche(delta, old.prodotto, old.data, ore, new_components)
+            self._applica_statistiche(session, delta)
+            
+            for values in new_components:
+                matches = existing.get(str(values['numero_componente']))
+                if matches:
+                    # Riga già presente: la sessione emette UPDATE solo se qualche campo cambia
+                    c = matches.pop(0)
+                    for field, value in values.items():
+                        if getattr(c, field) != value:
+                            setattr(c, field, value)
+                else:
+                    session.add(ComponenteIntervento(**values))
+            
+            # Quello che resta non è più nella distinta
+            for leftovers in existing.values():
+                for c in leftovers:
+                    session.delete(c)
             session.commit()
             return True
         except Exception as e:
@@ -111,17 +303,126 @@ class DatabaseManager:
             query = session.query(Intervento).options(joinedload(Intervento.componenti))
             if prodotto:
                 query = query.filter(Intervento.prodotto == prodotto)
-            return query.order_by(Intervento.data.desc()).all()
+            return query.order_by(Intervento.data.desc(), Intervento.id.desc()).all()
+        finally:
+            session.close()
+
+    def get_interventi_page(self, prodotto=None, cursor=None, page_size=200):
+        """ Restituisce una pagina di interventi ordinata per (data, id) decrescenti.
+            Paginazione keyset: `cursor` è la coppia (data, id) dell'ultima riga ricevuta,
+            None per la prima pagina. Ritorna (righe, cursore_successivo) con righe
+            InterventoRow; il cursore è None quando non ci sono altre pagine.
+        """
+        session = self.get_session()
+        try:
+            query = session.query(Intervento.id, Intervento.data, Intervento.ore_lavoro, Intervento.descrizione)
+            if prodotto:
+                query = query.filter(Intervento.prodotto == prodotto)
+            if cursor is not None:
+                last_data, last_id = cursor
+                if last_data is None:
+                    # Le date NULL stanno in fondo all'ordinamento DESC: resta solo il tie-break sull'id
+                    query = query.filter(Intervento.data.is_(None), Intervento.id < last_id)
+                else:
+                    query = query.filter(or_(
+                        Intervento.data < last_data,
+                        and_(Intervento.data == last_data, Intervento.id < last_id),
+                        Intervento.data.is_(None)
+                    ))
+            rows = query.order_by(Intervento.data.desc(), Intervento.id.desc()).limit(page_size + 1).all()
+            
+            # Chiediamo una riga in più per sapere se esiste una pagina successiva senza COUNT
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                next_cursor = (rows[-1].data, rows[-1].id)
+            
+            return self._righe_cronologia(session, rows), next_cursor
+        finally:
+            session.close()
+
+    def cerca_interventi(self, testo, prodotto=None, limit=200, finestra=2000):
+        """ Ricerca full-text su descrizione e note tecniche (indice FTS5), risultati
+            ordinati per rilevanza BM25 con la descrizione pesata il doppio delle note.
+            Ogni parola cercata vale anche come prefisso ("guarniz" trova "guarnizione").
+            Il ranking è calcolato sulle `finestra` corrispondenze più recenti: FTS5 le
+            trova scorrendo l'indice per rowid decrescente e si ferma lì, così anche un
+            prefisso che compare in metà dell'archivio risponde in pochi millisecondi.
+        """
+        match = self._fts_query(testo)
+        if not match:
+            return []
+        filtro = "AND i.prodotto = :prodotto" if prodotto else ""
+        sql = f"""
+            SELECT i.id, i.data, i.ore_lavoro, i.descrizione
+            FROM interventi_fts JOIN interventi i ON i.id = interventi_fts.rowid
+            WHERE interventi_fts MATCH :match {filtro}
+              AND interventi_fts.rowid >= (
+                  SELECT MIN(rowid) FROM (
+                      SELECT interventi_fts.rowid AS rowid
+                      FROM interventi_fts JOIN interventi i ON i.id = interventi_fts.rowid
+                      WHERE interventi_fts MATCH :match {filtro}
+                      ORDER BY interventi_fts.rowid DESC LIMIT :finestra))
+            ORDER BY bm25(interventi_fts, 2.0, 1.0)
+            LIMIT :limit
+        """
+        query = text(sql).columns(id=Integer, data=DateTime, ore_lavoro=Float, descrizione=Text)
+        params = {'match': match, 'prodotto': prodotto, 'limit': limit, 'finestra': max(finestra, limit)}
+        
+        session = self.get_session()
+        try:
+            rows = session.execute(query, params).all()
+            return self._righe_cronologia(session, rows)
+        finally:
+            session.close()
+
+    @staticmethod
+    def _fts_query(testo):
+        # Solo parole alfanumeriche tra virgolette: la sintassi FTS5 digitata dall'utente
+        # (NEAR, -, ^, parentesi...) non deve mai produrre errori di parsing. Una lettera
+        # sola non diventa prefisso: espanderebbe a mezzo vocabolario senza filtrare nulla.
+        words = re.findall(r'\w+', testo or '')
+        return ' '.join(f'"{w}"*' if len(w) > 1 else f'"{w}"' for w in words)
+
+    def get_intervento(self, id_intervento):
+        """ Carica un singolo intervento (con i componenti) tramite chiave primaria """
+        session = self.get_session()
+        try:
+            return session.get(Intervento, id_intervento, options=[joinedload(Intervento.componenti)])
+        finally:
+            session.close()
+
+    def count_interventi(self, prodotto=None):
+        """ Numero totale di interventi (per prodotto), usato come stima per la UI """
+        session = self.get_session()
+        try:
+            query = session.query(func.count(Intervento.id))
+            if prodotto:
+                query = query.filter(Intervento.prodotto == prodotto)
+            return query.scalar() or 0
         finally:
             session.close()
 
     def delete_intervento(self, id_intervento):
         session = self.get_session()
         try:
+            # Togliamo il contributo alle statistiche prima di perdere i componenti
+            inv = session.get(Intervento, id_intervento)
+            if inv:
+                old_components = session.query(
+                    ComponenteIntervento.numero_componente,
+                    ComponenteIntervento.codice_componente,
+                    ComponenteIntervento.descrizione_componente,
+                    ComponenteIntervento.quantita
+                ).filter(ComponenteIntervento.intervento_id == id_intervento).all()
+                delta = {}
+                self._accumula_statistiche(delta, inv.prodotto, inv.data, inv.ore_lavoro,
+                                           [c._asdict() for c in old_components], -1)
+                self._applica_statistiche(session, delta)
+            
             # Delete components first (cascade-like)
             session.query(ComponenteIntervento).filter(ComponenteIntervento.intervento_id == id_intervento).delete()
             # Delete intervention
-            inv = session.query(Intervento).filter(Intervento.id == id_intervento).first()
             if inv:
                 session.delete(inv)
                 session.commit()
@@ -132,3 +433,211 @@ class DatabaseManager:
             raise e
         finally:
             session.close()
+
+    def bulk_add_interventi(self, records, batch_size=5000, progress=None):
+        """ Import massivo da un iterabile di dict con le stesse chiavi di add_intervento
+            (prodotto, ore, note, descrizione, componenti) più 'data' opzionale.
+            I record vengono consumati a blocchi di batch_size e scritti con INSERT
+            executemany, una transazione per blocco. progress(inseriti, secondi) viene
+            chiamata dopo ogni blocco. Ritorna il numero di interventi inseriti.
+        """
+        inv_table = Intervento.__table__
+        comp_table = ComponenteIntervento.__table__
+        start = time.perf_counter()
+        total = 0
+        
+        iterator = iter(records)
+        while True:
+            batch = list(itertools.islice(iterator, batch_size))
+            if not batch:
+                break
+            with self.engine.begin() as conn:
+                rows = [self._intervento_values(rec) for rec in batch]
+                # Il primo INSERT acquisisce il lock di scrittura: da qui in poi gli id
+                # successivi non possono essere presi da altri, li assegniamo noi.
+                first_id = conn.execute(insert(inv_table), rows[0]).inserted_primary_key[0]
+                
+                inv_rows = []
+                comp_rows = []
+                delta = {}
+                for offset, (rec, row) in enumerate(zip(batch, rows)):
+                    inv_id = first_id + offset
+                    if offset:
+                        row['id'] = inv_id
+                        inv_rows.append(row)
+                    rec_components = [self._componente_values(inv_id, comp) for comp in rec.get('componenti') or ()]
+                    comp_rows.extend(rec_components)
+                    self._accumula_statistiche(delta, row['prodotto'], row['data'], row['ore_lavoro'], rec_components)
+                
+                if inv_rows:
+                    conn.execute(insert(inv_table), inv_rows)
+                if comp_rows:
+                    conn.execute(insert(comp_table), comp_rows)
+                self._applica_statistiche(conn, delta)
+            
+            total += len(batch)
+            if progress:
+                progress(total, time.perf_counter() - start)
+        return total
+
+    def iter_interventi_export(self, prodotto=None, batch_size=5000):
+        """ Generatore che scorre gli interventi in ordine di id a blocchi (keyset sull'id),
+            restituendo dict nel formato accettato da bulk_add_interventi.
+        """
+        inv_table = Intervento.__table__
+        comp_table = ComponenteIntervento.__table__
+        last_id = 0
+        while True:
+            with self.engine.connect() as conn:
+                query = select(inv_table).where(inv_table.c.id > last_id)
+                if prodotto:
+                    query = query.where(inv_table.c.prodotto == prodotto)
+                rows = conn.execute(query.order_by(inv_table.c.id).limit(batch_size)).all()
+                if not rows:
+                    return
+                
+                componenti = {}
+                comp_query = select(comp_table).where(comp_table.c.intervento_id.in_([r.id for r in rows]))
+                for c in conn.execute(comp_query.order_by(comp_table.c.id)):
+                    componenti.setdefault(c.intervento_id, []).append({
+                        'numero': c.numero_componente,
+                        'codice': c.codice_componente,
+                        'descrizione': c.descrizione_componente,
+                        'quantita': c.quantita,
+                        'sostituito': c.sostituito,
+                        'note': c.note
+                    })
+            
+            for r in rows:
+                yield {
+                    'id': r.id,
+                    'prodotto': r.prodotto,
+                    'data': r.data,
+                    'ore': r.ore_lavoro,
+                    'note': r.note_tecniche,
+                    'descrizione': r.descrizione,
+                    'componenti': componenti.get(r.id, [])
+                }
+            last_id = rows[-1].id
+
+    def get_statistiche_componenti(self, prodotto=None, mese_da=None, mese_a=None):
+        """ Consumo ricambi per prodotto e componente nel periodo indicato (mesi 'YYYY-MM'
+            inclusi), ordinato per numero di sostituzioni. Legge solo la tabella aggregata.
+        """
+        session = self.get_session()
+        try:
+            s = StatisticaComponente
+            conteggio = func.sum(s.conteggio)
+            query = session.query(
+                s.prodotto,
+                s.codice_componente,
+                func.max(s.descrizione_componente).label('descrizione_componente'),
+                conteggio.label('conteggio'),
+                func.sum(s.quantita_totale).label('quantita_totale'),
+                (func.sum(s.ore_totali) / conteggio).label('ore_medie')
+            )
+            if prodotto:
+                query = query.filter(s.prodotto == prodotto)
+            if mese_da:
+                query = query.filter(s.mese >= mese_da)
+            if mese_a:
+                query = query.filter(s.mese <= mese_a)
+            return query.group_by(s.prodotto, s.codice_componente).order_by(conteggio.desc()).all()
+        finally:
+            session.close()
+
+    def ricostruisci_statistiche(self):
+        """ Ricalcola da zero la tabella statistiche a partire dallo storico """
+        with self.engine.begin() as conn:
+            conn.execute(delete(StatisticaComponente.__table__))
+            conn.execute(text(_STATISTICHE_REBUILD_SQL))
+
+    @staticmethod
+    def _accumula_statistiche(delta, prodotto, data, ore, componenti, segno=1):
+        """ Somma in `delta` il contributo (segno +1/-1) di un intervento alle statistiche """
+        mese = data.strftime('%Y-%m') if data else ''
+        for comp in componenti:
+            key = (prodotto, chiave_statistica(comp['codice_componente'], comp['numero_componente']), mese)
+            entry = delta.get(key)
+            if entry is None:
+                entry = delta[key] = {'conteggio': 0, 'quantita_totale': 0.0, 'ore_totali': 0.0,
+                                      'descrizione_componente': ''}
+            entry['conteggio'] += segno
+            entry['quantita_totale'] += segno * (comp['quantita'] or 0.0)
+            entry['ore_totali'] += segno * (ore or 0.0)
+            if segno > 0 and comp.get('descrizione_componente'):
+                entry['descrizione_componente'] = comp['descrizione_componente']
+
+    @staticmethod
+    def _applica_statistiche(conn, delta):
+        """ Scrive i delta con un upsert (executemany) nella transazione del chiamante """
+        rows = [
+            dict(values, prodotto=prodotto, codice_componente=codice, mese=mese)
+            for (prodotto, codice, mese), values in delta.items()
+            if values['conteggio'] or values['quantita_totale'] or values['ore_totali']
+        ]
+        if not rows:
+            return
+        table = StatisticaComponente.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.prodotto, table.c.codice_componente, table.c.mese],
+            set_={
+                'conteggio': table.c.conteggio + stmt.excluded.conteggio,
+                'quantita_totale': table.c.quantita_totale + stmt.excluded.quantita_totale,
+                'ore_totali': table.c.ore_totali + stmt.excluded.ore_totali,
+                # '' come nella ricostruzione: non cancella una descrizione già registrata
+                'descrizione_componente': func.coalesce(func.nullif(stmt.excluded.descrizione_componente, ''),
+                                                        table.c.descrizione_componente, '')
+            }
+        )
+        conn.execute(stmt, rows)
+        if any(values['conteggio'] < 0 for values in delta.values()):
+            conn.execute(delete(table).where(table.c.conteggio <= 0))
+
+    @staticmethod
+    def _righe_cronologia(session, rows):
+        """ Converte righe (id, data, ore_lavoro, descrizione) in InterventoRow, componendo
+            il riepilogo componenti con una sola query sulle colonne necessarie.
+        """
+        details = {}
+        if rows:
+            comp_query = session.query(
+                ComponenteIntervento.intervento_id,
+                ComponenteIntervento.numero_componente,
+                ComponenteIntervento.quantita
+            ).filter(ComponenteIntervento.intervento_id.in_([r.id for r in rows]))
+            for inv_id, numero, quantita in comp_query.order_by(ComponenteIntervento.id):
+                details.setdefault(inv_id, []).append(f"{numero} x{quantita}")
+        
+        return [
+            InterventoRow(r.id, r.data, r.ore_lavoro, r.descrizione, ", ".join(details.get(r.id, ())) or "-")
+            for r in rows
+        ]
+
+    @staticmethod
+    def _intervento_values(rec):
+        # Tutte le chiavi sempre presenti: l'executemany richiede righe omogenee
+        return {
+            'prodotto': rec['prodotto'],
+            'data': rec.get('data') or datetime.datetime.now(),
+            'ore_lavoro': rec.get('ore') or 0.0,
+            'note_tecniche': rec.get('note'),
+            'descrizione': rec.get('descrizione')
+        }
+
+    @staticmethod
+    def _componente_values(inv_id, comp):
+        # La GUI passa la posizione come stringa: la normalizziamo come la salverebbe SQLite
+        numero = comp['numero']
+        if isinstance(numero, str) and numero.strip().isdigit():
+            numero = int(numero)
+        return {
+            'intervento_id': inv_id,
+            'numero_componente': numero,
+            'codice_componente': comp.get('codice', ''),
+            'descrizione_componente': comp.get('descrizione', ''),
+            'quantita': comp.get('quantita', 1.0),
+            'sostituito': comp.get('sostituito', True),
+            'note': comp.get('note', '')
+        }
@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from PySide6.QtCore import (Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QThreadPool,
+                            QRect, QSize, Signal, QEvent)
+from PySide6.QtGui import QImage, QImageReader, QPixmap, QPainter, QColor, QPen, QFont
+from PySide6.QtWidgets import QStyledItemDelegate, QStyle
+
+# Anteprime tenute in memoria (le più recenti): oltre, si rileggono dal disco se tornano visibili
+THUMB_CACHE_MAX = 256
+# Schede già composte: il ridisegno è un drawPixmap per scheda
+CARD_CACHE_MAX = 256
+
+CARD_SIZE = QSize(220, 260)
+POINTS_ROLE = Qt.UserRole + 1
+
+
+class _ThumbnailSignals(QObject):
+    loaded = Signal(str, str, QImage) # prodotto, percorso, immagine (vuota se illeggibile)
+
+
+class _ThumbnailJob(QRunnable):
+    """ Decodifica un'anteprima fuori dal thread della GUI (QImage: QPixmap solo nel thread GUI) """
+
+    def __init__(self, product_id, path, signals):
+        super().__init__()
+        self.product_id = product_id
+        self.path = path
+        self.signals = signals
+
+    def run(self):
+        self.signals.loaded.emit(self.product_id, self.path, QImageReader(self.path).read())
+
+
+class ArchiveListModel(QAbstractListModel):
+    """ Prodotti dell'"Archivio Master Disegni": punti e anteprime solo per le schede visibili """
+
+    def __init__(self, registry, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+        self._products = []
+        self._thumbs = OrderedDict()  # prodotto -> QPixmap (nulla se l'anteprima manca o è illeggibile)
+        self._loading = set()
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(2)
+        self._signals = _ThumbnailSignals()
+        self._signals.loaded.connect(self._on_thumbnail_loaded)
+
+    def set_products(self, product_ids):
+        self.beginResetModel()
+        self._products = list(product_ids)
+        self.endResetModel()
+
+    def invalidate(self, *product_ids):
+        """ Scarta le anteprime in memoria (es. PDF rielaborato o rinominato) """
+        for product_id in product_ids:
+            self._thumbs.pop(product_id, None)
+        self._emit_changed(product_ids)
+
+    def product_id(self, row):
+        return self._products[row] if 0 <= row < len(self._products) else None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._products)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        product_id = self._products[index.row()]
+        if role == Qt.DisplayRole:
+            return product_id
+        if role == Qt.DecorationRole:
+            return self._thumbnail(product_id)
+        if role == POINTS_ROLE:
+            return self.registry.get_point_count(product_id)
+        return None
+
+    def _thumbnail(self, product_id):
+        """ QPixmap in cache, oppure None mentre il caricamento è in corso """
+        pixmap = self._thumbs.get(product_id)
+        if pixmap is not None:
+            self._thumbs.move_to_end(product_id)
+            return pixmap
+        if product_id not in self._loading:
+            path = self.registry.get_thumbnail(product_id)
+            if not path:
+                self._store(product_id, QPixmap())
+                return self._thumbs[product_id]
+            self._loading.add(product_id)
+            self._pool.start(_ThumbnailJob(product_id, path, self._signals))
+        return None
+
+    def _on_thumbnail_loaded(self, product_id, path, image):
+        self._loading.discard(product_id)
+        if image.isNull():
+            print(f"[ARCHIVIO] Anteprima non leggibile: {path}")
+        self._store(product_id, QPixmap.fromImage(image))
+        self._emit_changed([product_id])
+
+    def _store(self, product_id, pixmap):
+        self._thumbs[product_id] = pixmap
+        while len(self._thumbs) > THUMB_CACHE_MAX:
+            self._thumbs.popitem(last=False)
+
+    def _emit_changed(self, product_ids):
+        for product_id in product_ids:
+            if product_id in self._products:
+                index = self.index(self._products.index(product_id))
+                self.dataChanged.emit(index, index)
+
+
+class ArchiveCardDelegate(QStyledItemDelegate):
+    """ Schede dell'archivio (anteprima, nome, punti calibrati, pulsante), senza un widget per prodotto """
+    edit_requested = Signal(str)
+
+    MARGIN = 10
+    PREVIEW_HEIGHT = 140
+    BUTTON_HEIGHT = 30
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cards = OrderedDict()  # (prodotto, hover, anteprima, punti, font, dpr) -> QPixmap
+
+    def sizeHint(self, option, index):
+        return CARD_SIZE
+
+    def _layout(self, rect):
+        """ (scheda, anteprima, titolo, stato, pulsante) all'interno della cella """
+        card = QRect(rect.topLeft(), CARD_SIZE).adjusted(0, 0, -1, -1)
+        inner = card.adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN)
+        preview = QRect(inner.left(), inner.top(), inner.width(), self.PREVIEW_HEIGHT)
+        button = QRect(inner.left(), inner.bottom() - self.BUTTON_HEIGHT + 1, inner.width(), self.BUTTON_HEIGHT)
+        title = QRect(inner.left(), preview.bottom() + 8, inner.width(), 26)
+        status = QRect(inner.left(), title.bottom() + 2, inner.width(), 18)
+        return card, preview, title, status, button
+
+    def paint(self, painter, option, index):
+        pixmap = index.data(Qt.DecorationRole)
+        ratio = painter.device().devicePixelRatioF()
+        key = (index.data(), bool(option.state & QStyle.State_MouseOver),
+               None if pixmap is None else pixmap.cacheKey(), index.data(POINTS_ROLE), option.font.key(), ratio)
+        card = self._cards.get(key)
+        if card is None:
+            card = self._render_card(key, pixmap, option.font)
+            self._cards[key] = card
+            while len(self._cards) > CARD_CACHE_MAX:
+                self._cards.popitem(last=False)
+        else:
+            self._cards.move_to_end(key)
+        painter.drawPixmap(option.rect.topLeft(), card)
+
+    def _render_card(self, key, pixmap, base_font):
+        product_id, hovered, _, points, _, ratio = key
+        image = QPixmap(CARD_SIZE * ratio)
+        image.setDevicePixelRatio(ratio)
+        image.fill(Qt.transparent)
+        card, preview, title, status, button = self._layout(QRect(0, 0, CARD_SIZE.width(), CARD_SIZE.height()))
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        painter.setPen(QPen(QColor("#007c91"), 2) if hovered else QPen(QColor("#ddd"), 1))
+        painter.setBrush(QColor("white"))
+        painter.drawRoundedRect(card, 8, 8)
+
+        painter.setPen(QPen(QColor("#eee"), 1))
+        painter.setBrush(QColor("#fafafa"))
+        painter.drawRect(preview)
+        if pixmap is not None and not pixmap.isNull():
+            scaled = pixmap.size().scaled(preview.size(), Qt.KeepAspectRatio)
+            target = QRect(0, 0, scaled.width(), scaled.height())
+            target.moveCenter(preview.center())
+            painter.drawPixmap(target, pixmap)
+        else:
+            # "PDF" senza anteprima, "..." mentre viene caricata
+            painter.setPen(QColor("#999"))
+            painter.drawText(preview, Qt.AlignCenter, "..." if pixmap is None else "PDF")
+
+        font = QFont(base_font)
+        font.setBold(True)
+        font.setPixelSize(14)
+        painter.setFont(font)
+        painter.setPen(QColor("black"))
+        painter.drawText(title, Qt.AlignCenter, painter.fontMetrics().elidedText(product_id, Qt.ElideMiddle, title.width()))
+
+        font.setBold(False)
+        font.setPixelSize(11)
+        painter.setFont(font)
+        painter.setPen(QColor("#666"))
+        painter.drawText(status, Qt.AlignCenter, f"{points} punti calibrati")
+
+        font.setBold(True)
+        font.setPixelSize(12)
+        painter.setFont(font)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor("#007c91"))
+        painter.drawRoundedRect(button, 4, 4)
+        painter.setPen(QColor("white"))
+        painter.drawText(button, Qt.AlignCenter, "MODIFICA MASTER")
+        painter.end()
+        return image
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            if self._layout(option.rect)[4].contains(event.position().toPoint()):
+                self.edit_requested.emit(index.data())
+                return True
+        elif event.type() == QEvent.MouseButtonDblClick and event.button() == Qt.LeftButton:
+            self.edit_requested.emit(index.data())
+            return True
+        return super().editorEvent(event, model, option, index)
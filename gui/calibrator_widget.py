@@ -1,10 +1,12 @@
 import os
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
                              QLabel, QTableWidget, QTableWidgetItem, QHeaderView, 
-                             QSplitter, QMessageBox)
+                             QSplitter, QMessageBox, QComboBox)
 from PySide6.QtCore import Qt, Signal
+from PySide6.QtGui import QShortcut, QKeySequence
 from .map_viewer import ProductMapView
-from registry import ProductRegistry
+from registry import get_registry
+from tile_pyramid import pyramid_dir, MAP_RENDER_MODE
 
 class DrawingCalibratorWidget(QWidget):
     # Signals per l'interazione esterna
@@ -13,12 +15,13 @@ class DrawingCalibratorWidget(QWidget):
 
     def __init__(self, product_id, mode="MASTER", parent=None):
         super().__init__(parent)
-        self.registry = ProductRegistry()
+        self.registry = get_registry()
         self.product_id = product_id
         self.mode = mode # "MASTER" o "INTERVENTION"
+        self.page = 0 # Pagina del PDF mostrata (0-based)
         
         self.product_info = self.registry.get_product_info(product_id)
-        self.product_data = self.registry.get_product_data(product_id)
+        self.product_data = self.registry.get_product_data(product_id, self.page)
         
         self.setup_ui()
         self.setup_map_points()
@@ -39,6 +42,14 @@ class DrawingCalibratorWidget(QWidget):
         toolbar_layout.addWidget(QLabel(mode_text))
         toolbar_layout.addStretch()
         
+        # Selettore pagina, solo per i disegni multipagina: ogni pagina si carica quando viene scelta
+        page_count = self.registry.get_page_count(self.product_id)
+        if page_count > 1:
+            self.combo_page = QComboBox()
+            self.combo_page.addItems([f"Pagina {n + 1} di {page_count}" for n in range(page_count)])
+            self.combo_page.currentIndexChanged.connect(self.load_page)
+            toolbar_layout.addWidget(self.combo_page)
+        
         self.btn_mode_toggle = QPushButton("ABILITA CALIBRAZIONE")
         self.btn_mode_toggle.setCheckable(True)
         self.btn_mode_toggle.setFixedWidth(180)
@@ -69,11 +80,7 @@ class DrawingCalibratorWidget(QWidget):
         
         # Map View
         self.map_view = ProductMapView()
-        png_path = self.product_info['drawing_path'].replace('.pdf', '.png')
-        if os.path.exists(png_path):
-            self.map_view.load_image(png_path)
-        else:
-            self.map_view.load_image(self.product_info['drawing_path'])
+        self.load_page_image()
             
         self.map_view.componentSelected.connect(self.on_component_clicked)
         self.map_view.pointAddedManually.connect(self.on_point_added_manually)
@@ -95,6 +102,38 @@ class DrawingCalibratorWidget(QWidget):
         self.map_splitter.setStretchFactor(1, 1)
         
         main_layout.addWidget(self.map_splitter, 1)
+        
+        # Ctrl+Z: annulla l'ultima modifica (cella, punto aggiunto o eliminato) della pagina
+        QShortcut(QKeySequence.Undo, self, activated=self.undo_last_edit)
+
+    def load_page_image(self):
+        # Render vettoriale, tasselli, infine il PNG intero (PDF che QtPdf non apre)
+        drawing_path = self.product_info['drawing_path'] if self.product_info else None
+        if MAP_RENDER_MODE == 'vector' and drawing_path and drawing_path.lower().endswith('.pdf'):
+            if self.map_view.load_pdf(drawing_path, self.page):
+                return
+        if self.map_view.load_tiles(pyramid_dir(self.registry.drawings_dir, self.product_id, self.page)):
+            return
+        png_path = self.registry.get_page_image(self.product_id, self.page)
+        if png_path:
+            self.map_view.load_image(png_path)
+        else:
+            self.map_view.load_image(self.product_info['drawing_path'])
+
+    def load_page(self, page):
+        """ Passa a un'altra pagina del disegno, caricando solo immagine e dati di quella """
+        if page == self.page:
+            return
+        # Le posizioni trascinate ma non ancora salvate non vanno perse cambiando pagina
+        if self.btn_mode_toggle.isChecked():
+            self.registry.save_product_coords(self.product_id, self.map_view.get_all_points(), self.page)
+        
+        self.page = page
+        self.product_data = self.registry.get_product_data(self.product_id, self.page)
+        self.map_view.clear_points()
+        self.load_page_image()
+        self.setup_map_points()
+        self.populate_calib_list()
 
     def toggle_calibration_mode(self, checked):
         self.map_view.set_calibration_mode(checked)
@@ -126,12 +165,12 @@ class DrawingCalibratorWidget(QWidget):
         if pos_id in self.product_data:
             self.product_data[pos_id] = [new_code, new_desc]
             # Salva sempre nel master json
-            self.registry.save_product_data(self.product_id, self.product_data)
+            self.registry.save_product_data(self.product_id, self.product_data, self.page)
             
             # Opzionale: emettere un segnale che i dati sono cambiati se qualcuno fosse in ascolto
             
     def setup_map_points(self):
-        coords = self.registry.get_product_coords(self.product_id)
+        coords = self.registry.get_product_coords(self.product_id, self.page)
         for x, y, num in coords:
             pos_str = str(num)
             code, desc = self.product_data.get(pos_str, ("-", "???"))
@@ -140,15 +179,16 @@ class DrawingCalibratorWidget(QWidget):
 
     def save_calibration(self):
         coords = self.map_view.get_all_points()
-        if self.registry.save_product_coords(self.product_id, coords):
+        # Il salvataggio esplicito non aspetta la scrittura differita del registry
+        if self.registry.save_product_coords(self.product_id, coords, self.page) and self.registry.flush():
             QMessageBox.information(self, "OK", "Posizioni salvate.")
             self.btn_mode_toggle.setChecked(False)
 
     def on_point_added_manually(self, code):
         self.product_data[code] = ["", ""]
-        self.registry.save_product_data(self.product_id, self.product_data)
-        coords = self.map_view.get_all_points()
-        self.registry.save_product_coords(self.product_id, coords)
+        with self.registry.edit():
+            self.registry.save_product_data(self.product_id, self.product_data, self.page)
+            self.registry.save_product_coords(self.product_id, self.map_view.get_all_points(), self.page)
         self.populate_calib_list()
         
         for r in range(self.calib_list.rowCount()):
@@ -159,12 +199,20 @@ class DrawingCalibratorWidget(QWidget):
                 break
 
     def on_point_deleted_manually(self, pos_id):
-        if pos_id in self.product_data:
-            del self.product_data[pos_id]
-            self.registry.save_product_data(self.product_id, self.product_data)
-            
-        coords = self.map_view.get_all_points()
-        self.registry.save_product_coords(self.product_id, coords)
+        with self.registry.edit():
+            if pos_id in self.product_data:
+                del self.product_data[pos_id]
+                self.registry.save_product_data(self.product_id, self.product_data, self.page)
+                
+            self.registry.save_product_coords(self.product_id, self.map_view.get_all_points(), self.page)
+        self.populate_calib_list()
+
+    def undo_last_edit(self):
+        if not self.registry.undo(self.product_id, self.page):
+            return
+        self.product_data = self.registry.get_product_data(self.product_id, self.page)
+        self.map_view.clear_points()
+        self.setup_map_points()
         self.populate_calib_list()
 
     def on_component_clicked(self, pos_num):
@@ -0,0 +1,92 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+
+class InterventiTableModel(QAbstractTableModel):
+    """ Modello per la "Cronologia Interventi": carica le righe a pagine dal database
+        man mano che la vista scorre (canFetchMore/fetchMore), invece di materializzare
+        l'intero storico del prodotto. Ogni riga è un InterventoRow (vedi database.py).
+    """
+    HEADERS = ["Data", "Ore", "Descrizione Attività", "Componenti"]
+
+    def __init__(self, db, page_size=200, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.page_size = page_size
+        self._prodotto = None
+        self._rows = []
+        self._cursor = None
+        self._has_more = False
+        self.total_estimate = 0
+
+    def set_product(self, prodotto):
+        """ Azzera il modello e prepara la paginazione per il prodotto indicato.
+            La prima pagina viene richiesta dalla vista tramite fetchMore.
+        """
+        self.beginResetModel()
+        self._prodotto = prodotto
+        self._rows = []
+        self._cursor = None
+        self._has_more = bool(prodotto)
+        self.total_estimate = self.db.count_interventi(prodotto) if prodotto else 0
+        self.endResetModel()
+
+    def set_rows(self, prodotto, rows):
+        """ Mostra un insieme di righe già pronto (es. risultati di ricerca), senza paginazione """
+        self.beginResetModel()
+        self._prodotto = prodotto
+        self._rows = list(rows)
+        self._cursor = None
+        self._has_more = False
+        self.total_estimate = len(self._rows)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        # Le stringhe vengono composte solo per le celle che la vista sta disegnando
+        row = self._rows[index.row()]
+        col = index.column()
+        if col == 0:
+            return row.data.strftime("%d/%m/%Y %H:%M") if row.data else ""
+        if col == 1:
+            return f"{row.ore_lavoro} h"
+        if col == 2:
+            return row.descrizione or ""
+        return row.componenti
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or not self._has_more:
+            return
+        rows, self._cursor = self.db.get_interventi_page(self._prodotto, self._cursor, self.page_size)
+        self._has_more = self._cursor is not None
+        if not rows:
+            return
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def intervento_id(self, row):
+        """ Id dell'intervento mostrato alla riga indicata (None se fuori range) """
+        if 0 <= row < len(self._rows):
+            return self._rows[row].id
+        return None
+
+    def intervento_at(self, row):
+        if 0 <= row < len(self._rows):
+            return self._rows[row]
+        return None
@@ -1,23 +1,45 @@
 import os
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QTableWidget, QTableWidgetItem, 
-                             QHeaderView, QSplitter, QDialog, QFormLayout, 
+                             QTableView, QAbstractItemView, QHeaderView, QSplitter, QDialog, QFormLayout, 
                              QLineEdit, QDoubleSpinBox, QTextEdit, QComboBox, QMessageBox, QGroupBox,
-                             QTabWidget, QScrollArea, QFrame, QFileDialog)
-from PySide6.QtGui import QPixmap
-from PySide6.QtCore import Qt, QDate, QTimer
+                             QTabWidget, QListView, QFileDialog, QProgressBar)
+from PySide6.QtCore import Qt, QDate, QTimer, QObject, QRunnable, QThreadPool, Signal
 import shutil
 from .map_viewer import ProductMapView
-from database import DatabaseManager
-from registry import ProductRegistry
+from .history_model import InterventiTableModel
+from .archive_model import ArchiveListModel, ArchiveCardDelegate
+from registry import get_registry
+
+class _DatabaseSignals(QObject):
+    ready = Signal(object)
+    failed = Signal(str)
+
+class _DatabaseLoader(QRunnable):
+    """ Import di SQLAlchemy, create_all e migrazioni fuori dal thread della GUI """
+    def __init__(self, signals):
+        super().__init__()
+        self.signals = signals
+
+    def run(self):
+        try:
+            from database import DatabaseManager
+            db = DatabaseManager()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.ready.emit(db)
 
 class NewInterventionDialog(QDialog):
     def __init__(self, parent=None, product_id="VA50", existing_id=None):
         super().__init__(parent)
-        self.registry = ProductRegistry()
+        self.registry = get_registry()
+        # Il database è già aperto dalla finestra principale: qui è solo l'engine in cache
+        from database import DatabaseManager
         self.db = DatabaseManager()
         self.product_id = product_id
         self.existing_id = existing_id
+        self.existing_version = None
         
         # Make dialog resizable and maximizable
         self.setWindowFlags(self.windowFlags() | Qt.WindowMaximizeButtonHint)
@@ -114,9 +136,9 @@ class NewInterventionDialog(QDialog):
             self.load_existing_data(existing_id)
 
     def load_existing_data(self, existing_id):
-        interventi = self.db.get_interventi(self.product_id)
-        report = next((r for r in interventi if r.id == existing_id), None)
+        report = self.db.get_intervento(existing_id)
         if report:
+            self.existing_version = report.versione
             self.txt_desc.setText(report.descrizione or "")
             self.spin_hours.setValue(report.ore_lavoro)
             self.txt_notes.setPlainText(report.note_tecniche or "")
@@ -140,6 +162,8 @@ class NewInterventionDialog(QDialog):
         layout.addWidget(widget)
         
         calib_dialog.exec()
+        # Modifiche della calibrazione ancora in coda: scritte alla chiusura del dialogo
+        self.registry.flush()
         
     def on_component_selected_from_map(self, pos_str, code, desc):
         pos_num = pos_str # string compatibility
@@ -227,11 +251,40 @@ class MainWindow(QMainWindow):
         self.setBaseSize(1000, 700)
         self.resize(1000, 700)
         
-        self.db = DatabaseManager()
-        self.registry = ProductRegistry()
+        # Database e archivio arrivano dopo la comparsa della finestra (start_background_loading)
+        self.db = None
+        self.registry = get_registry()
+        self.watcher = None
+        self._db_signals = _DatabaseSignals()
+        self._db_signals.ready.connect(self.on_database_ready)
+        self._db_signals.failed.connect(self.on_database_failed)
         
         self.setup_ui()
+        self.set_database_actions_enabled(False)
+        self.lbl_history.setText("<b>Cronologia Interventi</b> (caricamento...)")
+        
+    def start_background_loading(self):
+        """ Seconda fase dell'avvio, a finestra già disegnata: l'archivio (schede e anteprime
+            si caricano quando diventano visibili) e il database in un thread del pool
+        """
+        self.refresh_archive_grid()
+        QThreadPool.globalInstance().start(_DatabaseLoader(self._db_signals))
+
+    def on_database_ready(self, db):
+        self.db = db
+        self.history_model.db = db
+        self.set_database_actions_enabled(True)
         self.load_interventi()
+        if self.tabs.currentWidget() is self.tab_statistiche:
+            self.refresh_statistiche()
+
+    def on_database_failed(self, message):
+        print(f"Error opening database: {message}")
+        self.lbl_history.setText(f"<b>Database non disponibile</b>: {message}")
+
+    def set_database_actions_enabled(self, enabled):
+        for widget in (self.txt_search, self.table, self.btn_edit, self.btn_delete, self.btn_new):
+            widget.setEnabled(enabled)
         
     def setup_ui(self):
         central_widget = QWidget()
@@ -257,6 +310,38 @@ class MainWindow(QMainWindow):
         tab_archivio = QWidget()
         self.setup_archivio_tab(tab_archivio)
         self.tabs.addTab(tab_archivio, "Archivio Master Disegni")
+        
+        # TAB 3: Statistiche ricambi (lette dalla tabella aggregata, sempre istantanee)
+        self.tab_statistiche = QWidget()
+        self.setup_statistiche_tab(self.tab_statistiche)
+        self.tabs.addTab(self.tab_statistiche, "Statistiche Ricambi")
+        self.tabs.currentChanged.connect(self.on_tab_changed)
+        
+        # Barra di stato: avanzamento dell'elaborazione disegni in background
+        self.lbl_ingestion = QLabel()
+        self.progress_ingestion = QProgressBar()
+        self.progress_ingestion.setFixedWidth(180)
+        self.progress_ingestion.setTextVisible(False)
+        self.statusBar().addPermanentWidget(self.lbl_ingestion)
+        self.statusBar().addPermanentWidget(self.progress_ingestion)
+        self.on_ingestion_progress(0, 0, 0)
+
+    def attach_watcher(self, watcher):
+        """ Collega il watcher dei disegni: prodotti pronti e avanzamento della coda """
+        self.watcher = watcher
+        watcher.new_product_ready.connect(self.on_new_product_ready)
+        watcher.product_removed.connect(self.on_products_changed)
+        watcher.product_renamed.connect(self.on_products_changed)
+        watcher.progress.connect(self.on_ingestion_progress)
+
+    def on_ingestion_progress(self, done, total, running):
+        active = total > 0
+        self.lbl_ingestion.setVisible(active)
+        self.progress_ingestion.setVisible(active)
+        if active:
+            self.lbl_ingestion.setText(f"Elaborazione disegni: {done}/{total} ({running} in corso)")
+            self.progress_ingestion.setRange(0, total)
+            self.progress_ingestion.setValue(done)
 
     def setup_interventi_tab(self, parent_widget):
         main_layout = QVBoxLayout(parent_widget)
@@ -289,14 +374,34 @@ class MainWindow(QMainWindow):
         table_layout = QVBoxLayout(table_container)
         table_layout.setContentsMargins(15, 15, 15, 5)
         
-        table_layout.addWidget(QLabel("<b>Cronologia Interventi</b>"))
-        
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["Data", "Ore", "Descrizione Attività", "Componenti"])
+        history_header = QHBoxLayout()
+        self.lbl_history = QLabel("<b>Cronologia Interventi</b>")
+        history_header.addWidget(self.lbl_history)
+        history_header.addStretch()
+        
+        # Ricerca incrementale: il timer raggruppa i tasti premuti in rapida successione
+        self.txt_search = QLineEdit()
+        self.txt_search.setPlaceholderText("Cerca in descrizioni e note tecniche...")
+        self.txt_search.setClearButtonEnabled(True)
+        self.txt_search.setFixedWidth(350)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.load_interventi)
+        self.txt_search.textChanged.connect(lambda _: self.search_timer.start())
+        history_header.addWidget(self.txt_search)
+        table_layout.addLayout(history_header)
+        
+        # Modello paginato: la vista richiede nuove pagine solo quando si scorre in fondo
+        self.history_model = InterventiTableModel(self.db, parent=self)
+        self.table = QTableView()
+        self.table.setModel(self.history_model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # Altezza righe fissa: la vista non deve misurare il contenuto di ogni riga
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.setWordWrap(False)
         self.table.setAlternatingRowColors(True)
         self.table.doubleClicked.connect(self.edit_intervention)
         table_layout.addWidget(self.table)
@@ -341,10 +446,10 @@ class MainWindow(QMainWindow):
         
         action_layout.addSpacing(20)
         
-        btn_new = QPushButton("CREA NUOVO RAPPORTO DI ASSISTENZA")
-        btn_new.clicked.connect(self.open_new_intervention)
-        btn_new.setMinimumHeight(60)
-        btn_new.setStyleSheet("""
+        self.btn_new = QPushButton("CREA NUOVO RAPPORTO DI ASSISTENZA")
+        self.btn_new.clicked.connect(self.open_new_intervention)
+        self.btn_new.setMinimumHeight(60)
+        self.btn_new.setStyleSheet("""
             QPushButton {
                 background-color: #007c91;
                 color: white;
@@ -355,7 +460,7 @@ class MainWindow(QMainWindow):
             }
             QPushButton:hover { background-color: #005662; }
         """)
-        action_layout.addWidget(btn_new, 2)
+        action_layout.addWidget(self.btn_new, 2)
         
         main_layout.addLayout(action_layout)
 
@@ -377,6 +482,24 @@ class MainWindow(QMainWindow):
 
     def on_new_product_ready(self, base_name):
         """ Riceve l'evento dal Watcher di sfondo quando un PDF è stato analizzato """
+        # Coordinate e dati appena scritti dall'OCR: la cache del registry va riletta
+        self.registry.invalidate(base_name)
+        self.reload_products()
+        # Miniatura appena generata (o rigenerata per un PDF modificato)
+        self.archive_model.invalidate(base_name)
+        self.refresh_archive_grid()
+        
+        if self.combo_stats_product.findData(base_name) < 0:
+            self.combo_stats_product.addItem(base_name, base_name)
+
+    def on_products_changed(self, *names):
+        """ Un PDF è stato eliminato o rinominato nella cartella disegni """
+        self.registry.invalidate(*names)
+        self.archive_model.invalidate(*names)
+        self.reload_products()
+        self.refresh_archive_grid()
+
+    def reload_products(self):
         # Ricarichiamo i prodotti interni dal registry
         self.registry.scan_products()
         
@@ -391,38 +514,38 @@ class MainWindow(QMainWindow):
             self.combo_products.setCurrentText(current)
 
     def edit_intervention(self):
-        row = self.table.currentRow()
-        if row < 0: return
+        report_id = self.history_model.intervento_id(self.table.currentIndex().row())
+        if report_id is None: return
+        from database import ConflittoModificaError
         
-        # Get ID from data if stored or find by index
         try:
-            interventi = self.db.get_interventi(self.combo_products.currentText())
-            report = interventi[row]
-            
-            dialog = NewInterventionDialog(self, product_id=self.combo_products.currentText(), existing_id=report.id)
+            dialog = NewInterventionDialog(self, product_id=self.combo_products.currentText(), existing_id=report_id)
             if dialog.exec():
                 data = dialog.get_data()
                 self.db.update_intervento(
-                    report.id,
+                    report_id,
                     data['ore'],
                     data['note'],
                     data['descrizione'],
-                    data['componenti']
+                    data['componenti'],
+                    versione=dialog.existing_version
                 )
                 self.load_interventi()
+        except ConflittoModificaError:
+            QMessageBox.warning(self, "Rapporto modificato",
+                                "Il rapporto è stato modificato da un altro utente mentre era aperto.\n"
+                                "Le modifiche non sono state salvate: riapri il rapporto e riprova.")
+            self.load_interventi()
         except Exception as e:
             print(f"Error editing: {e}")
 
     def delete_selected_intervention(self):
-        row = self.table.currentRow()
-        if row < 0:
+        report = self.history_model.intervento_at(self.table.currentIndex().row())
+        if report is None:
             QMessageBox.warning(self, "Attenzione", "Seleziona un intervento da eliminare.")
             return
             
         try:
-            interventi = self.db.get_interventi(self.combo_products.currentText())
-            report = interventi[row]
-            
             confirm = QMessageBox.question(
                 self, "Conferma Eliminazione",
                 f"Sei sicuro di voler eliminare l'intervento del {report.data.strftime('%d/%m/%Y')}?",
@@ -439,20 +562,91 @@ class MainWindow(QMainWindow):
             print(f"Error deleting: {e}")
 
     def load_interventi(self):
+        if self.db is None:
+            return
         try:
             cur_product = self.combo_products.currentText()
-            interventi = self.db.get_interventi(cur_product)
-            self.table.setRowCount(len(interventi))
-            for i, inv in enumerate(interventi):
-                self.table.setItem(i, 0, QTableWidgetItem(inv.data.strftime("%d/%m/%Y %H:%M")))
-                self.table.setItem(i, 1, QTableWidgetItem(f"{inv.ore_lavoro} h"))
-                self.table.setItem(i, 2, QTableWidgetItem(inv.descrizione or ""))
-                
-                details = [f"{c.numero_componente} x{c.quantita}" for c in inv.componenti]
-                self.table.setItem(i, 3, QTableWidgetItem(", ".join(details) if details else "-"))
+            query = self.txt_search.text().strip()
+            if query:
+                results = self.db.cerca_interventi(query, cur_product) if cur_product else []
+                self.history_model.set_rows(cur_product, results)
+                title = "Risultati Ricerca"
+            else:
+                self.history_model.set_product(cur_product)
+                title = "Cronologia Interventi"
+            self.lbl_history.setText(f"<b>{title}</b> ({self.history_model.total_estimate})")
         except Exception as e:
             print(f"Error loading history: {e}")
 
+    # --------- STATISTICHE RICAMBI ---------
+    
+    def setup_statistiche_tab(self, parent_widget):
+        layout = QVBoxLayout(parent_widget)
+        
+        header_layout = QHBoxLayout()
+        header_layout.setContentsMargins(15, 10, 15, 10)
+        
+        title_label = QLabel("CONSUMO RICAMBI PER COMPONENTE")
+        title_label.setStyleSheet("font-size: 18px; font-weight: bold; color: #007c91;")
+        header_layout.addWidget(title_label)
+        header_layout.addStretch()
+        
+        header_layout.addWidget(QLabel("Prodotto:"))
+        self.combo_stats_product = QComboBox()
+        self.combo_stats_product.setFixedWidth(250)
+        self.combo_stats_product.addItem("Tutti i prodotti", "")
+        for prod_id in self.registry.get_available_products():
+            self.combo_stats_product.addItem(prod_id, prod_id)
+        self.combo_stats_product.currentIndexChanged.connect(self.refresh_statistiche)
+        header_layout.addWidget(self.combo_stats_product)
+        
+        header_layout.addWidget(QLabel("Periodo:"))
+        self.combo_stats_period = QComboBox()
+        self.combo_stats_period.addItem("Tutto lo storico", 0)
+        self.combo_stats_period.addItem("Ultimi 12 mesi", 12)
+        self.combo_stats_period.addItem("Ultimi 3 mesi", 3)
+        self.combo_stats_period.currentIndexChanged.connect(self.refresh_statistiche)
+        header_layout.addWidget(self.combo_stats_period)
+        
+        layout.addLayout(header_layout)
+        
+        self.stats_table = QTableWidget()
+        self.stats_table.setColumnCount(6)
+        self.stats_table.setHorizontalHeaderLabels(["Prodotto", "Codice", "Descrizione", "Sostituzioni", "Quantità", "Ore Medie"])
+        self.stats_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.stats_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.stats_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.stats_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.stats_table.setAlternatingRowColors(True)
+        layout.addWidget(self.stats_table)
+
+    def on_tab_changed(self, index):
+        if self.tabs.widget(index) is self.tab_statistiche:
+            self.refresh_statistiche()
+
+    def refresh_statistiche(self):
+        if self.db is None:
+            return
+        try:
+            prodotto = self.combo_stats_product.currentData()
+            months = self.combo_stats_period.currentData()
+            mese_da = None
+            if months:
+                today = QDate.currentDate().addMonths(-(months - 1))
+                mese_da = f"{today.year():04d}-{today.month():02d}"
+            
+            rows = self.db.get_statistiche_componenti(prodotto, mese_da=mese_da)
+            self.stats_table.setRowCount(len(rows))
+            for i, r in enumerate(rows):
+                self.stats_table.setItem(i, 0, QTableWidgetItem(r.prodotto))
+                self.stats_table.setItem(i, 1, QTableWidgetItem(r.codice_componente))
+                self.stats_table.setItem(i, 2, QTableWidgetItem(r.descrizione_componente or ""))
+                self.stats_table.setItem(i, 3, QTableWidgetItem(str(r.conteggio)))
+                self.stats_table.setItem(i, 4, QTableWidgetItem(f"{r.quantita_totale:g}"))
+                self.stats_table.setItem(i, 5, QTableWidgetItem(f"{r.ore_medie:.2f} h"))
+        except Exception as e:
+            print(f"Error loading statistics: {e}")
+
     # --------- NUOVA SEZIONE: ARCHIVIO MASTER ---------
     
     def setup_archivio_tab(self, parent_widget):
@@ -475,79 +669,27 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(header_layout)
         
-        # Griglia
-        self.grid_scroll = QScrollArea()
-        self.grid_scroll.setWidgetResizable(True)
-        self.grid_scroll.setStyleSheet("QScrollArea { border: none; background-color: #f5f5f5; }")
-        
-        self.grid_container = QWidget()
-        self.grid_container.setStyleSheet("background-color: #f5f5f5;")
-        from PySide6.QtWidgets import QGridLayout
-        self.grid_layout = QGridLayout(self.grid_container)
-        self.grid_layout.setSpacing(15)
-        self.grid_layout.setContentsMargins(15, 15, 15, 15)
-        self.grid_layout.setAlignment(Qt.AlignTop | Qt.AlignLeft)
-        
-        self.grid_scroll.setWidget(self.grid_container)
-        layout.addWidget(self.grid_scroll)
-        
-        self.refresh_archive_grid()
+        # Griglia virtualizzata: le schede sono disegnate dal delegate solo quando visibili
+        self.archive_model = ArchiveListModel(self.registry, parent=self)
+        self.archive_view = QListView()
+        self.archive_view.setViewMode(QListView.IconMode)
+        self.archive_view.setResizeMode(QListView.Adjust)
+        self.archive_view.setMovement(QListView.Static)
+        self.archive_view.setUniformItemSizes(True)
+        self.archive_view.setSpacing(15)
+        self.archive_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.archive_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.archive_view.setMouseTracking(True)
+        self.archive_view.setStyleSheet("QListView { border: none; background-color: #f5f5f5; }")
+        archive_delegate = ArchiveCardDelegate(self.archive_view)
+        archive_delegate.edit_requested.connect(self.open_master_calibrator)
+        self.archive_view.setItemDelegate(archive_delegate)
+        self.archive_view.setModel(self.archive_model)
+        layout.addWidget(self.archive_view)
         
     def refresh_archive_grid(self):
-        # Svuota griglia
-        while self.grid_layout.count():
-            child = self.grid_layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
-                
-        products = self.registry.get_available_products()
-        
-        cols = 4 # Numero di colonne desiderate
-        for i, prod_id in enumerate(products):
-            info = self.registry.get_product_info(prod_id)
-            card = self.create_drawing_card(prod_id, info)
-            self.grid_layout.addWidget(card, i // cols, i % cols)
-            
-    def create_drawing_card(self, prod_id, info):
-        card = QFrame()
-        card.setFixedSize(220, 260)
-        card.setStyleSheet("""
-            QFrame { background-color: white; border: 1px solid #ddd; border-radius: 8px; }
-            QFrame:hover { border: 2px solid #007c91; }
-        """)
-        c_layout = QVBoxLayout(card)
-        c_layout.setContentsMargins(10, 10, 10, 10)
-        
-        lbl_preview = QLabel()
-        lbl_preview.setFixedSize(198, 140)
-        lbl_preview.setStyleSheet("border: 1px solid #eee; background-color: #fafafa;")
-        lbl_preview.setAlignment(Qt.AlignCenter)
-        
-        png_path = info['drawing_path'].replace('.pdf', '.png')
-        if os.path.exists(png_path):
-            pix = QPixmap(png_path)
-            lbl_preview.setPixmap(pix.scaled(lbl_preview.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
-        else:
-            lbl_preview.setText("PDF")
-        c_layout.addWidget(lbl_preview)
-        
-        lbl_title = QLabel(prod_id)
-        lbl_title.setStyleSheet("font-weight: bold; font-size: 14px; border: none;")
-        lbl_title.setAlignment(Qt.AlignCenter)
-        c_layout.addWidget(lbl_title)
-        
-        calib_count = len(self.registry.get_product_coords(prod_id))
-        lbl_status = QLabel(f"{calib_count} punti calibrati")
-        lbl_status.setStyleSheet("color: #666; font-size: 11px; border: none;")
-        lbl_status.setAlignment(Qt.AlignCenter)
-        c_layout.addWidget(lbl_status)
-        
-        btn_edit = QPushButton("MODIFICA MASTER")
-        btn_edit.setStyleSheet("background-color: #007c91; color: white; font-weight: bold; border-radius: 4px; padding: 5px;")
-        btn_edit.clicked.connect(lambda _, pid=prod_id: self.open_master_calibrator(pid))
-        c_layout.addWidget(btn_edit)
-        
-        return card
+        # Le anteprime già caricate restano nella cache del modello
+        self.archive_model.set_products(self.registry.get_available_products())
 
     def upload_new_drawing(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Seleziona Disegno Tecnico", "", "PDF/Immagini (*.pdf *.png *.jpg *.jpeg)")
@@ -557,8 +699,12 @@ class MainWindow(QMainWindow):
         dest_path = os.path.join(self.registry.drawings_dir, base_name)
         
         try:
-            shutil.copy2(file_path, dest_path)
-            # Il watcher farà l'OCR. Noi aggiorniamo al volo la UI
+            # Copia su ".part" e rinomina atomica: il watcher non vede mai un PDF a metà
+            shutil.copy2(file_path, dest_path + '.part')
+            os.replace(dest_path + '.part', dest_path)
+            # Il watcher farà l'OCR, con precedenza sugli arretrati in coda
+            if self.watcher:
+                self.watcher.prioritize(dest_path)
             QMessageBox.information(self, "Upload Esterno", f"File '{base_name}' caricato con successo. Attendi l'elaborazione se è un PDF.")
         except Exception as e:
             QMessageBox.critical(self, "Errore", f"Impossibile copiare: {e}")
@@ -577,6 +723,7 @@ class MainWindow(QMainWindow):
         layout.addWidget(widget)
         
         dialog.exec()
+        self.registry.flush()
         
         # Al ritorno aggiorniamo lo status sulla griglia e nei combobox
         self.refresh_archive_grid()
@@ -1,48 +1,56 @@
 import os
+import math
+import struct
+from collections import OrderedDict
+from functools import lru_cache
 from PySide6.QtWidgets import (QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, 
-                             QGraphicsEllipseItem, QGraphicsTextItem, QGraphicsItem)
-from PySide6.QtCore import Qt, QRectF, Signal, QObject, QTimer
-from PySide6.QtGui import QPixmap, QColor, QPen, QBrush, QPainter, QFont
+                             QGraphicsEllipseItem, QGraphicsItem,
+                             QGraphicsObject, QStyleOptionGraphicsItem, QRubberBand)
+from PySide6.QtCore import (Qt, QRectF, QRect, QSize, QPointF, Signal, Slot, QObject, QTimer,
+                            QRunnable, QThreadPool, QByteArray, QDataStream, QIODevice)
+from PySide6.QtGui import (QPixmap, QImage, QColor, QPen, QBrush, QPainter, QPainterPath, QFont,
+                           QRawFont, QGlyphRun)
+from tile_pyramid import RENDER_SCALE, tile_path, load_pyramid
+from .point_store import PointStore
+
+# Distanza massima (pixel a schermo) per agganciare un clic al palloncino più vicino
+SNAP_PIXELS = 12
+
+# Sotto questa scala (pixel a schermo per unità scena) i numeri nei palloncini non sono
+# leggibili: si disegnano solo i cerchi
+LABEL_MIN_LOD = 0.3
 
 class ClickableScene(QGraphicsScene):
     point_clicked = Signal(str)
     point_deleted = Signal(str)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.marker_layer = None # MarkerLayer che disegna i MapPoint di questa scena
 
 class MapPoint(QGraphicsEllipseItem):
+    """ Palloncino interattivo (hover, clic, trascinamento, tooltip). Non si disegna da sé:
+        tutti i palloncini sono dipinti in un'unica passata dal MarkerLayer della scena.
+    """
+    RADIUS = 18
+    
     def __init__(self, x, y, number, description="", parent=None):
-        self.radius = 18 
+        self.radius = self.RADIUS
         super().__init__(-self.radius, -self.radius, self.radius*2, self.radius*2)
         self.setPos(x, y)
         self.number = str(number)
         self.description = description
+        self.store = None # PointStore che indicizza il punto (vedi itemChange)
+        self.hovered = False
+        self.calibration = False
+        self.painted = None # (stile, x, y) con cui il MarkerLayer lo ha disegnato
         self.setAcceptHoverEvents(True)
         
         # Flags
-        self.setFlag(QGraphicsItem.ItemIsMovable, False)
-        self.setFlag(QGraphicsItem.ItemSendsGeometryChanges, True)
+        self.setFlags(QGraphicsItem.ItemSendsGeometryChanges | QGraphicsItem.ItemHasNoContents)
         self.setZValue(10)
-        
-        # Appearance
-        self.idle_brush = QBrush(QColor(0, 124, 145, 30))
-        self.hover_brush = QBrush(QColor(0, 124, 145, 100))
-        self.calib_brush = QBrush(QColor(255, 165, 0, 120))
-        self.pen_idle = QPen(QColor(0, 124, 145), 1)
-        self.pen_calib = QPen(QColor(255, 140, 0), 2)
-        
-        self.setBrush(self.idle_brush)
-        self.setPen(self.pen_idle)
         self.setCursor(Qt.PointingHandCursor)
         
-        # Visible Number
-        self.label = QGraphicsTextItem(str(number), self)
-        self.label.setDefaultTextColor(Qt.black)
-        font = QFont("Segoe UI", 9, QFont.Bold)
-        self.label.setFont(font)
-        
-        # Center the label
-        rect = self.label.boundingRect()
-        self.label.setPos(-rect.width()/2, -rect.height()/2)
-        
         self.update_tooltip()
 
     def update_tooltip(self):
@@ -51,31 +59,53 @@ class MapPoint(QGraphicsEllipseItem):
             text += f"\n{self.description}"
         self.setToolTip(text)
 
+    def style(self):
+        """ Chiave dello stile con cui il MarkerLayer disegna il punto """
+        if self.calibration:
+            return 'selected' if self.isSelected() else 'calib'
+        return 'hover' if self.hovered else 'idle'
+
+    def refresh(self):
+        scene = self.scene()
+        if isinstance(scene, ClickableScene) and scene.marker_layer is not None:
+            scene.marker_layer.update_point(self)
+
     def set_calibration_style(self, enabled):
-        self.setFlag(QGraphicsItem.ItemIsMovable, enabled)
+        if enabled == self.calibration:
+            return
+        # Selezionabili (a rettangolo) solo in calibrazione: i selezionati si spostano insieme
+        self.setFlags(self.flags() | QGraphicsItem.ItemIsMovable | QGraphicsItem.ItemIsSelectable if enabled
+                      else self.flags() & ~(QGraphicsItem.ItemIsMovable | QGraphicsItem.ItemIsSelectable))
+        if not enabled and self.isSelected():
+            self.setSelected(False)
+        self.calibration = enabled
         if enabled:
-            self.setBrush(self.calib_brush)
-            self.setPen(self.pen_calib)
-            self.label.setDefaultTextColor(Qt.white)
             text = f"POSIZIONE {self.number}"
             if self.description:
                 text += f"\n{self.description}"
             text += "\n(Doppio clic per eliminare)"
             self.setToolTip(text)
         else:
-            self.setBrush(self.idle_brush)
-            self.setPen(self.pen_idle)
-            self.label.setDefaultTextColor(Qt.black)
             self.update_tooltip()
+        self.refresh()
+
+    def itemChange(self, change, value):
+        if change == QGraphicsItem.ItemPositionHasChanged:
+            if self.store is not None:
+                self.store.update(self)
+            self.refresh()
+        elif change == QGraphicsItem.ItemSelectedHasChanged:
+            self.refresh()
+        return super().itemChange(change, value)
 
     def hoverEnterEvent(self, event):
-        if not self.flags() & QGraphicsItem.ItemIsMovable:
-            self.setBrush(self.hover_brush)
+        self.hovered = True
+        self.refresh()
         super().hoverEnterEvent(event)
 
     def hoverLeaveEvent(self, event):
-        if not self.flags() & QGraphicsItem.ItemIsMovable:
-            self.setBrush(self.idle_brush)
+        self.hovered = False
+        self.refresh()
         super().hoverLeaveEvent(event)
 
     def mousePressEvent(self, event):
@@ -109,6 +139,399 @@ class MapPoint(QGraphicsEllipseItem):
             return
         super().mouseDoubleClickEvent(event)
 
+class MarkerLayer(QGraphicsItem):
+    """ Disegna tutti i MapPoint dei blocchi esposti: per stile un path dei cerchi e un
+        QGlyphRun dei numeri, quindi poche chiamate al painter per frame anche con molti punti.
+    """
+    STYLES = {
+        # stile: (penna, pennello, colore del numero)
+        'idle': (QPen(QColor(0, 124, 145), 1), QBrush(QColor(0, 124, 145, 30)), QColor(Qt.black)),
+        'hover': (QPen(QColor(0, 124, 145), 1), QBrush(QColor(0, 124, 145, 100)), QColor(Qt.black)),
+        'calib': (QPen(QColor(255, 140, 0), 2), QBrush(QColor(255, 165, 0, 120)), QColor(Qt.white)),
+        'selected': (QPen(QColor(200, 60, 0), 3), QBrush(QColor(255, 120, 0, 190)), QColor(Qt.white)),
+    }
+    ORDER = ('idle', 'calib', 'hover', 'selected')
+    FONT = QFont("Segoe UI", 9, QFont.Bold)
+    BLOCK = 128 # lato dei blocchi, in unità scena
+    
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self._bounds = QRectF()
+        self._blocks = {}  # (stile, col, riga) -> (cerchi serializzati, glifi, posizioni dei glifi)
+        self._cache = {}   # blocchi visibili -> (cerchi, numeri) pronti per il painter
+        self._dirty = set()
+        self._shapes = {}  # numero -> (x, y, cerchio serializzato, glifi)
+        self._font = None
+        self.setZValue(10)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        # Durante il pan Qt fa scorrere la cache e ridisegna solo le strisce scoperte
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+
+    def boundingRect(self):
+        return self._bounds
+
+    def shape(self):
+        return QPainterPath()
+
+    def set_bounds(self, rect):
+        """ Area coperta: lo sfondo con un margine, per i punti trascinati fuori dal foglio """
+        self.prepareGeometryChange()
+        self._bounds = rect.adjusted(-rect.width() / 2, -rect.height() / 2, rect.width() / 2, rect.height() / 2)
+
+    def _block_key(self, painted):
+        style, x, y = painted
+        return style, math.floor(x / self.BLOCK), math.floor(y / self.BLOCK)
+
+    def update_point(self, point):
+        pos = point.pos()
+        previous, point.painted = point.painted, (point.style(), pos.x(), pos.y())
+        if previous == point.painted:
+            return
+        self._dirty.add(self._block_key(point.painted))
+        self._repaint_at(pos.x(), pos.y())
+        if previous is not None:
+            self._dirty.add(self._block_key(previous))
+            self._repaint_at(previous[1], previous[2])
+
+    def remove_point(self, point):
+        if point.painted is not None:
+            self._dirty.add(self._block_key(point.painted))
+            self._repaint_at(point.painted[1], point.painted[2])
+            point.painted = None
+
+    def invalidate(self):
+        self._dirty.update(self._blocks)
+        self.update()
+
+    def _repaint_at(self, x, y):
+        # Un po' più largo del cerchio: comprende la penna più spessa
+        r = MapPoint.RADIUS + 3
+        self.update(QRectF(x - r, y - r, 2 * r, 2 * r))
+
+    def paint(self, painter, option, widget=None):
+        if self._dirty:
+            self._rebuild()
+        r = MapPoint.RADIUS + 3
+        area = option.exposedRect.adjusted(-r, -r, r, r)
+        cols = range(math.floor(area.left() / self.BLOCK), math.floor(area.right() / self.BLOCK) + 1)
+        rows = range(math.floor(area.top() / self.BLOCK), math.floor(area.bottom() / self.BLOCK) + 1)
+        layers = []
+        for style in self.ORDER:
+            keys = tuple(key for key in ((style, col, row) for col in cols for row in rows) if key in self._blocks)
+            if keys:
+                layers.append((style, self._merged(keys)))
+        
+        for style, (circles, _) in layers:
+            pen, brush, _ = self.STYLES[style]
+            painter.setPen(pen)
+            painter.setBrush(brush)
+            painter.drawPath(circles)
+        
+        if QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform()) < LABEL_MIN_LOD:
+            return
+        for style, (_, labels) in layers:
+            painter.setPen(self.STYLES[style][2])
+            painter.drawGlyphRun(QPointF(0, 0), labels)
+
+    def _merged(self, keys):
+        """ (path dei cerchi, QGlyphRun dei numeri) dei blocchi indicati, in cache """
+        merged = self._cache.get(keys)
+        if merged is None:
+            if len(self._cache) >= 64:
+                self._cache.clear()
+            blocks = [self._blocks[key] for key in keys]
+            labels = QGlyphRun()
+            labels.setRawFont(self._font)
+            labels.setGlyphIndexes([glyph for block in blocks for glyph in block[1]])
+            labels.setPositions([pos for block in blocks for pos in block[2]])
+            merged = self._cache[keys] = (_build_path([block[0] for block in blocks]), labels)
+        return merged
+
+    def _rebuild(self):
+        dirty, self._dirty = self._dirty, set()
+        self._cache.clear()
+        members = {key: [] for key in dirty}
+        for col, row in {(col, row) for _, col, row in dirty}:
+            for point in self.store.in_rect(col * self.BLOCK, row * self.BLOCK,
+                                            (col + 1) * self.BLOCK, (row + 1) * self.BLOCK):
+                key = self._block_key(point.painted) if point.painted else None
+                if key in members:
+                    members[key].append(self._shape(point))
+        for key, shapes in members.items():
+            if not shapes:
+                self._blocks.pop(key, None)
+                continue
+            circle_data = b''.join(shape[2][0] for shape in shapes)
+            self._blocks[key] = ((circle_data, sum(shape[2][1] for shape in shapes)),
+                                 [glyph for shape in shapes for glyph in shape[3][0]],
+                                 [pos for shape in shapes for pos in shape[3][1]])
+        if len(self._shapes) > 2 * len(self.store):
+            self._shapes = {number: shape for number, shape in self._shapes.items() if number in self.store}
+
+    def _shape(self, point):
+        """ Cerchio serializzato e glifi (indici, posizioni) del numero, in coordinate scena """
+        _, x, y = point.painted
+        cached = self._shapes.get(point.number)
+        if cached and cached[0] == x and cached[1] == y:
+            return cached
+        if self._font is None:
+            self._font = QRawFont.fromFont(self.FONT)
+        glyphs = self._font.glyphIndexesForString(point.number)
+        advances = [advance.x() for advance in self._font.advancesForGlyphIndexes(glyphs)]
+        left = x - sum(advances) / 2
+        baseline = y + (self._font.ascent() - self._font.descent()) / 2
+        positions = []
+        for advance in advances:
+            positions.append(QPointF(left, baseline))
+            left += advance
+        circle = _pack([(t, ex + x, ey + y) for t, ex, ey in _circle_elements(MapPoint.RADIUS)])
+        self._shapes[point.number] = shape = (x, y, circle, (glyphs, positions))
+        return shape
+
+# Path letti da QDataStream invece di un addEllipse per punto (PySide6 6.12 perde un riferimento
+# a None per ogni chiamata void). Formato: int32 n, n x (int32 tipo, double x, double y), int32, int32.
+_ELEMENT = struct.Struct('>idd')
+
+def _pack(elements):
+    return b''.join(_ELEMENT.pack(*element) for element in elements), len(elements)
+
+def _build_path(shapes):
+    """ Un QPainterPath con tutte le forme ((dati, numero di elementi) da _pack) """
+    chunks, count, last_start = [], 0, 0
+    for data, size in shapes:
+        if size:
+            last_start = count
+            chunks.append(data)
+            count += size
+    path = QPainterPath()
+    if count:
+        data = struct.pack('>i', count) + b''.join(chunks) + struct.pack('>ii', last_start, int(Qt.WindingFill.value))
+        QDataStream(QByteArray(data)) >> path
+    return path
+
+@lru_cache(maxsize=None)
+def _circle_elements(radius):
+    path = QPainterPath()
+    path.addEllipse(QPointF(0, 0), radius, radius)
+    data = QByteArray()
+    QDataStream(data, QIODevice.WriteOnly) << path
+    raw = data.data()
+    return tuple(_ELEMENT.iter_unpack(raw[4:4 + path.elementCount() * _ELEMENT.size]))
+
+class TiledDrawingItem(QGraphicsItem):
+    """ Sfondo della mappa a tasselli (vedi tile_pyramid): livello adatto allo zoom, solo i
+        tasselli visibili, gli ultimi usati in una cache LRU.
+    """
+    CACHE_TILES = 96
+
+    def __init__(self, directory, manifest, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.tile_size = manifest['tile_size']
+        self.scene_scale = manifest['scene_scale']
+        self._rect = QRectF(0, 0, manifest['width'], manifest['height'])
+        # [(scala, (colonne, righe))] dalla più piccola alla più grande
+        self._levels = sorted((float(scale), (info[2], info[3])) for scale, info in manifest['levels'].items())
+        self._sizes = {float(scale): (info[0], info[1]) for scale, info in manifest['levels'].items()}
+        self._tiles = OrderedDict()
+        self._mosaic = None # (livello e tasselli, immagine)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+    def boundingRect(self):
+        return self._rect
+
+    def level_for(self, view_scale):
+        """ Il livello più piccolo che dà almeno un pixel di tassello per pixel di schermo """
+        needed = view_scale * self.scene_scale
+        for scale, grid in self._levels:
+            if scale >= needed:
+                return scale, grid
+        return self._levels[-1]
+
+    def paint(self, painter, option, widget=None):
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        scale, (cols, rows) = self.level_for(lod)
+        unit = self.scene_scale / scale # unità di scena per pixel del livello
+        span = self.tile_size * unit
+        
+        visible = option.exposedRect
+        if widget is not None:
+            visible = painter.worldTransform().inverted()[0].mapRect(QRectF(widget.rect()))
+        visible = visible.intersected(self._rect)
+        if visible.isEmpty():
+            return
+        first_col, last_col = int(visible.left() // span), min(cols - 1, int(math.ceil(visible.right() / span)) - 1)
+        first_row, last_row = int(visible.top() // span), min(rows - 1, int(math.ceil(visible.bottom() / span)) - 1)
+        
+        # Un solo drawImage per frame: il mosaico si ricompone solo quando cambiano i tasselli
+        key = (scale, first_col, last_col, first_row, last_row)
+        if self._mosaic is None or self._mosaic[0] != key:
+            self._mosaic = (key, self._compose(scale, first_col, last_col, first_row, last_row))
+        image = self._mosaic[1]
+        painter.drawImage(QRectF(first_col * span, first_row * span, image.width() * unit, image.height() * unit),
+                          image)
+
+    def _compose(self, scale, first_col, last_col, first_row, last_row):
+        level_width, level_height = self._sizes[scale]
+        left, top = first_col * self.tile_size, first_row * self.tile_size
+        image = QImage(min(level_width, (last_col + 1) * self.tile_size) - left,
+                       min(level_height, (last_row + 1) * self.tile_size) - top, QImage.Format_RGB32)
+        image.fill(Qt.white)
+        mosaic_painter = QPainter(image)
+        for row in range(first_row, last_row + 1):
+            for col in range(first_col, last_col + 1):
+                pixmap = self.tile(scale, col, row)
+                if pixmap is not None:
+                    mosaic_painter.drawPixmap(col * self.tile_size - left, row * self.tile_size - top, pixmap)
+        mosaic_painter.end()
+        return image
+
+    def tile(self, scale, col, row):
+        key = (scale, col, row)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+        
+        pixmap = QPixmap(tile_path(self.directory, scale, col, row))
+        pixmap = None if pixmap.isNull() else pixmap
+        self._tiles[key] = pixmap
+        while len(self._tiles) > self.CACHE_TILES:
+            self._tiles.popitem(last=False)
+        return pixmap
+
+class PdfRenderSignals(QObject):
+    rendered = Signal(float, QRectF, QImage)
+
+class PdfRenderJob(QRunnable):
+    """ Render di una porzione di pagina (rect in punti PDF) a una scala in pixel per punto.
+        Ogni job apre il proprio QPdfDocument (pochi ms): nessun oggetto Qt condiviso tra thread.
+    """
+    def __init__(self, pdf_path, page, scale, rect):
+        super().__init__()
+        self.pdf_path = pdf_path
+        self.page = page
+        self.scale = scale
+        self.rect = rect
+        self.signals = PdfRenderSignals()
+
+    def run(self):
+        from PySide6.QtPdf import QPdfDocument, QPdfDocumentRenderOptions
+        doc = QPdfDocument()
+        doc.load(self.pdf_path)
+        if doc.status() != QPdfDocument.Status.Ready:
+            self.signals.rendered.emit(self.scale, QRectF(), QImage())
+            return
+        
+        size = doc.pagePointSize(self.page)
+        left, top = math.floor(self.rect.left() * self.scale), math.floor(self.rect.top() * self.scale)
+        clip = QRect(left, top,
+                     max(1, math.ceil(self.rect.right() * self.scale) - left),
+                     max(1, math.ceil(self.rect.bottom() * self.scale) - top))
+        options = QPdfDocumentRenderOptions()
+        options.setScaledSize(QSize(round(size.width() * self.scale), round(size.height() * self.scale)))
+        options.setScaledClipRect(clip)
+        image = doc.render(self.page, clip.size(), options)
+        
+        rendered_rect = QRectF(clip.x() / self.scale, clip.y() / self.scale,
+                               clip.width() / self.scale, clip.height() / self.scale)
+        self.signals.rendered.emit(self.scale, rendered_rect, image)
+
+class PdfPageItem(QGraphicsObject):
+    """ Sfondo vettoriale: la parte visibile renderizzata dal PDF allo zoom corrente, in un
+        thread del pool. La scena resta nello spazio RENDER_SCALE delle .coords.json.
+    """
+    PREVIEW_SCALE = 1.0
+    MAX_RENDERS = 6
+    MAX_PIXELS = 24_000_000 # un render non supera ~96 MB anche a zoom estremi
+    MARGIN = 0.25 # margine renderizzato attorno alla vista, per i piccoli spostamenti
+
+    def __init__(self, pdf_path, page, page_size, scene_scale=RENDER_SCALE, parent=None):
+        super().__init__(parent)
+        self.pdf_path = pdf_path
+        self.page = page
+        self.scene_scale = scene_scale
+        self._page_rect = QRectF(0, 0, page_size.width(), page_size.height()) # punti PDF
+        self._rect = QRectF(0, 0, page_size.width() * scene_scale, page_size.height() * scene_scale)
+        self._renders = [] # [(scala, rect in punti, immagine)] dal più vecchio al più recente
+        self._job = None
+        self._pending = None
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption, True)
+        
+        self._submit(self.PREVIEW_SCALE, self._page_rect)
+
+    def boundingRect(self):
+        return self._rect
+
+    def _to_points(self, rect):
+        k = 1 / self.scene_scale
+        return QRectF(rect.x() * k, rect.y() * k, rect.width() * k, rect.height() * k)
+
+    def _to_scene(self, rect):
+        k = self.scene_scale
+        return QRectF(rect.x() * k, rect.y() * k, rect.width() * k, rect.height() * k)
+
+    def paint(self, painter, option, widget=None):
+        exposed = option.exposedRect.intersected(self._rect)
+        exposed_pt = self._to_points(exposed)
+        # Dal più recente indietro, fino al primo che copre l'area
+        layers = []
+        for scale, rect, image in reversed(self._renders):
+            if rect.intersects(exposed_pt):
+                layers.append((rect, image))
+                if rect.contains(exposed_pt):
+                    break
+        else:
+            painter.fillRect(exposed, Qt.white)
+        for rect, image in reversed(layers):
+            painter.drawImage(self._to_scene(rect), image)
+        
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        scale = round(lod * self.scene_scale, 3)
+        visible = exposed
+        if widget is not None:
+            visible = painter.worldTransform().inverted()[0].mapRect(QRectF(widget.rect())).intersected(self._rect)
+        visible_pt = self._to_points(visible)
+        if not self._covered(scale, visible_pt):
+            self._schedule(scale, visible_pt)
+
+    def _covered(self, scale, rect):
+        # Un render fino al doppio della scala richiesta resta nitido una volta ridotto
+        return any(scale <= s <= scale * 2 and r.contains(rect) for s, r, _ in self._renders)
+
+    def _schedule(self, scale, visible):
+        dx, dy = visible.width() * self.MARGIN, visible.height() * self.MARGIN
+        rect = visible.adjusted(-dx, -dy, dx, dy).intersected(self._page_rect)
+        if rect.width() * rect.height() * scale * scale > self.MAX_PIXELS:
+            rect = visible
+        # Un solo render alla volta: le richieste intermedie (zoom/pan rapidi) si sovrascrivono
+        if self._job is not None:
+            self._pending = (scale, rect)
+            return
+        self._submit(scale, rect)
+
+    def _submit(self, scale, rect):
+        self._job = PdfRenderJob(self.pdf_path, self.page, scale, rect)
+        self._job.signals.rendered.connect(self._on_rendered)
+        QThreadPool.globalInstance().start(self._job)
+
+    @Slot(float, QRectF, QImage)
+    def _on_rendered(self, scale, rect, image):
+        self._job = None
+        if not image.isNull():
+            self._renders.append((scale, rect, image))
+            # L'anteprima (prima voce) resta sempre come sfondo di riserva
+            if len(self._renders) > self.MAX_RENDERS:
+                del self._renders[1]
+            self.update()
+        
+        if self._pending:
+            scale, rect = self._pending
+            self._pending = None
+            if not self._covered(scale, rect):
+                self._submit(scale, rect)
+
 class ProductMapView(QGraphicsView):
     componentSelected = Signal(str)
     pointAddedManually = Signal(str)
@@ -118,7 +541,7 @@ class ProductMapView(QGraphicsView):
         super().__init__(parent)
         self._clickable_scene = ClickableScene(self)
         self._clickable_scene.point_clicked.connect(self.on_point_clicked)
-        self._clickable_scene.point_deleted.connect(self.pointDeletedManually.emit)
+        self._clickable_scene.point_deleted.connect(self._on_point_deleted)
         self.setScene(self._clickable_scene)
         
         # Rendering Quality
@@ -133,6 +556,12 @@ class ProductMapView(QGraphicsView):
         self.setAlignment(Qt.AlignCenter)
         
         self.pixmap_item = None
+        self.points = PointStore()
+        self.marker_layer = MarkerLayer(self.points)
+        self._clickable_scene.marker_layer = self.marker_layer
+        self._clickable_scene.addItem(self.marker_layer)
+        self._rubber_band = None
+        self._rubber_origin = None
         self._zoom_level = 0
         self._calibration_mode = False
         self._is_panning = False
@@ -148,9 +577,8 @@ class ProductMapView(QGraphicsView):
 
     def set_calibration_mode(self, enabled):
         self._calibration_mode = enabled
-        for item in self._clickable_scene.items():
-            if isinstance(item, MapPoint):
-                item.set_calibration_style(enabled)
+        for item in self.points.items():
+            item.set_calibration_style(enabled)
         
         # In calibration mode, we disable ScrollHandDrag (Left-click) to allow dragging points.
         # But we still support Right-Click panning.
@@ -168,29 +596,36 @@ class ProductMapView(QGraphicsView):
             event.accept()
             return
 
+        if event.button() == Qt.LeftButton and self._is_background(self.itemAt(event.pos())):
+            if self._calibration_mode:
+                # Selezione a rettangolo per spostare più punti insieme
+                self._clickable_scene.clearSelection()
+                self._rubber_origin = event.pos()
+                if self._rubber_band is None:
+                    self._rubber_band = QRubberBand(QRubberBand.Rectangle, self.viewport())
+                self._rubber_band.setGeometry(QRect(event.pos(), QSize()))
+                self._rubber_band.show()
+                event.accept()
+                return
+            # Zoom basso: palloncini di pochi pixel, il clic vicino vale come clic sul punto
+            point = self.point_near(event.pos())
+            if point is not None:
+                self.on_point_clicked(point.number)
+                event.accept()
+                return
+
         super().mousePressEvent(event)
 
     def mouseDoubleClickEvent(self, event):
         if self._calibration_mode and event.button() == Qt.LeftButton:
             item = self.itemAt(event.pos())
             # Aggiunge nuovo punto solo se clicchiamo sul vuoto o sull'immagine di background
-            if item is None or isinstance(item, QGraphicsPixmapItem):
+            # (e non a ridosso di un punto esistente: sarebbe un doppione)
+            if self._is_background(item) and self.point_near(event.pos()) is None:
                 scene_pos = self.mapToScene(event.pos())
                 
-                # Trova il primo numero progressivo disponibile (riempie i "buchi")
-                used_ids = set()
-                for pt in self._clickable_scene.items():
-                    if isinstance(pt, MapPoint):
-                        try:
-                            used_ids.add(int(pt.number))
-                        except ValueError:
-                            pass
-                            
-                new_id = 1
-                while new_id in used_ids:
-                    new_id += 1
-                    
-                new_id_str = str(new_id)
+                # Primo numero progressivo disponibile (riempie i "buchi")
+                new_id_str = str(self.points.allocate_id())
                 self.add_point(scene_pos.x(), scene_pos.y(), new_id_str, "Componente aggiunto manualmente")
                 self.pointAddedManually.emit(new_id_str)
                 event.accept()
@@ -205,6 +640,10 @@ class ProductMapView(QGraphicsView):
             self._last_mouse_pos = event.pos()
             event.accept()
             return
+        if self._rubber_origin is not None:
+            self._rubber_band.setGeometry(QRect(self._rubber_origin, event.pos()).normalized())
+            event.accept()
+            return
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
@@ -213,20 +652,70 @@ class ProductMapView(QGraphicsView):
             self.setCursor(Qt.ArrowCursor if self._calibration_mode else Qt.OpenHandCursor)
             event.accept()
             return
+        if event.button() == Qt.LeftButton and self._rubber_origin is not None:
+            self._rubber_band.hide()
+            area = self.mapToScene(QRect(self._rubber_origin, event.pos()).normalized()).boundingRect()
+            self._rubber_origin = None
+            self.select_points(area)
+            event.accept()
+            return
         super().mouseReleaseEvent(event)
 
+    @staticmethod
+    def _is_background(item):
+        return item is None or isinstance(item, (QGraphicsPixmapItem, TiledDrawingItem, PdfPageItem))
+
+    def point_near(self, view_pos, pixels=SNAP_PIXELS):
+        """ Punto più vicino alla posizione a schermo, entro `pixels` dal bordo del palloncino """
+        scene_pos = self.mapToScene(view_pos)
+        view_scale = self.transform().m11() or 1
+        point, _ = self.points.nearest(scene_pos.x(), scene_pos.y(), pixels / view_scale + MapPoint.RADIUS)
+        return point
+
+    def select_points(self, rect):
+        """ Seleziona i punti con il centro nel rettangolo (coordinate scena) """
+        self._clickable_scene.clearSelection()
+        selected = self.points.in_rect(rect.left(), rect.top(), rect.right(), rect.bottom())
+        for point in selected:
+            point.setSelected(True)
+        return selected
+
     def load_image(self, path):
         if not os.path.exists(path):
             print(f"Errore: {path} non trovato")
             return
             
         pixmap = QPixmap(path)
+        self._set_background(QGraphicsPixmapItem(pixmap))
+
+    def load_tiles(self, directory):
+        """ Usa la piramide di tasselli come sfondo; False se non è (ancora) stata generata """
+        manifest = load_pyramid(directory)
+        if not manifest:
+            return False
+        self._set_background(TiledDrawingItem(directory, manifest))
+        return True
+
+    def load_pdf(self, pdf_path, page=0):
+        """ Sfondo renderizzato dal PDF allo zoom corrente; False se QtPdf non riesce ad aprirlo """
+        # QtPdf (pdfium) si carica alla prima mappa aperta, non all'avvio
+        from PySide6.QtPdf import QPdfDocument
+        doc = QPdfDocument()
+        doc.load(pdf_path)
+        if doc.status() != QPdfDocument.Status.Ready or page >= doc.pageCount():
+            return False
+        self._set_background(PdfPageItem(pdf_path, page, doc.pagePointSize(page)))
+        return True
+
+    def _set_background(self, item):
         if self.pixmap_item:
             self._clickable_scene.removeItem(self.pixmap_item)
             
-        self.pixmap_item = self._clickable_scene.addPixmap(pixmap)
+        self.pixmap_item = item
         self.pixmap_item.setZValue(-1)
-        self._clickable_scene.setSceneRect(QRectF(pixmap.rect()))
+        self._clickable_scene.addItem(self.pixmap_item)
+        self._clickable_scene.setSceneRect(self.pixmap_item.boundingRect())
+        self.marker_layer.set_bounds(self.pixmap_item.boundingRect())
         
         self.reset_view()
 
@@ -239,13 +728,29 @@ class ProductMapView(QGraphicsView):
     def add_point(self, x, y, number, description=""):
         point = MapPoint(x, y, number, description)
         point.set_calibration_style(self._calibration_mode)
+        old = self.points.get(point.number)
+        if old is not None:
+            self.marker_layer.remove_point(old)
+            self._clickable_scene.removeItem(old)
         self._clickable_scene.addItem(point)
+        self.points.add(point)
+        point.refresh()
+
+    def clear_points(self):
+        for item in self.points.items():
+            self._clickable_scene.removeItem(item)
+        self.points.clear()
+        self.marker_layer.invalidate()
+
+    def _on_point_deleted(self, number):
+        # Fuori dall'indice prima di avvisare: chi ascolta rilegge get_all_points()
+        point = self.points.remove(number)
+        if point is not None:
+            self.marker_layer.remove_point(point)
+        self.pointDeletedManually.emit(number)
 
     def get_all_points(self):
-        points = []
-        for item in self._clickable_scene.items():
-            if isinstance(item, MapPoint):
-                points.append([round(item.pos().x()), round(item.pos().y()), item.number])
+        points = [[round(item.pos().x()), round(item.pos().y()), item.number] for item in self.points.items()]
         # Sort by number for clean JSON
         points.sort(key=lambda x: x[2])
         return points
@@ -0,0 +1,154 @@
+import heapq
+import math
+
+# Lato delle celle della griglia, in coordinate scena (spazio RENDER_SCALE): qualche
+# diametro di palloncino, così una ricerca di vicinanza tocca poche celle
+CELL_SIZE = 128
+
+
+class PointStore:
+    """ Indice dei MapPoint di una mappa: numero -> item, più una griglia uniforme per le
+        ricerche spaziali (punto più vicino, punti in un rettangolo). I numeri interi liberi
+        stanno in un heap, così il primo id disponibile ("buchi" compresi) non richiede di
+        scorrere tutti i punti. Gli item avvisano lo store quando vengono spostati (update).
+    """
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self._items = {}  # numero (str) -> item
+        self._cells = {}  # (col, row) -> set di numeri
+        self._where = {}  # numero -> cella in cui è indicizzato
+        self._free = []   # heap di id interi liberati o saltati (con cancellazione pigra)
+        self._next_id = 1 # primo id mai assegnato
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, number):
+        return str(number) in self._items
+
+    def get(self, number):
+        return self._items.get(str(number))
+
+    def items(self):
+        return list(self._items.values())
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def add(self, item):
+        number = item.number
+        if number in self._items:
+            self.remove(number)
+        self._items[number] = item
+        item.store = self
+        self._index(number, item.pos().x(), item.pos().y())
+        if number.isdigit():
+            n = int(number)
+            # Gli id saltati diventano buchi da riempire
+            for hole in range(self._next_id, n):
+                heapq.heappush(self._free, hole)
+            self._next_id = max(self._next_id, n + 1)
+
+    def remove(self, number):
+        item = self._items.pop(str(number), None)
+        if item is None:
+            return None
+        item.store = None
+        cell = self._where.pop(item.number)
+        self._cells[cell].discard(item.number)
+        if not self._cells[cell]:
+            del self._cells[cell]
+        if item.number.isdigit():
+            heapq.heappush(self._free, int(item.number))
+        return item
+
+    def clear(self):
+        for item in self._items.values():
+            item.store = None
+        self._items.clear()
+        self._cells.clear()
+        self._where.clear()
+        self._free.clear()
+        self._next_id = 1
+
+    def update(self, item):
+        """ Da chiamare quando l'item cambia posizione """
+        if self._items.get(item.number) is not item:
+            return
+        cell = self._cell(item.pos().x(), item.pos().y())
+        old = self._where[item.number]
+        if cell != old:
+            self._cells[old].discard(item.number)
+            if not self._cells[old]:
+                del self._cells[old]
+            self._index(item.number, item.pos().x(), item.pos().y())
+
+    def _index(self, number, x, y):
+        cell = self._cell(x, y)
+        self._cells.setdefault(cell, set()).add(number)
+        self._where[number] = cell
+
+    def allocate_id(self):
+        """ Il più piccolo id intero non usato (non viene riservato: lo occupa l'add successivo) """
+        while self._free and str(self._free[0]) in self._items:
+            heapq.heappop(self._free)
+        return self._free[0] if self._free else self._next_id
+
+    def nearest(self, x, y, max_distance=None):
+        """ (item, distanza) del punto più vicino a (x, y), o (None, None).
+            Visita la griglia ad anelli crescenti attorno alla cella di (x, y).
+        """
+        if not self._items:
+            return None, None
+        col, row = self._cell(x, y)
+        if max_distance is not None:
+            max_ring = math.ceil(max_distance / self.cell_size)
+        else:
+            cols = [c for c, _ in self._cells]
+            rows = [r for _, r in self._cells]
+            max_ring = max(abs(col - min(cols)), abs(col - max(cols)), abs(row - min(rows)), abs(row - max(rows)))
+
+        best, best_dist = None, math.inf
+        for ring in range(max_ring + 1):
+            # Oltre questo anello nessun punto può essere più vicino di quello trovato
+            if best is not None and best_dist <= (ring - 1) * self.cell_size:
+                break
+            for cell in self._ring(col, row, ring):
+                for number in self._cells.get(cell, ()):
+                    pos = self._items[number].pos()
+                    dist = math.hypot(pos.x() - x, pos.y() - y)
+                    if dist < best_dist:
+                        best, best_dist = self._items[number], dist
+        if best is None or (max_distance is not None and best_dist > max_distance):
+            return None, None
+        return best, best_dist
+
+    @staticmethod
+    def _ring(col, row, ring):
+        if ring == 0:
+            yield (col, row)
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (c, row - ring)
+            yield (c, row + ring)
+        for r in range(row - ring + 1, row + ring):
+            yield (col - ring, r)
+            yield (col + ring, r)
+
+    def in_rect(self, left, top, right, bottom):
+        """ Item con la posizione (centro) dentro il rettangolo, in coordinate scena """
+        c0, r0 = self._cell(left, top)
+        c1, r1 = self._cell(right, bottom)
+        found = []
+        # Rettangoli più grandi delle celle occupate: conviene scorrere le celle esistenti
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self._cells):
+            cells = [cell for cell in self._cells if c0 <= cell[0] <= c1 and r0 <= cell[1] <= r1]
+        else:
+            cells = [(c, r) for c in range(c0, c1 + 1) for r in range(r0, r1 + 1)]
+        for cell in cells:
+            for number in self._cells.get(cell, ()):
+                pos = self._items[number].pos()
+                if left <= pos.x() <= right and top <= pos.y() <= bottom:
+                    found.append(self._items[number])
+        return found
@@ -1,6 +1,8 @@
 import sys
 import os
+import multiprocessing
 from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QTimer
 from gui import MainWindow
 from watcher import DrawingsWatcher
 
@@ -10,9 +12,6 @@ def main():
     
     app = QApplication(sys.argv)
     
-    # Inizializza il watcher silente in background
-    watcher = DrawingsWatcher(parent=app)
-    
     # Light Theme - High Contrast for legibility
     app.setStyleSheet("""
         QMainWindow { background-color: #f5f5f5; }
@@ -24,7 +23,7 @@ def main():
             border-radius: 4px;
         }
         QPushButton:hover { background-color: #f0f0f0; border-color: #00bcd4; }
-        QTableWidget { 
+        QTableWidget, QTableView { 
             background-color: #ffffff; 
             border: 1px solid #cccccc; 
             gridline-color: #eeeeee;
@@ -50,14 +49,25 @@ def main():
         }
     """)
     
+    # Avvio a fasi: prima la finestra (con segnaposto), poi database e archivio in
+    # background, infine il watcher, che può accodare l'OCR degli arretrati
     window = MainWindow()
-    
-    # Colleghiamo il segnale del watcher alla finestra per aggiornare la UI
-    watcher.new_product_ready.connect(window.on_new_product_ready)
-    
     window.show()
+    app.processEvents()
+    window.start_background_loading()
+    # Le modifiche di calibrazione in coda finiscono nel catalogo prima dell'uscita
+    app.aboutToQuit.connect(window.registry.flush)
+    
+    def start_watcher():
+        watcher = DrawingsWatcher(parent=app)
+        # Colleghiamo i segnali del watcher alla finestra per aggiornare la UI
+        window.attach_watcher(watcher)
+        app.aboutToQuit.connect(watcher.scheduler.shutdown)
+    QTimer.singleShot(0, start_watcher)
     
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    # Necessario per i processi di elaborazione disegni nell'eseguibile Windows
+    multiprocessing.freeze_support()
     main()
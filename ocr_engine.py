@@ -1,33 +1,83 @@
 import os
+import re
 import json
+import math
+import time
+import threading
 import traceback
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 from pypdf import PdfReader
-from PySide6.QtCore import QSize
+from PySide6.QtCore import QSize, QRect
 from PySide6.QtGui import QImage, QPainter
-from PySide6.QtPdf import QPdfDocument
+from PySide6.QtPdf import QPdfDocument, QPdfDocumentRenderOptions
 from PySide6.QtWidgets import QApplication
 import sys
+from render_cache import RenderCache
+from balloon_detector import BalloonDetector, HOUGH_AVAILABLE
+from bom_extractor import BomExtractor
+from registry import page_file_name, thumbnail_path, THUMB_SIZE
+from tile_pyramid import (RENDER_SCALE, TILE_SIZE, PYRAMID_SCALES, pyramid_dir, tile_path, level_grid,
+                          load_pyramid, save_pyramid, MAP_RENDER_MODE)
 
-# Per i fallback OCR (richiedono Tesseract e Poppler installati a sistema)
+# Per il fallback OCR (richiede Tesseract installato a sistema; Pillow è una dipendenza di pytesseract).
+# La pagina viene renderizzata con QtPdf, quindi Poppler/pdf2image non servono più.
 try:
     import pytesseract
-    from pdf2image import convert_from_path
+    from PIL import Image
     OCR_AVAILABLE = True
 except ImportError:
     OCR_AVAILABLE = False
 
+# Sotto questo numero di palloncini il foglio non li usa (o non li si è trovati): si torna ai testi
+MIN_BALLOONS = 3
+BALLOON_DPI = 200
+
+# Parametri del fallback OCR raster
+OCR_DPI = 300          # i codici dei disegni scansionati sono alti ~2 mm: ~25 px a 300 dpi
+OCR_TILE = 1600        # lato dei tasselli passati a Tesseract in parallelo
+OCR_OVERLAP = 120      # sovrapposizione, più larga della parola più lunga attesa
+OCR_MIN_CONF = 55
+OCR_CONFIG = "--oem 1 --psm 11 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZx.,-/"
+
+# Distinta base sui disegni scansionati: una lettura senza filtro caratteri (servono le descrizioni)
+BOM_OCR_DPI = 200
+BOM_OCR_CONFIG = "--oem 1 --psm 11"
+
 class OcrEngine:
-    def __init__(self, tesseract_cmd=None):
+    def __init__(self, tesseract_cmd=None, keep_png=False):
+        """ keep_png=True: salva anche il PNG a piena pagina (la mappa usa il render vettoriale o i tasselli) """
         if tesseract_cmd and OCR_AVAILABLE:
             pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+        self.keep_png = keep_png
+        self.balloon_detector = BalloonDetector()
+        self.bom_extractor = BomExtractor()
+        # Secondi per fase dell'ultimo process_drawing, sommati su tutte le pagine
+        self.timings = {}
+        self._timings_lock = threading.Lock()
 
-    def render_to_png(self, pdf_path, output_png_path, scale_factor=3):
-        """ Renderizza il PDF in un file PNG ad alta risoluzione (usando PySide6 QtPdf) """
-        
+    @contextlib.contextmanager
+    def _timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Le pagine girano in thread diversi: più fasi uguali si sommano
+            with self._timings_lock:
+                self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    @staticmethod
+    def _ensure_app():
         # Ensure QApplication exists (since QPdfDocument needs it)
         app = QApplication.instance()
         if not app:
             app = QApplication(sys.argv)
+        return app
+
+    def render_to_png(self, pdf_path, output_png_path, scale_factor=3, page=0):
+        """ Renderizza una pagina del PDF in un file PNG ad alta risoluzione (usando PySide6 QtPdf) """
+        
+        self._ensure_app()
             
         doc = QPdfDocument()
         status = doc.load(pdf_path)
@@ -36,12 +86,12 @@ class OcrEngine:
             print(f"[OCR] Impossibile caricare il PDF per render: {pdf_path}")
             return False, 0
             
-        page_size = doc.pagePointSize(0)
+        page_size = doc.pagePointSize(page)
         original_height = page_size.height()
         
         render_size = QSize(page_size.width() * scale_factor, original_height * scale_factor)
         
-        image = doc.render(0, render_size)
+        image = doc.render(page, render_size)
         if image.save(output_png_path):
             print(f"[OCR] Renderizzato con successo: {output_png_path}")
             return True, original_height
@@ -49,10 +99,91 @@ class OcrEngine:
             print(f"[OCR] Fallito salvataggio render: {output_png_path}")
             return False, 0
 
-    def extract_vector_coords(self, pdf_path, original_height, scale_factor=3):
-        """ Estrae le coordinate matematiche dei testi dal PDF (Fast Path) """
+    def page_height(self, pdf_path, page=0):
+        """ Altezza della pagina in punti PDF (serve a ribaltare l'asse Y delle coordinate) """
+        self._ensure_app()
+        doc = QPdfDocument()
+        doc.load(pdf_path)
+        if doc.status() != QPdfDocument.Status.Ready:
+            print(f"[OCR] Impossibile caricare il PDF: {pdf_path}")
+            return None
+        return doc.pagePointSize(page).height()
+
+    def render_tile_pyramid(self, pdf_path, tiles_dir, page=0, pdf_hash=None, scales=PYRAMID_SCALES):
+        """ Renderizza la pagina in tasselli TILE_SIZE x TILE_SIZE per ogni livello di scala.
+            pdfium renderizza una striscia alta un tassello per volta (clip), poi tagliata:
+            la memoria resta quella di una striscia anche per tavole A0 a scala 6, e le
+            immagini raster incorporate vengono decodificate una volta per riga, non per tassello.
+        """
+        manifest = load_pyramid(tiles_dir)
+        if manifest and pdf_hash and manifest.get('sha256') == pdf_hash and manifest.get('page') == page:
+            return True
+        
+        self._ensure_app()
+        doc = QPdfDocument()
+        doc.load(pdf_path)
+        if doc.status() != QPdfDocument.Status.Ready:
+            print(f"[OCR] Impossibile caricare il PDF per i tasselli: {pdf_path}")
+            return False
+        
+        page_size = doc.pagePointSize(page)
+        levels = {}
+        for scale in scales:
+            width, height, cols, rows = level_grid(page_size.width(), page_size.height(), scale)
+            os.makedirs(os.path.dirname(tile_path(tiles_dir, scale, 0, 0)), exist_ok=True)
+            options = QPdfDocumentRenderOptions()
+            options.setScaledSize(QSize(width, height))
+            for row in range(rows):
+                band = QRect(0, row * TILE_SIZE, width, min(TILE_SIZE, height - row * TILE_SIZE))
+                options.setScaledClipRect(band)
+                strip = doc.render(page, band.size(), options)
+                for col in range(cols):
+                    tile = strip.copy(col * TILE_SIZE, 0, min(TILE_SIZE, width - col * TILE_SIZE), band.height())
+                    # Qualità 80 = compressione zlib veloce: metà tempo di codifica, file ~20% più grandi
+                    if not tile.save(tile_path(tiles_dir, scale, col, row), 'PNG', 80):
+                        print(f"[OCR] Fallito salvataggio tassello {col},{row} scala {scale:g}: {tiles_dir}")
+                        return False
+            levels[f"{scale:g}"] = [width, height, cols, rows]
+        
+        # Il manifest per ultimo: la mappa usa la piramide solo quando è completa
+        save_pyramid(tiles_dir, {
+            'sha256': pdf_hash, 'page': page, 'tile_size': TILE_SIZE, 'scene_scale': RENDER_SCALE,
+            'width': int(page_size.width() * RENDER_SCALE), 'height': int(page_size.height() * RENDER_SCALE),
+            'levels': levels
+        })
+        print(f"[OCR] Piramide tasselli generata: {tiles_dir}")
+        return True
+
+    def render_thumbnail(self, pdf_path, thumb_path, cache, pdf_hash):
+        """ Miniatura della prima pagina per l'archivio (al più THUMB_SIZE), rigenerata solo se il PDF cambia """
+        size_key = f"{THUMB_SIZE[0]}x{THUMB_SIZE[1]}"
+        if cache.lookup(thumb_path, pdf_hash, page=0, scale=size_key):
+            return True
+        
+        self._ensure_app()
+        doc = QPdfDocument()
+        doc.load(pdf_path)
+        if doc.status() != QPdfDocument.Status.Ready:
+            print(f"[OCR] Impossibile caricare il PDF per la miniatura: {pdf_path}")
+            return False
+        
+        # pdfium renderizza direttamente alla dimensione finale, senza passare dal PNG grande
+        page_size = doc.pagePointSize(0)
+        factor = min(THUMB_SIZE[0] / page_size.width(), THUMB_SIZE[1] / page_size.height())
+        image = doc.render(0, QSize(max(1, round(page_size.width() * factor)), max(1, round(page_size.height() * factor))))
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        if not image.save(thumb_path):
+            print(f"[OCR] Fallito salvataggio miniatura: {thumb_path}")
+            return False
+        cache.store(thumb_path, pdf_hash, page=0, scale=size_key)
+        return True
+
+    def extract_vector_coords(self, pdf_path, original_height, scale_factor=3, page_index=0, exclude=()):
+        """ Estrae le coordinate matematiche dei testi dal PDF (Fast Path).
+            exclude: aree (x0, y0, x1, y1) in punti PDF da ignorare, es. la distinta base.
+        """
         reader = PdfReader(pdf_path)
-        page = reader.pages[0]
+        page = reader.pages[page_index]
         
         positions = {}
         
@@ -66,6 +197,11 @@ class OcrEngine:
             
             # Filtro visivo: Se il testo è lungo 1-25 caratteri e contiene almeno una lettera/numero
             if 1 <= len(val) <= 25 and any(c.isalnum() for c in val):
+                # Le celle della distinta non sono marker sul disegno
+                page_x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+                page_y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+                if any(x0 <= page_x <= x1 and y0 <= page_y <= y1 for x0, y0, x1, y1 in exclude):
+                    return
                 # Rimuoviamo il ritorno a capo o la spaziatura estrema per tenerla pulita nel JSON
                 key = clean_text.replace('\n', ' ')
                 if key not in positions:
@@ -92,6 +228,11 @@ class OcrEngine:
             # Struttura temporanea
             final_points.append((img_x, img_y, key))
             
+        return self._number_points(final_points)
+
+    @staticmethod
+    def _number_points(final_points):
+        """ Da [(x, y, testo)] alle strutture di .coords.json e .data.json """
         # Ordiniamo prima di tutto per posizione Y visiva per assegnare ID logici (top to bottom)
         final_points.sort(key=lambda t: (t[1], t[0]))
         
@@ -107,65 +248,368 @@ class OcrEngine:
             
         return final_coords, initial_data_map
 
-    def extract_ocr_image(self, pdf_path):
-        """ Fallback visivo completo usando Tesseract. Molto più lento, ma trova testo rasterizzato.
-            Al momento implementa solo uno sketch di base da ampliare in futuro se necessario. 
+    def extract_balloons(self, pdf_path, original_height, scale_factor=3, page_index=0):
+        """ Posizioni dai palloncini numerati: l'id è il numero stampato nel cerchio.
+            Vettoriale prima; per i disegni scansionati cerchi di Hough sul raster, se disponibile.
+        """
+        balloons = self.balloon_detector.detect_vector(pdf_path, page_index)
+        if len(balloons) < MIN_BALLOONS and HOUGH_AVAILABLE:
+            gray = self._render_gray(pdf_path, page_index, BALLOON_DPI)
+            if gray is not None:
+                balloons = self.balloon_detector.detect_raster(gray, BALLOON_DPI / 72, original_height)
+        if len(balloons) < MIN_BALLOONS:
+            return [], {}
+        
+        final_coords, initial_data_map = [], {}
+        for b in balloons:
+            number = int(b.number) if b.number.isdigit() else b.number
+            final_coords.append([round(b.x * scale_factor), round((original_height - b.y) * scale_factor), number])
+            initial_data_map[str(number)] = ["-", f"Componente {number}"]
+        low = sum(1 for b in balloons if b.confidence < 0.75)
+        print(f"[OCR] Trovati {len(balloons)} palloncini di posizione ({low} con confidenza < 0.75)")
+        return final_coords, initial_data_map
+
+    def _render_gray(self, pdf_path, page, dpi):
+        """ Pagina renderizzata a `dpi` in scala di grigi (QImage Grayscale8), o None """
+        self._ensure_app()
+        doc = QPdfDocument()
+        doc.load(pdf_path)
+        if doc.status() != QPdfDocument.Status.Ready:
+            print(f"[OCR] Impossibile caricare il PDF: {pdf_path}")
+            return None
+        page_size = doc.pagePointSize(page)
+        image = doc.render(page, QSize(round(page_size.width() * dpi / 72), round(page_size.height() * dpi / 72)))
+        return image.convertToFormat(QImage.Format_Grayscale8)
+
+    def extract_ocr_image(self, pdf_path, page=0, dpi=OCR_DPI, scale_factor=3):
+        """ Fallback visivo per i disegni scansionati: render a `dpi`, binarizzazione (Otsu),
+            raddrizzamento, Tesseract sui tasselli in parallelo limitato ai caratteri dei codici.
+            Ritorna le stesse strutture di extract_vector_coords, nello spazio a scale_factor.
         """
         if not OCR_AVAILABLE:
-            print("[OCR] Librerie OCR (pytesseract/pdf2image) non installate. Salto fallback visivo.")
+            print("[OCR] Librerie OCR (pytesseract/Pillow) non installate. Salto fallback visivo.")
             return [], {}
             
         print("[OCR] Fallback OCR Image in partenza (LENTO)...")
-        # DA IMPLEMENTARE SE NECESSARIO
-        # pages = convert_from_path(pdf_path, 300)
-        # data = pytesseract.image_to_data(pages[0], output_type=pytesseract.Output.DICT)
-        return [], {}
+        start = time.perf_counter()
+        prepared = self._binarized_page(pdf_path, page, dpi)
+        if prepared is None:
+            return [], {}
+        binary, threshold, angle = prepared
+        
+        tiles = []
+        step = OCR_TILE - OCR_OVERLAP
+        for top in range(0, binary.height, step):
+            for left in range(0, binary.width, step):
+                box = (left, top, min(left + OCR_TILE, binary.width), min(top + OCR_TILE, binary.height))
+                tiles.append((binary.crop(box), left, top))
+        
+        # Tesseract gira in un processo esterno: i thread lavorano davvero in parallelo
+        try:
+            with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+                words = [w for tile_words in pool.map(lambda t: self._ocr_tile(*t), tiles) for w in tile_words]
+        except pytesseract.TesseractNotFoundError:
+            print("[OCR] Eseguibile Tesseract non trovato (vedi tesseract_cmd). Salto fallback visivo.")
+            return [], {}
+        
+        # Le parole nelle fasce di sovrapposizione vengono lette due volte
+        unique = []
+        for text, cx, cy, conf in sorted(words, key=lambda w: -w[3]):
+            if not any(text == u[0] and abs(cx - u[1]) < 20 and abs(cy - u[2]) < 20 for u in unique):
+                unique.append((text, cx, cy, conf))
+        
+        # Dal riferimento raddrizzato a quello della pagina, poi alla scala del PNG
+        cos_a, sin_a = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+        center_x, center_y = binary.width / 2, binary.height / 2
+        k = scale_factor * 72 / dpi
+        final_points = []
+        for text, cx, cy, _ in unique:
+            dx, dy = cx - center_x, cy - center_y
+            x = center_x + dx * cos_a - dy * sin_a
+            y = center_y + dx * sin_a + dy * cos_a
+            final_points.append((round(x * k), round(y * k), text))
+        
+        print(f"[OCR] Fallback OCR: {len(final_points)} codici in {time.perf_counter() - start:.1f}s "
+              f"(soglia {threshold}, raddrizzamento {angle:+.1f}°, {len(tiles)} tasselli)")
+        return self._number_points(final_points)
+
+    def _binarized_page(self, pdf_path, page, dpi):
+        """ Pagina in bianco/nero (soglia di Otsu) e raddrizzata: (immagine PIL, soglia, angolo) o None """
+        qimage = self._render_gray(pdf_path, page, dpi)
+        if qimage is None:
+            return None
+        gray = Image.frombuffer('L', (qimage.width(), qimage.height()), bytes(qimage.constBits()),
+                                'raw', 'L', qimage.bytesPerLine(), 1)
+        
+        threshold = self._otsu_threshold(gray.histogram())
+        binary = gray.point(lambda v: 255 if v > threshold else 0)
+        angle = self._estimate_skew(binary)
+        if angle:
+            binary = binary.rotate(angle, resample=Image.NEAREST, fillcolor=255)
+        return binary, threshold, angle
+
+    def extract_bom(self, pdf_path, page=0, original_height=None):
+        """ Distinta base stampata sul foglio: ({pos: [codice, descrizione]}, aree in punti PDF).
+            Dai testi del PDF; se la pagina non ha testo (scansione) e l'OCR è disponibile,
+            da una lettura Tesseract della pagina raddrizzata (senza aree: non c'è testo da escludere).
+        """
+        try:
+            runs = self.bom_extractor.text_runs(pdf_path, page)
+            if runs:
+                rows, areas = self.bom_extractor.parse(runs)
+            elif OCR_AVAILABLE and original_height is not None:
+                rows, areas = self._extract_bom_raster(pdf_path, page, original_height), []
+            else:
+                rows, areas = {}, []
+        except Exception as e:
+            print(f"[OCR] Errore nella lettura della distinta base: {e}")
+            return {}, []
+        if rows:
+            print(f"[OCR] Distinta base: {len(rows)} posizioni lette dal foglio")
+        return rows, areas
+
+    def _extract_bom_raster(self, pdf_path, page, original_height):
+        prepared = self._binarized_page(pdf_path, page, BOM_OCR_DPI)
+        if prepared is None:
+            return {}
+        try:
+            data = pytesseract.image_to_data(prepared[0], config=BOM_OCR_CONFIG, output_type=pytesseract.Output.DICT)
+        except pytesseract.TesseractNotFoundError:
+            return {}
+        rows, _ = self.bom_extractor.parse(BomExtractor.ocr_runs(data, BOM_OCR_DPI / 72, original_height, OCR_MIN_CONF))
+        return rows
+
+    @staticmethod
+    def apply_bom(data_map, bom, native_ids):
+        """ Sostituisce i segnaposto "Componente ..." con le righe della distinta.
+            Id nativi (numeri dei palloncini): per numero di posizione, aggiungendo le posizioni
+            senza marker trovato. Id progressivi (testi del disegno): per codice.
+        """
+        if not bom:
+            return data_map
+        data_map = dict(data_map)
+        if native_ids:
+            for pos, row in bom.items():
+                data_map[pos] = list(row)
+        else:
+            by_code = {code.replace(' ', '').upper(): desc for code, desc in bom.values() if code != '-' and desc}
+            for key, (code, desc) in data_map.items():
+                found = by_code.get(code.replace(' ', '').upper())
+                if found:
+                    data_map[key] = [code, found]
+        return data_map
+
+    @staticmethod
+    def _ocr_tile(tile, left, top):
+        data = pytesseract.image_to_data(tile, config=OCR_CONFIG, output_type=pytesseract.Output.DICT)
+        words = []
+        for text, conf, x, y, w, h in zip(data['text'], data['conf'], data['left'], data['top'],
+                                          data['width'], data['height']):
+            text = text.strip()
+            # Solo codici/posizioni: almeno una cifra, niente frammenti di quote o tratteggi
+            if float(conf) < OCR_MIN_CONF or not (1 <= len(text) <= 25) or not re.search(r'\d', text):
+                continue
+            words.append((text, left + x + w / 2, top + y + h / 2, float(conf)))
+        return words
+
+    @staticmethod
+    def _otsu_threshold(histogram):
+        total = sum(histogram)
+        sum_all = sum(i * count for i, count in enumerate(histogram))
+        sum_bg, weight_bg, best, threshold = 0, 0, -1, 127
+        for level, count in enumerate(histogram):
+            weight_bg += count
+            if weight_bg == 0:
+                continue
+            weight_fg = total - weight_bg
+            if weight_fg == 0:
+                break
+            sum_bg += level * count
+            mean_bg, mean_fg = sum_bg / weight_bg, (sum_all - sum_bg) / weight_fg
+            between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+            if between > best:
+                best, threshold = between, level
+        return threshold
+
+    @staticmethod
+    def _estimate_skew(binary, max_angle=3.0):
+        """ Angolo (gradi) che rende più "netto" il profilo di proiezione orizzontale:
+            con le righe di testo allineate le somme per riga alternano pieni e vuoti.
+            Ricerca grossolana a 1/4 di risoluzione, poi rifinita a 1/2 attorno al migliore.
+        """
+        best_angle = 0.0
+        for reduction, span, step in ((4, max_angle, 0.25), (2, 0.25, 0.05)):
+            small = binary.resize((max(1, binary.width // reduction), max(1, binary.height // reduction)), Image.BOX)
+            center, best_score = best_angle, -1
+            for i in range(-round(span / step), round(span / step) + 1):
+                angle = round(center + i * step, 2)
+                rotated = small.rotate(angle, resample=Image.BILINEAR, fillcolor=255)
+                # Immagine "L" larga 1 pixel: un byte per riga
+                profile = rotated.resize((1, rotated.height), Image.BOX).tobytes()
+                score = sum((b - a) ** 2 for a, b in zip(profile, profile[1:]))
+                if score > best_score:
+                    best_angle, best_score = angle, score
+        return best_angle
 
     def process_drawing(self, pdf_path, output_dir):
-        """ Processa un PDF: genera PNG e tenta di estrarre e salvare le coordinate JSON """
+        """ Processa un PDF: genera i PNG e tenta di estrarre e salvare le coordinate JSON.
+            Le pagine vengono elaborate in parallelo; la prima usa i nomi file storici, le
+            successive "<nome>.pN.*" (vedi registry.page_file_name). I numeri di posizione
+            proseguono da una pagina all'altra, così restano univoci nel prodotto.
+        """
+        self.timings = {}
         try:
             base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-            png_path = os.path.join(output_dir, f"{base_name}.png")
-            coords_path = os.path.join(output_dir, f"{base_name}.coords.json")
-            data_path = os.path.join(output_dir, f"{base_name}.data.json")
+            with self._timed('apertura'):
+                page_count = len(PdfReader(pdf_path).pages)
+                self._ensure_app()
             
-            # 1. Rendering visuale (Necessario per UI)
-            success, org_h = self.render_to_png(pdf_path, png_path)
-            if not success:
+            with self._timed('hash'):
+                cache = RenderCache(output_dir)
+                pdf_hash = cache.content_hash(pdf_path)
+            
+            # QtPdf serializza internamente i render pdfium: il parallelismo utile qui è la
+            # sovrapposizione di codifica PNG, I/O ed estrazione tra pagine diverse.
+            workers = min(page_count, os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(
+                    lambda page: self._process_page(pdf_path, output_dir, base_name, page, cache, pdf_hash),
+                    range(page_count)
+                ))
+            # Un'unica scrittura del manifest per PDF (anche se qualche pagina è fallita)
+            cache.save()
+            if not all(ok for ok, _ in results):
                 return False
-                
-            # 2. Se ho generato le coordinate, ho finito
-            if os.path.exists(coords_path) and os.path.exists(data_path):
-                print(f"[OCR] File coordinate d data già presenti per {base_name}")
-                return True
-                
-            # 3. Tento Estrazione Vettoriale
-            points, data_map = self.extract_vector_coords(pdf_path, org_h)
-            
-            # 4. Fallback se vettoriale fallisce (<= 2 punti trovati assumiamo sia muto o raster)
-            if len(points) <= 2:
-                print("[OCR] Estrazione vettoriale ha trovato poco testo. Tento Fallback OCR Image...")
-                ocr_points, ocr_data = self.extract_ocr_image(pdf_path)
-                if ocr_points: 
-                    points = ocr_points
-                    data_map = ocr_data
-            
-            # 5. Salva Mappe
-            with open(coords_path, 'w', encoding='utf-8') as f:
-                json.dump(points, f, indent=4)
-                
-            # Salva i Dati Dizionario solo se non esistono già (per non sovrascriverli se l'utente li ha modificati)
-            if not os.path.exists(data_path) and data_map:
-                with open(data_path, 'w', encoding='utf-8') as f:
-                    json.dump(data_map, f, indent=4)
-                
-            print(f"[OCR] Creata mappa con {len(points)} coordinate per {base_name}")
+            
+            # Le pagine già calibrate conservano i loro id: le nuove partono dal massimo esistente
+            used_ids = set()
+            for page, (_, extracted) in enumerate(results):
+                if extracted is None:
+                    coords_path = os.path.join(output_dir, page_file_name(base_name, 'coords.json', page))
+                    with open(coords_path, 'r', encoding='utf-8') as f:
+                        used_ids.update(c[2] for c in json.load(f) if isinstance(c[2], int))
+            
+            for page, (_, extracted) in enumerate(results):
+                if extracted is None:
+                    continue
+                points, data_map, native_ids = extracted
+                page_ids = self._page_ids(points, data_map)
+                # I numeri dei palloncini ricominciano spesso da 1 a ogni tavola: se si sovrappongono
+                # a quelli di altre pagine si rinumerano come gli id progressivi
+                clashes = sorted(used_ids & page_ids)
+                if native_ids and clashes:
+                    print(f"[OCR] Attenzione: {base_name} pag. {page + 1} ha posizioni già usate in altre pagine "
+                          f"({', '.join(map(str, clashes))}), rinumerate in sequenza")
+                    native_ids = False
+                if not native_ids:
+                    points, data_map = self._offset_ids(points, data_map, max(used_ids, default=0))
+                    page_ids = self._page_ids(points, data_map)
+                used_ids |= page_ids
+                with self._timed('salvataggio'):
+                    self._save_page_maps(output_dir, base_name, page, points, data_map)
             return True
             
         except Exception as e:
             print(f"[OCR] Errore irreversibile nel processamento del PDF: {traceback.format_exc()}")
             return False
 
+    def _process_page(self, pdf_path, output_dir, base_name, page, cache, pdf_hash):
+        """ Render (con cache) ed estrazione di una pagina.
+            Ritorna (successo, (punti, dati, id_nativi)), con None al posto dei dati se la pagina ha già le sue mappe.
+        """
+        png_path = os.path.join(output_dir, page_file_name(base_name, 'png', page))
+        coords_path = os.path.join(output_dir, page_file_name(base_name, 'coords.json', page))
+        data_path = os.path.join(output_dir, page_file_name(base_name, 'data.json', page))
+        
+        # 1. Rendering visuale PNG (se keep_png), saltato se il PDF non è cambiato
+        cached = cache.lookup(png_path, pdf_hash, page=page, scale=RENDER_SCALE)
+        if not self.keep_png:
+            org_h = self.page_height(pdf_path, page)
+            if org_h is None:
+                return False, None
+        elif cached:
+            print(f"[OCR] Render in cache per {base_name} pag. {page + 1}, salto rasterizzazione")
+            org_h = cached['page_height']
+        else:
+            with self._timed('render'):
+                success, org_h = self.render_to_png(pdf_path, png_path, RENDER_SCALE, page)
+            if not success:
+                return False, None
+            cache.store(png_path, pdf_hash, page=page, scale=RENDER_SCALE, page_height=org_h)
+        
+        # 1b. Piramide di tasselli, solo se la mappa la usa (anche per render già in cache ma senza piramide)
+        if MAP_RENDER_MODE == 'tiles':
+            with self._timed('tasselli'):
+                self.render_tile_pyramid(pdf_path, pyramid_dir(output_dir, base_name, page), page, pdf_hash)
+        
+        # 1c. Miniatura per l'archivio (solo dalla prima pagina)
+        if page == 0:
+            with self._timed('miniatura'):
+                self.render_thumbnail(pdf_path, thumbnail_path(output_dir, base_name), cache, pdf_hash)
+            
+        # 2. Se ho generato le coordinate, ho finito
+        if os.path.exists(coords_path) and os.path.exists(data_path):
+            print(f"[OCR] File coordinate d data già presenti per {base_name} pag. {page + 1}")
+            return True, None
+            
+        # 2b. Distinta base stampata sul foglio: codici e descrizioni al posto dei segnaposto
+        with self._timed('distinta'):
+            bom, bom_areas = self.extract_bom(pdf_path, page, org_h)
+        
+        # 3. Palloncini di posizione: se il foglio li usa sono gli unici marker reali e
+        #    i loro numeri sono già gli id delle posizioni (niente rinumerazione tra pagine)
+        with self._timed('palloncini'):
+            points, data_map = self.extract_balloons(pdf_path, org_h, RENDER_SCALE, page)
+        if points:
+            return True, (points, self.apply_bom(data_map, bom, True), True)
+        
+        # 3b. Tento Estrazione Vettoriale (senza le celle della distinta)
+        with self._timed('vettoriale'):
+            points, data_map = self.extract_vector_coords(pdf_path, org_h, RENDER_SCALE, page, exclude=bom_areas)
+        
+        # 4. Fallback se vettoriale fallisce (<= 2 punti trovati assumiamo sia muto o raster)
+        if len(points) <= 2:
+            print("[OCR] Estrazione vettoriale ha trovato poco testo. Tento Fallback OCR Image...")
+            with self._timed('ocr'):
+                ocr_points, ocr_data = self.extract_ocr_image(pdf_path, page, scale_factor=RENDER_SCALE)
+            if ocr_points: 
+                points = ocr_points
+                data_map = ocr_data
+        
+        # Nessun marker ma distinta letta: i dati sono pronti, i punti si posizionano nel calibratore
+        if not points and bom:
+            return True, ([], dict(bom), True)
+        return True, (points, self.apply_bom(data_map, bom, False), False)
+
+    @staticmethod
+    def _offset_ids(points, data_map, offset):
+        if not offset:
+            return points, data_map
+        points = [[x, y, num + offset if isinstance(num, int) else num] for x, y, num in points]
+        data_map = {str(int(k) + offset) if str(k).isdigit() else k: v for k, v in data_map.items()}
+        return points, data_map
+
+    @staticmethod
+    def _page_ids(points, data_map):
+        """ Id numerici di una pagina, dai marker e dalle righe della distinta """
+        return ({p[2] for p in points if isinstance(p[2], int)}
+                | {int(k) for k in data_map if str(k).isdigit()})
+
+    def _save_page_maps(self, output_dir, base_name, page, points, data_map):
+        coords_path = os.path.join(output_dir, page_file_name(base_name, 'coords.json', page))
+        data_path = os.path.join(output_dir, page_file_name(base_name, 'data.json', page))
+        
+        # 5. Salva Mappe
+        with open(coords_path, 'w', encoding='utf-8') as f:
+            json.dump(points, f, indent=4)
+            
+        # Salva i Dati Dizionario solo se non esistono già (per non sovrascriverli se l'utente li ha modificati)
+        if not os.path.exists(data_path) and data_map:
+            with open(data_path, 'w', encoding='utf-8') as f:
+                json.dump(data_map, f, indent=4)
+            
+        print(f"[OCR] Creata mappa con {len(points)} coordinate per {base_name} pag. {page + 1}")
+
 if __name__ == '__main__':
     # Test esecuzione stand-alone
     engine = OcrEngine()
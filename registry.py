@@ -1,27 +1,132 @@
 import os
-import json
+import re
+import time
+import atexit
+import sqlite3
+import threading
+import contextlib
+from collections import deque
+from catalog_store import CatalogStore, position_id
+from render_cache import CACHE_DIRNAME
+
+# Pagine successive alla prima: "<prodotto>.p2.png", "<prodotto>.p2.coords.json", ...
+# (la prima mantiene i nomi storici)
+PAGE_FILE_RE = re.compile(r'^(?P<base>.+)\.p(?P<num>\d+)\.(?:png|coords\.json)$')
+
+def page_file_name(product_id, kind, page=0):
+    """ Nome del file di output per la pagina (0-based); kind: 'png', 'coords.json', 'data.json' """
+    if page == 0:
+        return f"{product_id}.{kind}"
+    return f"{product_id}.p{page + 1}.{kind}"
+
+# Anteprime per l'archivio, generate all'elaborazione del PDF (lato massimo del riquadro della scheda)
+THUMB_SIZE = (198, 140)
+
+def thumbnail_path(drawings_dir, product_id):
+    """ Disegni/.cache/thumbs/<prodotto>.thumb.png (prima pagina) """
+    return os.path.join(drawings_dir, CACHE_DIRNAME, 'thumbs', f"{product_id}.thumb.png")
+
+def product_output_files(drawings_dir, product_id):
+    """ File generati per un prodotto (PNG, coords, data di tutte le pagine), esclusa la cartella cache """
+    pattern = re.compile(rf'^{re.escape(product_id)}(?:\.p\d+)?\.(?:png|coords\.json|data\.json)$')
+    return [f for f in os.listdir(drawings_dir) if pattern.match(f)]
+
+def rename_product_files(drawings_dir, old_id, new_id):
+    """ Rinomina i file generati dopo la rinomina del PDF, conservando calibrazione e dati """
+    for filename in product_output_files(drawings_dir, old_id):
+        target = new_id + filename[len(old_id):]
+        if not os.path.exists(os.path.join(drawings_dir, target)):
+            os.replace(os.path.join(drawings_dir, filename), os.path.join(drawings_dir, target))
+
+# Entro questo intervallo una pagina in cache si usa senza controllare i JSON su disco;
+# oltre, basta uno stat per file per sapere se l'OCR o qualcuno li ha riscritti
+REVALIDATE_SECS = 2.0
+
+# Scrittura differita: i salvataggi aggiornano subito la cache e finiscono nel catalogo
+# tutti insieme, in una transazione, al più FLUSH_DELAY secondi dopo la prima modifica
+FLUSH_DELAY = 2.0
+UNDO_LIMIT = 200
+
+# Registry condivisi per cartella: finestra principale, dialoghi e calibratore leggono la
+# stessa cache invece di riscansionare la cartella e rileggere i dati a ogni apertura
+_REGISTRIES = {}
+_registries_lock = threading.Lock()
+
+def get_registry(drawings_dir='disegni'):
+    key = os.path.normcase(os.path.abspath(drawings_dir))
+    with _registries_lock:
+        registry = _REGISTRIES.get(key)
+        if registry is None:
+            registry = _REGISTRIES[key] = ProductRegistry(drawings_dir)
+        return registry
 
 class ProductRegistry:
     def __init__(self, drawings_dir='disegni'):
         self.drawings_dir = drawings_dir
         self.products = {}
+        # Cache in lettura: (prodotto, pagina) -> coords/data, prodotto -> metadati (punti, anteprima)
+        self._pages = {}
+        self._meta = {}
+        # Modifiche in attesa di scrittura: (prodotto, pagina, 'coords' | 'data') -> valore
+        self._dirty = {}
+        self._flush_timer = None
+        # Giornale di annullamento: (gruppo, prodotto, pagina, tipo, valore precedente)
+        self._journal = deque(maxlen=UNDO_LIMIT)
+        self._edit_group = 0
+        self._edit_depth = 0
+        self._lock = threading.RLock()
         self.scan_products()
+        # Coordinate e dati stanno nel catalogo SQLite; i JSON vengono importati quando cambiano
+        self.catalog = CatalogStore(drawings_dir)
+        atexit.register(self.flush)
 
     def scan_products(self):
         """Scans the drawings directory for PDF files and their metadata."""
         if not os.path.exists(self.drawings_dir):
             os.makedirs(self.drawings_dir)
             
-        for filename in os.listdir(self.drawings_dir):
+        filenames = os.listdir(self.drawings_dir)
+        # Ricostruito da zero: i PDF eliminati o rinominati spariscono dall'elenco
+        products = {}
+        
+        # Numero di pagine dedotto dai file per-pagina già generati, senza aprire i PDF
+        page_counts = {}
+        for filename in filenames:
+            match = PAGE_FILE_RE.match(filename)
+            if match:
+                base = match.group('base')
+                page_counts[base] = max(page_counts.get(base, 1), int(match.group('num')))
+            
+        for filename in filenames:
             if filename.endswith('.pdf'):
                 product_id = os.path.splitext(filename)[0]
                 # Default entry
-                self.products[product_id] = {
+                products[product_id] = {
                     'name': product_id,
                     'drawing_path': os.path.join(self.drawings_dir, filename),
                     'coords_path': os.path.join(self.drawings_dir, f"{product_id}.coords.json"),
-                    'data_path': os.path.join(self.drawings_dir, f"{product_id}.data.json")
+                    'data_path': os.path.join(self.drawings_dir, f"{product_id}.data.json"),
+                    'pages': page_counts.get(product_id, 1)
                 }
+        self.products = products
+        # Via dalla cache i prodotti spariti e quelli con un numero di pagine diverso
+        self._pages = {key: entry for key, entry in self._pages.items()
+                       if key[0] in products and key[1] < products[key[0]]['pages']}
+        self._meta.clear()
+
+    def invalidate(self, *product_ids):
+        """ Scarta i dati in cache (dei prodotti indicati o di tutti), es. su eventi del watcher """
+        # Le modifiche in attesa vivono solo in cache: prima vanno scritte
+        with self._lock:
+            self.flush()
+            if not product_ids:
+                self._pages.clear()
+                self._meta.clear()
+                return
+            for product_id in product_ids:
+                for key in [k for k in self._pages if k[0] == product_id]:
+                    del self._pages[key]
+                self._meta.pop(product_id, None)
 
     def get_available_products(self):
         return list(self.products.keys())
@@ -29,59 +134,198 @@ class ProductRegistry:
     def get_product_info(self, product_id):
         return self.products.get(product_id)
 
-    def get_product_coords(self, product_id):
+    def get_page_count(self, product_id):
+        info = self.get_product_info(product_id)
+        return info['pages'] if info else 0
+
+    def get_page_path(self, product_id, kind, page=0):
+        return os.path.join(self.drawings_dir, page_file_name(product_id, kind, page))
+
+    def get_page_image(self, product_id, page=0):
+        """ PNG renderizzato della pagina, o None se non ancora generato """
+        path = self.get_page_path(product_id, 'png', page)
+        return path if os.path.exists(path) else None
+
+    def _json_signature(self, product_id, page):
+        signature = []
+        for kind in ('coords.json', 'data.json'):
+            try:
+                st = os.stat(self.get_page_path(product_id, kind, page))
+                signature.append((st.st_size, st.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _page_entry(self, product_id, page):
+        """ Coords e dati della pagina dalla cache; ricaricati dal catalogo se i JSON sono cambiati """
+        key = (product_id, page)
+        # Sotto lock: una lettura non deve rimpiazzare la voce mentre _stage o flush la modificano
+        with self._lock:
+            entry = self._pages.get(key)
+            now = time.monotonic()
+            if entry and (now - entry['checked'] < REVALIDATE_SECS or self._is_dirty(product_id, page)):
+                return entry
+            signature = self._json_signature(product_id, page)
+            if entry and entry['signature'] == signature:
+                entry['checked'] = now
+                return entry
+            
+            self.catalog.sync_json(product_id, page, self.get_page_path(product_id, 'coords.json', page),
+                                   self.get_page_path(product_id, 'data.json', page))
+            entry = {'checked': now, 'signature': signature,
+                     'coords': self.catalog.get_coords(product_id, page),
+                     'data': self.catalog.get_data(product_id, page)}
+            self._pages[key] = entry
+            self._meta.pop(product_id, None)
+            return entry
+
+    def _is_dirty(self, product_id, page):
+        return (product_id, page, 'coords') in self._dirty or (product_id, page, 'data') in self._dirty
+
+    def _stage(self, product_id, page, kind, value):
+        """ Nuovo valore in cache e in coda di scrittura; il precedente va nel giornale """
+        with self._lock:
+            entry = self._page_entry(product_id, page)
+            if self._edit_depth == 0:
+                self._edit_group += 1
+            self._journal.append((self._edit_group, product_id, page, kind, entry[kind]))
+            entry[kind] = value
+            self._dirty[(product_id, page, kind)] = value
+            if kind == 'coords':
+                self._meta.pop(product_id, None)
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        # Il timer parte alla prima modifica e non si riarma: un flush ogni FLUSH_DELAY al massimo
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    @contextlib.contextmanager
+    def edit(self):
+        """ I salvataggi fatti dentro il blocco si annullano con un solo undo() """
+        with self._lock:
+            if self._edit_depth == 0:
+                self._edit_group += 1
+            self._edit_depth += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._edit_depth -= 1
+
+    def undo(self, product_id, page=0):
+        """ Ripristina l'ultimo gruppo di salvataggi della pagina; False se non c'è nulla da annullare """
+        with self._lock:
+            group = next((e[0] for e in reversed(self._journal) if e[1:3] == (product_id, page)), None)
+            if group is None:
+                return False
+            restored = [e for e in self._journal if e[0] == group and e[1:3] == (product_id, page)]
+            for e in restored:
+                self._journal.remove(e)
+            entry = self._page_entry(product_id, page)
+            for _, _, _, kind, previous in reversed(restored):
+                if previous is None:
+                    previous = [] if kind == 'coords' else {}
+                entry[kind] = previous
+                self._dirty[(product_id, page, kind)] = previous
+            self._meta.pop(product_id, None)
+            self._schedule_flush()
+        return True
+
+    def flush(self):
+        """ Scrive nel catalogo tutte le modifiche in attesa (una transazione) e riesporta i JSON
+            delle pagine modificate; False se la scrittura nel catalogo fallisce
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            pending = self._dirty
+            if not pending:
+                return True
+            try:
+                self.catalog.save_batch([(product_id, page, kind, value)
+                                         for (product_id, page, kind), value in pending.items()])
+            except sqlite3.Error as e:
+                # Le modifiche restano in coda (e in cache) per il prossimo tentativo
+                print(f"Errore salvataggio catalogo, riprovo al prossimo flush: {e}")
+                return False
+            self._dirty = {}
+            # Il catalogo non è versionato: i .coords.json / .data.json restano allineati
+            for product_id, page in {(product_id, page) for product_id, page, _ in pending}:
+                try:
+                    self.catalog.export_json(product_id, page, self.get_page_path(product_id, 'coords.json', page),
+                                             self.get_page_path(product_id, 'data.json', page))
+                except OSError as e:
+                    print(f"Errore esportazione JSON di {product_id} pag. {page + 1}: {e}")
+        return True
+
+    def get_product_coords(self, product_id, page=0):
         info = self.get_product_info(product_id)
         if not info: return []
         
-        path = info['coords_path']
-        if os.path.exists(path):
-            with open(path, 'r') as f:
-                return json.load(f)
-        return []
+        # Copie: chi le riceve (calibratore, dialoghi) le modifica prima di salvarle
+        coords = self._page_entry(product_id, page)['coords']
+        return [list(c) for c in coords] if coords else []
 
-    def save_product_coords(self, product_id, coords):
+    def save_product_coords(self, product_id, coords, page=0):
         info = self.get_product_info(product_id)
         if not info: return False
         
-        path = info['coords_path']
-        with open(path, 'w') as f:
-            json.dump(coords, f, indent=4)
-        print(f"Saved {len(coords)} points to {path}")
+        self._stage(product_id, page, 'coords', [[round(x), round(y), position_id(str(num))] for x, y, num in coords])
         return True
 
-    def get_product_data(self, product_id):
+    def get_product_data(self, product_id, page=0):
         """Returns component dictionary {pos: (code, desc)}"""
         info = self.get_product_info(product_id)
         if not info: return {}
         
-        path = info['data_path']
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-                return {str(k): v for k, v in raw_data.items()}
+        entry = self._page_entry(product_id, page)
+        if entry['data'] is not None:
+            return {pos: list(row) for pos, row in entry['data'].items()}
         else:
             # Fallback auto-generation from coords if data doesn't exist
-            coords = self.get_product_coords(product_id)
+            coords = entry['coords']
             if coords:
                 return {str(c[2]): ["-", f"Componente {c[2]}"] for c in coords}
                 
         return {}
 
-    def save_product_data(self, product_id, data_dict):
-        """Saves the data dictionary to the product's data.json"""
+    def save_product_data(self, product_id, data_dict, page=0):
+        """Saves the data dictionary to the catalogue (data.json is rewritten on flush)"""
         if product_id not in self.products:
             self.products[product_id] = {
                 'name': product_id,
                 'drawing_path': os.path.join(self.drawings_dir, f"{product_id}.pdf"),
                 'coords_path': os.path.join(self.drawings_dir, f"{product_id}.coords.json"),
-                'data_path': os.path.join(self.drawings_dir, f"{product_id}.data.json")
+                'data_path': os.path.join(self.drawings_dir, f"{product_id}.data.json"),
+                'pages': page + 1
             }
         
-        path = self.products[product_id]['data_path']
-        try:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data_dict, f, indent=4)
-            return True
-        except Exception as e:
-            print(f"Errore salvataggio data: {e}")
-            return False
+        self._stage(product_id, page, 'data', {str(pos): list(row) for pos, row in data_dict.items()})
+        return True
+
+    def get_point_count(self, product_id):
+        """ Punti calibrati su tutte le pagine (dalla cache, per le schede dell'archivio) """
+        meta = self._meta.setdefault(product_id, {})
+        if 'points' not in meta:
+            meta['points'] = sum(len(self._page_entry(product_id, page)['coords'] or [])
+                                 for page in range(self.get_page_count(product_id)))
+        return meta['points']
+
+    def get_thumbnail(self, product_id):
+        """ Miniatura della prima pagina, o None se il disegno non è ancora stato elaborato """
+        meta = self._meta.setdefault(product_id, {})
+        if 'thumbnail' not in meta:
+            path = thumbnail_path(self.drawings_dir, product_id)
+            meta['thumbnail'] = path if os.path.exists(path) else None
+        return meta['thumbnail']
+
+    def export_product_json(self, product_id):
+        """ Riscrive .coords.json / .data.json di tutte le pagine dal catalogo (per altri strumenti) """
+        self.flush()
+        for page in range(self.get_page_count(product_id)):
+            self.catalog.export_json(product_id, page, self.get_page_path(product_id, 'coords.json', page),
+                                     self.get_page_path(product_id, 'data.json', page))
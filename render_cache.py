@@ -0,0 +1,140 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+
+# Cartella nascosta accanto agli output in Disegni/ (il registry considera solo i .pdf)
+CACHE_DIRNAME = '.cache'
+MANIFEST_NAME = 'render_manifest.json'
+# sources: hash dei PDF; renders: file generati; processed: PDF elaborati per intero (batch_process)
+SECTIONS = ('sources', 'renders', 'processed')
+
+_lock = threading.RLock()
+
+
+class RenderCache:
+    """ Manifest dei render già eseguiti. Ogni PNG prodotto è associato all'hash SHA-256
+        del PDF sorgente e ai parametri di render (pagina, scala): se nulla è cambiato il
+        PNG esistente viene riusato senza rasterizzare di nuovo.
+        Per non rileggere tutti i PDF a ogni avvio, anche l'hash è memorizzato insieme a
+        dimensione e mtime del file e ricalcolato solo quando questi cambiano.
+    """
+
+    def __init__(self, output_dir):
+        self.cache_dir = os.path.join(output_dir, CACHE_DIRNAME)
+        self.manifest_path = os.path.join(self.cache_dir, MANIFEST_NAME)
+        self._manifest = self._load()
+        # Voci aggiunte/modificate e rimosse da questa istanza: save() scrive solo quelle,
+        # così le voci caricate all'apertura non coprono quelle scritte nel frattempo da altri
+        self._changed = {section: set() for section in SECTIONS}
+        self._dropped = {section: set() for section in SECTIONS}
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        for section in SECTIONS:
+            manifest.setdefault(section, {})
+        return manifest
+
+    def content_hash(self, pdf_path):
+        st = os.stat(pdf_path)
+        name = os.path.basename(pdf_path)
+        entry = self._manifest['sources'].get(name)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(pdf_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        sha = digest.hexdigest()
+        with _lock:
+            self._manifest['sources'][name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': sha}
+            self._changed['sources'].add(name)
+        return sha
+
+    def known_hash(self, pdf_name):
+        """ Hash registrato per un PDF (anche se il file non esiste più), o None """
+        entry = self._manifest['sources'].get(pdf_name)
+        return entry['sha256'] if entry else None
+
+    def is_processed(self, pdf_path, pdf_hash):
+        """ True se il PDF con questo contenuto è già stato elaborato per intero """
+        return self._manifest['processed'].get(os.path.basename(pdf_path)) == pdf_hash
+
+    def mark_processed(self, pdf_path, pdf_hash):
+        """ Solo in memoria: chi elabora molti PDF chiama save() una volta alla fine """
+        with _lock:
+            self._manifest['processed'][os.path.basename(pdf_path)] = pdf_hash
+            self._changed['processed'].add(os.path.basename(pdf_path))
+
+    def rename(self, old_id, new_id):
+        """ Sposta le voci di un prodotto rinominato, così i suoi render restano validi """
+        with _lock:
+            for section in SECTIONS:
+                entries = self._manifest[section]
+                for name in [n for n in entries if n == f"{old_id}.pdf" or
+                             re.match(rf'^{re.escape(old_id)}(?:\.p\d+|\.thumb)?\.png$', n)]:
+                    entries[new_id + name[len(old_id):]] = entries.pop(name)
+                    self._changed[section].discard(name)
+                    self._changed[section].add(new_id + name[len(old_id):])
+                    self._dropped[section].add(name)
+            self.save()
+
+    def lookup(self, output_path, pdf_hash, page=0, scale=3):
+        """ Ritorna i metadati del render (es. page_height) se output_path è ancora valido, altrimenti None """
+        entry = self._manifest['renders'].get(os.path.basename(output_path))
+        if not entry or not os.path.exists(output_path):
+            return None
+        if entry['sha256'] != pdf_hash or entry['page'] != page or entry['scale'] != scale:
+            return None
+        return entry
+
+    def store(self, output_path, pdf_hash, page=0, scale=3, **meta):
+        """ Solo in memoria, come mark_processed: il manifest si scrive con save() a fine PDF """
+        # Sotto lock: le pagine di un PDF multipagina vengono registrate da thread diversi
+        with _lock:
+            self._manifest['renders'][os.path.basename(output_path)] = dict(meta, sha256=pdf_hash, page=page, scale=scale)
+            self._changed['renders'].add(os.path.basename(output_path))
+
+    def reload(self):
+        """ Rilegge il manifest (i processi di elaborazione lo aggiornano), tenendo le modifiche non salvate """
+        with _lock:
+            self._manifest = self._merged()
+
+    def _merged(self):
+        """ Manifest su disco con applicate le modifiche di questa istanza """
+        on_disk = self._load()
+        for section in SECTIONS:
+            for name in self._changed[section]:
+                if name in self._manifest[section]:
+                    on_disk[section][name] = self._manifest[section][name]
+            for name in self._dropped[section]:
+                if name not in self._manifest[section]:
+                    on_disk[section].pop(name, None)
+        return on_disk
+
+    def save(self):
+        """ Scrittura atomica: rilegge il manifest e vi applica solo le modifiche di questa istanza """
+        with _lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            on_disk = self._merged()
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(on_disk, f, indent=1)
+                os.replace(tmp_path, self.manifest_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._manifest = on_disk
+            for section in SECTIONS:
+                self._changed[section].clear()
+                self._dropped[section].clear()
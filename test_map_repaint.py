@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import subprocess
+
+# Ridisegno continuo della mappa con molti palloncini (e della griglia dell'archivio): il numero
+# di chiamate al QPainter per frame deve restare limitato (con PySide6 6.12 ogni chiamata void perde un riferimento a None,
+# e dopo qualche migliaio il processo termina con "none_dealloc").
+# Uso: python -m pytest -q test_map_repaint.py
+
+POINTS = 300
+FRAMES = 20
+MAX_LOSS_PER_FRAME = 40
+
+SCRIPT = r"""
+import os, sys, json, random
+from PySide6.QtWidgets import QApplication
+from PySide6.QtGui import QImage, QColor
+app = QApplication(sys.argv)
+from gui.map_viewer import ProductMapView
+
+view = ProductMapView()
+view.resize(1280, 800)
+view.show()
+image = QImage(3564, 2520, QImage.Format_RGB32)
+image.fill(QColor(250, 250, 250))
+path = os.path.join(sys.argv[1], "page.png")
+image.save(path)
+view.load_image(path)
+random.seed(7)
+for n in range(1, {points} + 1):
+    view.add_point(random.uniform(40, 3524), random.uniform(40, 2480), str(n))
+app.processEvents()
+
+losses = {{}}
+for label, scale in (('adatta', None), ('1.0', 1.0), ('2.0', 2.0)):
+    view.resetTransform()
+    if scale is None:
+        view.reset_view()
+    else:
+        view.scale(scale, scale)
+    view.viewport().repaint()
+    before = sys.getrefcount(None)
+    for frame in range({frames}):
+        # Zoom alterno: la cache del MarkerLayer si rigenera e il layer si ridisegna per intero
+        factor = 1.01 if frame % 2 else 1 / 1.01
+        view.scale(factor, factor)
+        view.viewport().repaint()
+    losses[label] = (before - sys.getrefcount(None)) / {frames}
+print(json.dumps(losses), flush=True)
+os._exit(0)
+"""
+
+
+def test_map_repaint_keeps_painter_calls_bounded(tmp_path):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    result = subprocess.run([sys.executable, '-c', SCRIPT.format(points=POINTS, frames=FRAMES), str(tmp_path)],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, env=env, timeout=300)
+    assert result.returncode == 0, result.stderr[-2000:]
+    losses = json.loads(result.stdout.strip().splitlines()[-1])
+    for label, loss in losses.items():
+        assert loss < MAX_LOSS_PER_FRAME, f"zoom {label}: {loss:.0f} riferimenti a None persi per frame"
+
+
+ARCHIVE_SCRIPT = r"""
+import os, sys, json
+from PySide6.QtWidgets import QApplication, QListView, QAbstractItemView
+from PySide6.QtGui import QImage, QColor
+app = QApplication(sys.argv)
+from gui.archive_model import ArchiveListModel, ArchiveCardDelegate
+
+thumb = os.path.join(sys.argv[1], "thumb.png")
+image = QImage(200, 140, QImage.Format_RGB32)
+image.fill(QColor(230, 230, 230))
+image.save(thumb)
+
+class Registry:
+    def get_point_count(self, product_id):
+        return 12
+    def get_thumbnail(self, product_id):
+        return thumb if int(product_id[1:]) % 2 else None
+
+model = ArchiveListModel(Registry())
+view = QListView()
+view.setViewMode(QListView.IconMode)
+view.setResizeMode(QListView.Adjust)
+view.setMovement(QListView.Static)
+view.setUniformItemSizes(True)
+view.setSpacing(15)
+view.setSelectionMode(QAbstractItemView.NoSelection)
+view.setItemDelegate(ArchiveCardDelegate(view))
+view.setModel(model)
+view.resize(1280, 800)
+view.show()
+model.set_products([f"P{{n:04d}}" for n in range({products})])
+app.processEvents()
+view.viewport().repaint()
+# Anteprime caricate: i frame misurati ridisegnano schede complete
+model._pool.waitForDone()
+app.processEvents()
+view.viewport().repaint()
+
+before = sys.getrefcount(None)
+for frame in range({frames}):
+    view.viewport().repaint()
+print(json.dumps({{'archivio': (before - sys.getrefcount(None)) / {frames}}}), flush=True)
+os._exit(0)
+"""
+
+
+def test_archive_repaint_keeps_painter_calls_bounded(tmp_path):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    result = subprocess.run([sys.executable, '-c', ARCHIVE_SCRIPT.format(products=POINTS, frames=FRAMES), str(tmp_path)],
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, env=env, timeout=300)
+    assert result.returncode == 0, result.stderr[-2000:]
+    losses = json.loads(result.stdout.strip().splitlines()[-1])
+    assert losses['archivio'] < MAX_LOSS_PER_FRAME, f"{losses['archivio']:.0f} riferimenti a None persi per frame"
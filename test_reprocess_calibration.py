@@ -0,0 +1,66 @@
+import os
+import json
+import shutil
+import pytest
+
+# La calibrazione salvata nel catalogo deve sopravvivere alla rielaborazione del PDF:
+# l'OCR riscrive .coords.json, ma il JSON non viene più importato sopra le pagine modificate.
+# Uso: python -m pytest -q test_reprocess_calibration.py
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from registry import ProductRegistry
+from catalog_store import CatalogStore
+
+DRAWINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Disegni")
+PRODUCT = "VA30_116A_AGO"
+CALIBRATION = [[120, 340, 1], [560, 780, 2], [900, 150, 3]]
+
+
+def write_json(path, content):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(content, f)
+
+
+def test_json_does_not_overwrite_edited_page(tmp_path):
+    coords_path = tmp_path / "P.coords.json"
+    data_path = tmp_path / "P.data.json"
+    write_json(coords_path, [[1, 1, 1]])
+    catalog = CatalogStore(str(tmp_path))
+    catalog.sync_json("P", 0, str(coords_path), str(data_path))
+    assert catalog.get_coords("P", 0) == [[1, 1, 1]]
+
+    catalog.save_coords("P", CALIBRATION, 0)
+    # Riscrittura del JSON come dopo una rielaborazione (dimensione diversa: firma cambiata)
+    write_json(coords_path, [])
+    catalog.sync_json("P", 0, str(coords_path), str(data_path))
+    assert catalog.get_coords("P", 0) == CALIBRATION
+    catalog.close()
+
+
+def test_calibrate_then_reprocess(tmp_path):
+    pdf_path = os.path.join(DRAWINGS, f"{PRODUCT}.pdf")
+    if not os.path.exists(pdf_path):
+        pytest.skip(f"disegno di esempio mancante: {pdf_path}")
+    from ocr_engine import OcrEngine
+
+    shutil.copy(pdf_path, tmp_path)
+    # Mappa dell'OCR senza data.json: la prossima elaborazione rifà l'estrazione della pagina
+    write_json(tmp_path / f"{PRODUCT}.coords.json", [])
+    registry = ProductRegistry(str(tmp_path))
+    assert registry.get_product_coords(PRODUCT) == []
+
+    assert registry.save_product_coords(PRODUCT, CALIBRATION)
+    assert registry.flush()
+    # Il flush riesporta il JSON della pagina modificata (il catalogo non è versionato)
+    with open(tmp_path / f"{PRODUCT}.coords.json", encoding='utf-8') as f:
+        assert json.load(f) == CALIBRATION
+
+    assert OcrEngine(keep_png=False).process_drawing(str(tmp_path / f"{PRODUCT}.pdf"), str(tmp_path))
+    registry.invalidate(PRODUCT)
+    assert registry.get_product_coords(PRODUCT) == CALIBRATION
+    registry.catalog.close()
+
+    reopened = ProductRegistry(str(tmp_path))
+    assert reopened.get_product_coords(PRODUCT) == CALIBRATION
+    reopened.catalog.close()
@@ -0,0 +1,59 @@
+import os
+import json
+import tempfile
+from render_cache import CACHE_DIRNAME
+from registry import page_file_name
+
+# Scala del PNG rispetto ai punti PDF: tutte le coordinate .coords.json sono in questo spazio.
+# Sta qui e non in ocr_engine perché serve anche alla mappa, che non deve importare pypdf e OCR.
+RENDER_SCALE = 3
+
+# Sfondo della mappa: 'vector' renderizza dal PDF alla risoluzione dello zoom corrente,
+# 'tiles' usa la piramide precalcolata (più leggera per PDF con grandi immagini raster).
+# Con 'vector' l'elaborazione dei disegni non genera i tasselli.
+MAP_RENDER_MODE = 'vector'
+
+# Piramide di tasselli per la mappa: ogni livello è la pagina renderizzata a una scala
+# (pixel per punto PDF) e tagliata in tasselli quadrati. La scena della mappa resta nello
+# spazio delle coordinate .coords.json (RENDER_SCALE = 3); i livelli sotto servono alle
+# viste d'insieme, quelli sopra a zoom nitidi senza ingrandire i pixel del PNG.
+TILE_SIZE = 512
+PYRAMID_SCALES = (0.75, 1.5, 3, 6)
+PYRAMID_MANIFEST = 'pyramid.json'
+
+
+def pyramid_dir(output_dir, product_id, page=0):
+    """ Disegni/.cache/tiles/<prodotto>[.pN].tiles """
+    return os.path.join(output_dir, CACHE_DIRNAME, 'tiles', page_file_name(product_id, 'tiles', page))
+
+
+def tile_path(directory, scale, col, row):
+    return os.path.join(directory, f"{scale:g}", f"{col}_{row}.png")
+
+
+def level_grid(page_width, page_height, scale):
+    """ Dimensioni in pixel del livello e numero di tasselli (colonne, righe) """
+    width = max(1, round(page_width * scale))
+    height = max(1, round(page_height * scale))
+    return width, height, -(-width // TILE_SIZE), -(-height // TILE_SIZE)
+
+
+def load_pyramid(directory):
+    """ Manifest della piramide, o None se assente/incompleta (il manifest si scrive per ultimo) """
+    try:
+        with open(os.path.join(directory, PYRAMID_MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_pyramid(directory, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(tmp_path, os.path.join(directory, PYRAMID_MANIFEST))
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
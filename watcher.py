@@ -1,25 +1,170 @@
 import os
-from PySide6.QtCore import QObject, QFileSystemWatcher, Signal, Slot, QThread
-from ocr_engine import OcrEngine
+import re
+import sys
+import time
+import heapq
+import itertools
+import multiprocessing
+from PySide6.QtCore import QObject, QFileSystemWatcher, Signal, Slot, QTimer
+from registry import rename_product_files, thumbnail_path
+from catalog_store import CatalogStore
+from render_cache import RenderCache
+from tile_pyramid import pyramid_dir
 
-class OcrWorker(QObject):
-    finished = Signal(str, bool)
+# Priorità di ingestione: numeri più bassi escono prima dalla coda
+PRIORITY_USER = 0        # caricato a mano da "Carica disegno"
+PRIORITY_BACKGROUND = 10 # arretrati trovati dal watcher
 
-    def __init__(self, file_path, output_dir):
-        super().__init__()
-        self.file_path = file_path
+def _ingest_process(file_path, output_dir):
+    """ Entry point del processo figlio: un disegno per processo, esito nel codice di uscita """
+    # Il figlio non ha finestre: QtPdf funziona con la piattaforma offscreen
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from ocr_engine import OcrEngine
+    success = OcrEngine().process_drawing(file_path, output_dir)
+    sys.exit(0 if success else 1)
+
+class IngestionScheduler(QObject):
+    """ Coda di elaborazione dei disegni con al massimo max_workers processi contemporanei.
+        Il lavoro di OcrEngine (parsing pypdf, render, OCR) è CPU-bound e legato al GIL: ogni
+        disegno gira in un processo separato, che può essere terminato allo scadere del timeout
+        senza lasciare thread appesi. I fallimenti vengono ritentati fino a `retries` volte.
+    """
+    job_started = Signal(str)
+    job_finished = Signal(str, bool)
+    progress = Signal(int, int, int) # completati, totale, in esecuzione
+
+    POLL_MS = 250
+
+    def __init__(self, output_dir, max_workers=None, timeout=300, retries=1, parent=None):
+        super().__init__(parent)
         self.output_dir = output_dir
-        self.engine = OcrEngine()
+        self.max_workers = max_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.timeout = timeout
+        self.retries = retries
+        
+        # spawn anche su Linux: il figlio non eredita lo stato Qt del processo GUI
+        self._ctx = multiprocessing.get_context('spawn')
+        self._heap = []            # (priorità, progressivo, file_path)
+        self._queued = {}          # file_path -> priorità corrente (voci superate restano nell'heap)
+        self._attempts = {}
+        self._running = {}         # file_path -> (processo, avvio)
+        self._counter = itertools.count()
+        self._done = 0
+        self._total = 0
+        
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.POLL_MS)
+        self._timer.timeout.connect(self._poll)
+
+    def submit(self, file_path, priority=PRIORITY_BACKGROUND):
+        """ Accoda un PDF; se è già in coda ne alza eventualmente la priorità """
+        if file_path in self._running:
+            return
+        if file_path in self._queued:
+            if priority >= self._queued[file_path]:
+                return
+        else:
+            self._total += 1
+        self._queued[file_path] = priority
+        heapq.heappush(self._heap, (priority, next(self._counter), file_path))
+        self._dispatch()
+
+    def reprioritize(self, file_path, priority):
+        """ Alza la priorità di un PDF solo se è ancora in attesa """
+        if file_path in self._queued:
+            self.submit(file_path, priority)
+
+    def cancel(self, file_path):
+        """ Toglie dalla coda un PDF non ancora avviato (es. eliminato dalla cartella) """
+        if self._queued.pop(file_path, None) is not None:
+            self._total -= 1
+            self._emit_progress()
+
+    def is_active(self, file_path):
+        return file_path in self._queued or file_path in self._running
+
+    def pending_count(self):
+        return len(self._queued)
+
+    def running_count(self):
+        return len(self._running)
+
+    def shutdown(self):
+        """ Termina i processi ancora attivi (chiusura dell'applicazione) """
+        self._timer.stop()
+        for proc, _ in self._running.values():
+            if proc.is_alive():
+                proc.terminate()
+        self._running.clear()
+
+    def _dispatch(self):
+        # Back-pressure: mai più di max_workers processi, il resto attende in coda
+        while self._heap and len(self._running) < self.max_workers:
+            priority, _, file_path = heapq.heappop(self._heap)
+            if self._queued.get(file_path) != priority:
+                continue # voce superata da una priorità più alta
+            del self._queued[file_path]
+            
+            proc = self._ctx.Process(target=_ingest_process, args=(file_path, self.output_dir), daemon=True)
+            proc.start()
+            self._running[file_path] = (proc, time.monotonic())
+            self._attempts[file_path] = self._attempts.get(file_path, 0) + 1
+            print(f"[WATCHER] Avviata elaborazione di {os.path.basename(file_path)} (pid {proc.pid})")
+            self.job_started.emit(file_path)
+            
+        if self._running and not self._timer.isActive():
+            self._timer.start()
+        self._emit_progress()
 
     @Slot()
-    def run(self):
-        success = self.engine.process_drawing(self.file_path, self.output_dir)
-        self.finished.emit(self.file_path, success)
+    def _poll(self):
+        now = time.monotonic()
+        for file_path, (proc, started) in list(self._running.items()):
+            if proc.is_alive():
+                if now - started < self.timeout:
+                    continue
+                print(f"[WATCHER] Timeout ({self.timeout}s) per {os.path.basename(file_path)}, processo terminato")
+                proc.terminate()
+                proc.join(5)
+            else:
+                proc.join()
+            
+            del self._running[file_path]
+            success = proc.exitcode == 0
+            if not success and self._attempts[file_path] <= self.retries:
+                print(f"[WATCHER] Nuovo tentativo per {os.path.basename(file_path)}")
+                self._total -= 1 # lo rientra submit()
+                self.submit(file_path, PRIORITY_BACKGROUND)
+                continue
+            
+            self._attempts.pop(file_path, None)
+            self._done += 1
+            self.job_finished.emit(file_path, success)
+            
+        if not self._running:
+            self._timer.stop()
+            # Coda svuotata: il prossimo lotto riparte da 0/N
+            if not self._queued:
+                self._done = self._total = 0
+        self._dispatch()
+
+    def _emit_progress(self):
+        self.progress.emit(self._done, self._total, len(self._running))
 
 class DrawingsWatcher(QObject):
+    """ Tiene uno snapshot dei PDF in cartella (nome -> dimensione, mtime) e a ogni raffica di
+        notifiche confronta solo quello: i file nuovi o modificati vengono accodati quando
+        smettono di cambiare, quelli spariti segnalati, le rinomine riconosciute dall'hash.
+    """
     new_product_ready = Signal(str)
+    product_removed = Signal(str)
+    product_renamed = Signal(str, str)
+    progress = Signal(int, int, int) # completati, totale, in esecuzione
 
-    def __init__(self, drawings_dir='disegni', parent=None):
+    DEBOUNCE_MS = 500  # attesa dopo l'ultima notifica di una raffica
+    STABLE_MS = 1000   # intervallo tra due controlli di dimensione/mtime di un file in arrivo
+
+    def __init__(self, drawings_dir='disegni', max_workers=None, timeout=300, parent=None):
         super().__init__(parent)
         self.drawings_dir = os.path.abspath(drawings_dir)
         if not os.path.exists(self.drawings_dir):
@@ -28,25 +173,147 @@ class DrawingsWatcher(QObject):
         self.watcher = QFileSystemWatcher([self.drawings_dir], self)
         self.watcher.directoryChanged.connect(self.on_directory_changed)
         
-        self.active_threads = []
+        self.scheduler = IngestionScheduler(self.drawings_dir, max_workers, timeout, parent=self)
+        self.scheduler.job_finished.connect(self._on_worker_finished)
+        self.scheduler.progress.connect(self.progress.emit)
         self._processed_files = set()
+        self._failed = {} # file_path -> mtime al momento del fallimento
+        self._snapshot = {} # nome PDF -> (dimensione, mtime_ns) già gestito
+        self._unstable = {} # nome PDF -> (dimensione, mtime_ns) osservato, in attesa che si stabilizzi
+        self._cache = RenderCache(self.drawings_dir) # hash noti, per riconoscere le rinomine
+        
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(self.DEBOUNCE_MS)
+        self._debounce.timeout.connect(self.rescan)
+        self._stability = QTimer(self)
+        self._stability.setSingleShot(True)
+        self._stability.setInterval(self.STABLE_MS)
+        self._stability.timeout.connect(self.rescan)
         
         # Scansione arretrati all'avvio
         self.scan_existing()
 
     def scan_existing(self):
-        for f in os.listdir(self.drawings_dir):
-            if f.lower().endswith('.pdf'):
-                self.check_and_process(os.path.join(self.drawings_dir, f))
+        self._snapshot = self._list_pdfs()
+        for f in self._snapshot:
+            self.check_and_process(os.path.join(self.drawings_dir, f))
 
     def on_directory_changed(self, path):
-        for f in os.listdir(self.drawings_dir):
-            if f.lower().endswith('.pdf'):
-                self.check_and_process(os.path.join(self.drawings_dir, f))
+        # Copie e file generati dai worker producono raffiche di notifiche: un solo confronto a fine raffica
+        self._debounce.start()
 
-    def check_and_process(self, file_path):
+    def _list_pdfs(self):
+        pdfs = {}
+        with os.scandir(self.drawings_dir) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith('.pdf') and entry.is_file():
+                    st = entry.stat()
+                    pdfs[entry.name] = (st.st_size, st.st_mtime_ns)
+        return pdfs
+
+    @Slot()
+    def rescan(self):
+        """ Confronta la cartella con lo snapshot e gestisce solo le differenze """
+        current = self._list_pdfs()
+        # Le raffiche dovute ai file generati dai worker (PNG, JSON, cache) non toccano i PDF
+        if current == self._snapshot:
+            return
+        removed = [name for name in self._snapshot if name not in current]
+        changed = [name for name, sig in current.items() if self._snapshot.get(name) != sig]
+        
+        # Rinomina: stesso (dimensione, mtime) di un file sparito e, se noto, stesso hash.
+        # È atomica, quindi non serve attendere che il file si stabilizzi.
+        added = [n for n in changed if n not in self._snapshot]
+        if added and removed:
+            self._cache.reload()
+        for new_name in added:
+            for old_name in removed:
+                if self._snapshot[old_name] != current[new_name]:
+                    continue
+                old_hash = self._cache.known_hash(old_name)
+                if old_hash and old_hash != self._cache.content_hash(os.path.join(self.drawings_dir, new_name)):
+                    continue
+                self._on_renamed(old_name, new_name)
+                removed.remove(old_name)
+                changed.remove(new_name)
+                del self._snapshot[old_name]
+                self._snapshot[new_name] = current[new_name]
+                break
+        
+        for name in removed:
+            del self._snapshot[name]
+            self._unstable.pop(name, None)
+            file_path = os.path.join(self.drawings_dir, name)
+            self.scheduler.cancel(file_path)
+            self._processed_files.discard(file_path)
+            print(f"[WATCHER] Disegno rimosso: {name}")
+            self.product_removed.emit(os.path.splitext(name)[0])
+        
+        # Un file nuovo o modificato si considera completo quando dimensione e mtime
+        # restano uguali tra due controlli consecutivi (copie lente, salvataggi da rete)
+        for name in changed:
+            if self._unstable.get(name) != current[name]:
+                self._unstable[name] = current[name]
+                continue
+            del self._unstable[name]
+            file_path = os.path.join(self.drawings_dir, name)
+            if name in self._snapshot:
+                print(f"[WATCHER] Disegno modificato: {name}")
+                self._failed.pop(file_path, None)
+                # Il render cache rileva l'hash cambiato; calibrazione e dati esistenti restano
+                if not self.scheduler.is_active(file_path):
+                    self._processed_files.add(file_path)
+                    self.scheduler.submit(file_path)
+            else:
+                self.check_and_process(file_path)
+            self._snapshot[name] = current[name]
+            
+        if self._unstable:
+            self._stability.start()
+
+    def _on_renamed(self, old_name, new_name):
+        old_id, new_id = os.path.splitext(old_name)[0], os.path.splitext(new_name)[0]
+        print(f"[WATCHER] Disegno rinominato: {old_name} -> {new_name}")
+        rename_product_files(self.drawings_dir, old_id, new_id)
+        catalog = CatalogStore(self.drawings_dir)
+        catalog.rename_product(old_id, new_id)
+        catalog.close()
+        self._cache.rename(old_id, new_id)
+        tiles_root = os.path.dirname(pyramid_dir(self.drawings_dir, old_id))
+        if os.path.isdir(tiles_root):
+            tiles_re = re.compile(rf'^{re.escape(old_id)}(?:\.p\d+)?\.tiles$')
+            for page_dir in os.listdir(tiles_root):
+                if tiles_re.match(page_dir):
+                    os.replace(os.path.join(tiles_root, page_dir), os.path.join(tiles_root, new_id + page_dir[len(old_id):]))
+        if os.path.exists(thumbnail_path(self.drawings_dir, old_id)):
+            os.replace(thumbnail_path(self.drawings_dir, old_id), thumbnail_path(self.drawings_dir, new_id))
+        
+        old_path = os.path.join(self.drawings_dir, old_name)
+        if old_path in self._processed_files:
+            # Era ancora in coda o in elaborazione: si riparte col nuovo nome
+            self.scheduler.cancel(old_path)
+            self._processed_files.discard(old_path)
+            self.check_and_process(os.path.join(self.drawings_dir, new_name))
+        self.product_renamed.emit(old_id, new_id)
+
+    def prioritize(self, file_path):
+        """ Porta in testa alla coda un PDF appena caricato dall'utente """
+        file_path = os.path.abspath(file_path)
+        if file_path.lower().endswith('.pdf'):
+            self.check_and_process(file_path, PRIORITY_USER)
+
+    def check_and_process(self, file_path, priority=PRIORITY_BACKGROUND):
         if file_path in self._processed_files:
+            self.scheduler.reprioritize(file_path, priority)
             return
+        if file_path in self._failed:
+            try:
+                if os.path.getmtime(file_path) == self._failed[file_path]:
+                    return
+            except OSError:
+                return
+            del self._failed[file_path]
             
         base_name = os.path.splitext(os.path.basename(file_path))[0]
         coords_path = os.path.join(self.drawings_dir, f"{base_name}.coords.json")
@@ -54,21 +321,7 @@ class DrawingsWatcher(QObject):
         if not os.path.exists(coords_path):
             print(f"[WATCHER] Rilevato file non processato: {base_name}")
             self._processed_files.add(file_path)
-            self._start_worker(file_path)
-
-    def _start_worker(self, file_path):
-        thread = QThread()
-        worker = OcrWorker(file_path, self.drawings_dir)
-        worker.moveToThread(thread)
-        
-        thread.started.connect(worker.run)
-        worker.finished.connect(thread.quit)
-        worker.finished.connect(worker.deleteLater)
-        thread.finished.connect(thread.deleteLater)
-        worker.finished.connect(self._on_worker_finished)
-        
-        self.active_threads.append(thread)
-        thread.start()
+            self.scheduler.submit(file_path, priority)
 
     @Slot(str, bool)
     def _on_worker_finished(self, file_path, success):
@@ -81,6 +334,7 @@ class DrawingsWatcher(QObject):
             # Rimuoviamo dal set così ci riprova in futuro se modificato
             if file_path in self._processed_files:
                 self._processed_files.remove(file_path)
-                
-        # Clean up dead threads
-        self.active_threads = [t for t in self.active_threads if t.isRunning()]
+            try:
+                self._failed[file_path] = os.path.getmtime(file_path)
+            except OSError:
+                pass